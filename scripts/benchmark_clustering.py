@@ -0,0 +1,95 @@
+"""Benchmark the sweep over KMeans clusters vs clusters balanced by problem size (see clustering.py)
+
+run from the scripts folder: python benchmark_clustering.py
+the KMeans baseline needs scikit-learn, which the pipeline no longer uses (pip install scikit-learn)
+"""
+import time
+import resource
+import numpy as np
+import pandas as pd
+from concurrent.futures import ProcessPoolExecutor
+from synthetic import gen_synthetic_data
+from clustering import balanced_clusters, cluster_cost
+from optimization import sweep_clusters
+
+
+def skewed_data(n_demand, n_parking, seed = 0):
+    """synthetic data with half of the parking lots and a third of the demand in a dense downtown"""
+    df_demand, df_parking = gen_synthetic_data(n_demand, n_parking, seed = seed)
+    rng = np.random.RandomState(seed)
+    downtown = (-79.38, 43.65)
+    k_pk, k_dm = n_parking // 2, n_demand // 3
+    df_parking.loc[df_parking.index[:k_pk], 'longitude'] = rng.normal(downtown[0], 0.01, k_pk)
+    df_parking.loc[df_parking.index[:k_pk], 'latitude'] = rng.normal(downtown[1], 0.01, k_pk)
+    df_demand.loc[df_demand.index[:k_dm], 'long'] = rng.normal(downtown[0], 0.01, k_dm)
+    df_demand.loc[df_demand.index[:k_dm], 'lat'] = rng.normal(downtown[1], 0.01, k_dm)
+    return df_demand, df_parking
+
+
+def kmeans_clusters(df_demand, df_parking, n_clusters):
+    """clusters as data_cleaning.py made them before: KMeans of parking lots, demand to the nearest parking lot's cluster"""
+    # imported here, so that the rest of the benchmark runs without scikit-learn
+    from sklearn.cluster import KMeans
+    from sklearn.neighbors import KNeighborsClassifier
+    labels_pk = KMeans(n_clusters = n_clusters, n_init = 10, random_state = 0).fit(df_parking[['latitude', 'longitude']].values).labels_
+    classifier = KNeighborsClassifier(n_neighbors = 1).fit(df_parking[['longitude', 'latitude']].values, labels_pk)
+    return labels_pk, classifier.predict(df_demand[['long', 'lat']].values)
+
+
+def makespan(times, n_workers):
+    """wall time of running jobs of the given times in this order on n_workers workers"""
+    finish = [0.] * n_workers
+    for t in times:
+        finish[finish.index(min(finish))] += t
+    return max(finish)
+
+
+def run_sweep(job):
+    """sweep in a fresh process, so that its peak memory is measured alone"""
+    df_demand, df_parking, list_demand_ratio = job
+    cluster_list = cluster_cost(df_demand, df_parking).index.tolist()
+    start = time.perf_counter()
+    scenario_results = sweep_clusters(cluster_list, df_demand, df_parking, list_demand_ratio, k_nearest = 20)
+    wall_time = time.perf_counter() - start
+    df_status = scenario_results[list_demand_ratio[0]][1]
+    cluster_times = pd.Series((df_status['wall_time'] * len(list_demand_ratio)).values, index = df_status['cluster'])
+    objective = sum(df['objective'].sum() for _, df in scenario_results.values())
+    # max resident memory of this process and of any solver process it started, in MB
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss) / 1024
+    return wall_time, cluster_times, peak, objective
+
+
+def benchmark(n_demand = 200, n_parking = 300, n_clusters = 8, list_demand_ratio = (0.001, 0.002), n_workers = 4):
+    """sweep time, size of the largest cluster and peak memory of both clusterings
+
+    Args
+    -----------
+    n_demand, n_parking: size of the synthetic instance
+    n_clusters: number of clusters of both clusterings
+    list_demand_ratio: demand ratios of the sweep
+    n_workers: number of workers of the parallel wall time estimate
+
+    Returns
+    -----------
+    dataframe with a row per clustering, the parallel wall time is estimated from the cluster times
+    in the order of cluster ids and largest first
+    """
+    df_demand, df_parking = skewed_data(n_demand, n_parking)
+    coords_pk, coords_trip = df_parking[['longitude', 'latitude']].values, df_demand[['long', 'lat']].values
+    records = []
+    for name, labels in [('kmeans', kmeans_clusters(df_demand, df_parking, n_clusters)),
+                         ('balanced', balanced_clusters(coords_pk, coords_trip, n_clusters))]:
+        df_parking['cluster'], df_demand['parking_cluster'] = labels
+        df_cost = cluster_cost(df_demand, df_parking)
+        with ProcessPoolExecutor(max_workers = 1) as executor:
+            wall_time, cluster_times, peak, objective = executor.submit(run_sweep, (df_demand, df_parking, list(list_demand_ratio))).result()
+        records.append({'clustering': name, 'max_pairs': df_cost['n_pairs'].max(), 'total_pairs': df_cost['n_pairs'].sum(),
+                        'sweep_time_s': wall_time, 'peak_memory_mb': peak, 'objective': objective,
+                        'parallel_time_in_order_s': makespan(cluster_times.loc[df_cost.index], n_workers),
+                        'parallel_time_largest_first_s': makespan(cluster_times.loc[df_cost['n_pairs'].sort_values(ascending = False).index], n_workers)})
+        print(records[-1])
+    return pd.DataFrame(records)
+
+
+if __name__ == '__main__':
+    print(benchmark())
@@ -0,0 +1,68 @@
+"""Benchmark the distance engine against scipy's cdist on degrees (what the optimization used before)
+
+run from the scripts folder: python benchmark_distance.py [n_parking n_demand]
+"""
+import os
+import sys
+import time
+import tempfile
+import tracemalloc
+import numpy as np
+import pandas as pd
+from scipy.spatial import distance
+from synthetic import TRT_LAT, TRT_LNG
+from distance_engine import distance_matrix
+
+
+def random_coords(n, seed):
+    rng = np.random.RandomState(seed)
+    return np.column_stack([rng.uniform(TRT_LNG[0], TRT_LNG[1], n), rng.uniform(TRT_LAT[0], TRT_LAT[1], n)])
+
+
+def measure(function, *args, **kwargs):
+    """wall time (seconds) and peak traced memory (MB) of a function"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    wall_time = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return wall_time, peak
+
+
+def benchmark(sizes = ((500, 300), (5000, 2000), (20000, 10000)), memory_budget = 256 * 2 ** 20):
+    """time cdist and every metric of the engine, the output of the engine is written to a memory-mapped file
+
+    Args
+    -----------
+    sizes: list of (number of parking lots, number of demand locations)
+    memory_budget: bytes of temporary arrays of the engine
+
+    Returns
+    -----------
+    dataframe of time and peak memory (output excluded for the engine) of each size and method
+    """
+    records = []
+    for n_parking, n_demand in sizes:
+        coords_pk, coords_trip = random_coords(n_parking, 0), random_coords(n_demand, 1)
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            out = np.lib.format.open_memmap(os.path.join(tmp_dir, 'distance.npy'), mode = 'w+',
+                                            dtype = np.float32, shape = (n_parking, n_demand))
+            methods = [('cdist', lambda: 85 * distance.cdist(coords_pk, coords_trip, 'euclidean'))]
+            methods += [(metric, lambda metric = metric: distance_matrix(coords_pk, coords_trip, metric, memory_budget, out = out))
+                        for metric in ['degree', 'haversine', 'utm']]
+            for name, function in methods:
+                if name == 'cdist' and n_parking * n_demand * 8 > 4 * memory_budget:
+                    continue
+                wall_time, peak = measure(function)
+                records.append({'n_parking': n_parking, 'n_demand': n_demand, 'method': name,
+                                'time_s': wall_time, 'peak_memory_mb': peak})
+                print(records[-1])
+            del out
+    return pd.DataFrame(records)
+
+
+if __name__ == '__main__':
+    sizes = [(int(sys.argv[1]), int(sys.argv[2]))] if len(sys.argv) > 2 else ((500, 300), (5000, 2000), (20000, 10000))
+    df_benchmark = benchmark(sizes)
+    print(df_benchmark.pivot_table(index = ['n_parking', 'n_demand'], columns = 'method', values = ['time_s', 'peak_memory_mb']))
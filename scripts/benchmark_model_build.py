@@ -0,0 +1,72 @@
+"""Benchmark building the cluster facility location model with PuLP loops vs the sparse model builder
+
+run from the scripts folder: python benchmark_model_build.py
+"""
+import os
+import time
+import tempfile
+import tracemalloc
+import pandas as pd
+from synthetic import gen_synthetic_data
+from optimization import gen_sets, gen_parameters, gen_demand, build_pulp_problem
+from model_builder import build_facility_model, write_mps
+
+
+def build_pulp(df_demand, df_parking, demand_ratio):
+    """build the model the way optimize_cls did with PuLP, including writing it for the solver"""
+    demand_lc, chg_lc = gen_sets(0, df_demand, df_parking)
+    fixed_cost, capacity, dic_cost_matrix = gen_parameters(0, df_demand, df_parking)
+    demand = gen_demand(df_demand, demand_ratio)['demand_chg'].to_dict()
+    prob, use_vars = build_pulp_problem(demand_lc, chg_lc, fixed_cost, capacity, dic_cost_matrix, demand)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        prob.writeMPS(os.path.join(tmp_dir, 'model.mps'))
+    return prob
+
+
+def build_sparse(df_demand, df_parking, demand_ratio):
+    """build the model from the cost matrix with the sparse model builder, including writing it for the solver"""
+    fixed_cost, capacity, cost_matrix = gen_parameters(0, df_demand, df_parking, as_dict = False)
+    demand = gen_demand(df_demand, demand_ratio)['demand_chg'].values
+    model = build_facility_model(cost_matrix, fixed_cost, capacity, demand)
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        write_mps(model, os.path.join(tmp_dir, 'model.mps'))
+    return model
+
+
+def measure(build, *args):
+    """wall time (seconds) and peak traced memory (MB) of a build function"""
+    tracemalloc.start()
+    start = time.perf_counter()
+    build(*args)
+    wall_time = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1e6
+    tracemalloc.stop()
+    return wall_time, peak
+
+
+def benchmark(sizes = (10, 25, 50, 100, 200), demand_ratio = 0.02):
+    """compare build time and memory of both builders as the cluster size grows
+    
+    Args
+    -----------
+    sizes: number of demand locations (= number of parking lots) per cluster
+    demand_ratio: demand ratio used to generate demand
+    
+    Returns
+    -----------
+    dataframe of build time and peak memory for each cluster size and builder
+    """
+    records = []
+    for n in sizes:
+        df_demand, df_parking = gen_synthetic_data(n, n)
+        for name, build in [('pulp', build_pulp), ('sparse', build_sparse)]:
+            wall_time, peak = measure(build, df_demand, df_parking, demand_ratio)
+            records.append({'n_demand': n, 'n_parking': n, 'n_pairs': n * n, 'builder': name,
+                            'build_time_s': wall_time, 'peak_memory_mb': peak})
+            print(records[-1])
+    return pd.DataFrame(records)
+
+
+if __name__ == '__main__':
+    df_benchmark = benchmark()
+    print(df_benchmark.pivot(index = 'n_pairs', columns = 'builder', values = ['build_time_s', 'peak_memory_mb']))
@@ -0,0 +1,46 @@
+"""Report of model size, solve time and objective loss of distance-pruned service pairs vs the full model
+
+run from the scripts folder: python benchmark_pruning.py
+"""
+import time
+import pandas as pd
+from synthetic import gen_synthetic_data
+from optimization import optimize_cls
+
+
+def pruning_report(cluster_list, df_demand, df_parking, demand_ratio, radius = None, k_nearest = None):
+    """Solve each cluster with the full and the pruned model and compare them
+    
+    Args
+    -----------
+    cluster_list: list of the cluster ids to optimize over (may contain None for the whole city)
+    df_demand: dataframe of demand for charging
+    df_parking: dataframe of parking lots (candidates for charging stations)
+    demand_ratio: a ratio that equals number of electric cars needs charging divided by number of car trips
+    radius, k_nearest: pruning options passed to optimize_cls
+    
+    Returns
+    -----------
+    dataframe with number of pairs, solve time, objective of both models and relative objective loss per cluster
+    """
+    records = []
+    for cluster_id in cluster_list:
+        record = {'cluster': cluster_id}
+        for name, options in [('full', {}), ('pruned', {'radius': radius, 'k_nearest': k_nearest})]:
+            start = time.perf_counter()
+            opt_location, df_status = optimize_cls(cluster_id, df_demand, df_parking, demand_ratio, **options)
+            record['time_' + name] = time.perf_counter() - start
+            record['status_' + name] = df_status['status'].iloc[0]
+            record['objective_' + name] = df_status['objective'].iloc[0]
+            record['n_arcs_' + name] = df_status['n_arcs'].iloc[0]
+            record['N_chg_' + name] = len(opt_location)
+        records.append(record)
+    df_report = pd.DataFrame(records)
+    df_report['objective_loss'] = df_report['objective_pruned'] / df_report['objective_full'] - 1
+    return df_report
+
+
+if __name__ == '__main__':
+    df_demand, df_parking = gen_synthetic_data(300, 600, n_clusters = 4)
+    df_report = pruning_report([0, 1, 2, 3], df_demand, df_parking, 0.004, k_nearest = 10)
+    print(df_report[['cluster', 'n_arcs_full', 'n_arcs_pruned', 'time_full', 'time_pruned', 'objective_loss']])
@@ -0,0 +1,57 @@
+"""Benchmark the fixed search grid vs the adaptive quadtree grid of data_scraping.py on the local Places stub
+
+run from the scripts folder: python benchmark_scraping.py
+"""
+import tempfile
+import numpy as np
+import pandas as pd
+from places_api import PlacesClient
+from places_stub import gen_places, StubPlaces
+from data_scraping import grid_coords, poi_scrape, quadtree_scrape
+
+
+def skewed_places(n_places, n_downtown, seed = 0):
+    """synthetic places over Toronto, n_downtown of them in a dense downtown"""
+    df_places = gen_places(n_places, seed = seed)
+    rng = np.random.RandomState(seed)
+    df_places.loc[df_places.index[:n_downtown], 'lng'] = rng.normal(-79.38, 0.01, n_downtown)
+    df_places.loc[df_places.index[:n_downtown], 'lat'] = rng.normal(43.65, 0.01, n_downtown)
+    return df_places
+
+
+def dense_grid(factor):
+    """grid_coords with factor times more points along each axis"""
+    lat_list = np.arange(43.582157, 43.792441, 0.025 / factor)
+    lng_list = np.arange(-79.639066, -79.118471, 0.05 / factor)
+    xx, yy = np.meshgrid(lat_list, lng_list)
+    return pd.DataFrame(np.array([xx, yy]).reshape(2, -1).T, columns = ['Lat', 'Lon'])
+
+
+def benchmark(n_places = 3000, n_downtown = 1500):
+    """API calls and coverage of the fixed grid (as is and denser) and of the quadtree
+
+    Returns
+    -----------
+    dataframe with a row per grid: number of calls of each endpoint and fraction of the places found
+    """
+    df_places = skewed_places(n_places, n_downtown)
+    in_bbox = df_places[(df_places['lat'] >= 43.582157) & (df_places['lat'] <= 43.792441) &
+                        (df_places['lng'] >= -79.639066) & (df_places['lng'] <= -79.118471)]
+    runs = [('fixed 3000 m', lambda client, out: poi_scrape(grid_coords(), 'parking', 'bench.xlsx', client = client, output_dir = out)),
+            ('fixed 2x denser 1500 m', lambda client, out: poi_scrape(dense_grid(2), 'parking', 'bench.xlsx', client = client, radius = 1500, output_dir = out)),
+            ('fixed 4x denser 750 m', lambda client, out: poi_scrape(dense_grid(4), 'parking', 'bench.xlsx', client = client, radius = 750, output_dir = out)),
+            ('quadtree', lambda client, out: quadtree_scrape('parking', 'bench.xlsx', client = client, output_dir = out)[0])]
+    records = []
+    for name, run in runs:
+        stub = StubPlaces(df_places)
+        client = PlacesClient('stub', rate = None, fetch = stub, page_token_delay = 0)
+        with tempfile.TemporaryDirectory() as out:
+            df = run(client, out)
+        records.append(dict(stub.calls, grid = name, places_found = len(df),
+                            coverage = in_bbox['place_id'].isin(df['ID']).mean()))
+        print(records[-1])
+    return pd.DataFrame(records).set_index('grid')
+
+
+if __name__ == '__main__':
+    print(benchmark())
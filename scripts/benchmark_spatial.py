@@ -0,0 +1,116 @@
+"""Benchmark the spatial join and trip allocation of data_cleaning.py before and after spatial.py
+
+run from the scripts folder: python benchmark_spatial.py
+"""
+import os
+import time
+import resource
+import tempfile
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+from shapely.geometry import Point
+from synthetic import TRT_LAT, TRT_LNG
+from concurrent.futures import ProcessPoolExecutor
+from spatial import df_to_gdf, read_chunks, allocate_trips
+
+
+def perturbed_grid(n_lat, n_lng, seed = 0):
+    """polygons tiling the Toronto bounding box: a grid of n_lat by n_lng cells with randomly moved vertices"""
+    rng = np.random.RandomState(seed)
+    lat, lng = np.linspace(TRT_LAT[0], TRT_LAT[1], n_lat + 1), np.linspace(TRT_LNG[0], TRT_LNG[1], n_lng + 1)
+    yy, xx = np.meshgrid(lat, lng, indexing = 'ij')
+    # inner vertices move by up to a third of a cell
+    xx[1:-1, 1:-1] += rng.uniform(-1, 1, (n_lat - 1, n_lng - 1)) * (lng[1] - lng[0]) / 3
+    yy[1:-1, 1:-1] += rng.uniform(-1, 1, (n_lat - 1, n_lng - 1)) * (lat[1] - lat[0]) / 3
+    vertices = np.stack([xx, yy], axis = -1)
+    rings = np.stack([vertices[:-1, :-1], vertices[:-1, 1:], vertices[1:, 1:], vertices[1:, :-1], vertices[:-1, :-1]], axis = 2)
+    return shapely.polygons(rings.reshape(-1, 5, 2))
+
+
+def synthetic_layers(n_tracts, n_wards = 44, seed = 0):
+    """geodataframes of census tracts and of wards with morning and afternoon trips"""
+    rng = np.random.RandomState(seed)
+    side = int(np.ceil(np.sqrt(n_tracts / 2.)))
+    tracts = perturbed_grid(side, 2 * side, seed)
+    df_tract = gpd.GeoDataFrame({'CTNAME': ['%07.2f' % (k / 100.) for k in range(len(tracts))],
+                                 'POP06': rng.randint(1000, 8000, len(tracts)),
+                                 'L_AREA': shapely.area(tracts)}, geometry = tracts, crs = 'EPSG:4326')
+    side = int(np.ceil(np.sqrt(n_wards / 2.)))
+    wards = perturbed_grid(side, 2 * side, seed + 1)
+    df_ward = gpd.GeoDataFrame({'ward': ['Ward %d' % (k + 1) for k in range(len(wards))],
+                                'morning trips': rng.randint(5000, 50000, len(wards)).astype(float),
+                                'afternoon trips': rng.randint(5000, 50000, len(wards)).astype(float)},
+                               geometry = wards, crs = 'EPSG:4326')
+    return df_tract, df_ward
+
+
+def legacy_allocation(df_TRT_shp, ward_trip_shp):
+    """census tract trips as data_cleaning.py computed them before: sjoin and even split over the wards of a tract"""
+    CT_trips = gpd.sjoin(df_TRT_shp, ward_trip_shp, how="inner", predicate="intersects")
+    CT_trips['long'] = CT_trips.centroid.x
+    CT_trips['lat'] = CT_trips.centroid.y
+    CT_trips_clean = CT_trips[['CTNAME','POP06', 'L_AREA', 'ward', 'long', 'lat', 'morning trips', 'afternoon trips']].copy()
+    CT_trips_clean['CT_ward_count'] = CT_trips_clean.groupby(['CTNAME'])['CTNAME'].transform('size')
+    CT_trips_clean['CT_ward_weight'] = 1/CT_trips_clean['CT_ward_count']
+    CT_trips_clean['ward_count_weighted']=CT_trips_clean['CT_ward_weight'].groupby(CT_trips_clean['ward']).transform('sum')
+    CT_trips_clean['CT_avg_AM_trips'] = CT_trips_clean['morning trips']/CT_trips_clean['ward_count_weighted']*CT_trips_clean['CT_ward_weight']
+    CT_trips_clean['CT_AM_trips'] = CT_trips_clean['CT_avg_AM_trips'].groupby(CT_trips_clean['CTNAME']).transform('sum')
+    return CT_trips_clean.drop_duplicates(subset = ['CTNAME'])
+
+
+def legacy_df_to_gdf(df):
+    df['coordinates'] = df[['longitude', 'latitude']].values.tolist()
+    df['coordinates'] = df['coordinates'].apply(Point)
+    return gpd.GeoDataFrame(df, geometry = 'coordinates')
+
+
+def run_pipeline(job):
+    """allocation from the files, in a fresh process so that its peak memory is measured alone"""
+    pipeline, tract_path, ward_path, chunk_size = job
+    start = time.perf_counter()
+    df_ward = gpd.read_file(ward_path)
+    if pipeline == 'legacy':
+        trips = legacy_allocation(gpd.read_file(tract_path), df_ward)['CT_AM_trips'].sum()
+    else:
+        trips = allocate_trips(read_chunks(tract_path, chunk_size), df_ward, ['morning trips', 'afternoon trips'],
+                               ['CTNAME', 'POP06', 'L_AREA'])['morning trips'].sum()
+    wall_time = time.perf_counter() - start
+    return wall_time, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, trips
+
+
+def benchmark(list_n_tracts = (1000, 10000, 100000), chunk_size = 20000, n_points = 100000):
+    """time and peak memory of the legacy pipeline and of spatial.py, reading the layers from files
+
+    Returns
+    -----------
+    dataframe with a row per number of census tracts and pipeline: time (s), peak memory (MB) and
+    morning trips allocated, which are the total trips of the wards for both
+    """
+    records = []
+    with tempfile.TemporaryDirectory() as folder:
+        for n_tracts in list_n_tracts:
+            df_tract, df_ward = synthetic_layers(n_tracts)
+            tract_path, ward_path = os.path.join(folder, 'tracts.gpkg'), os.path.join(folder, 'wards.gpkg')
+            df_tract.to_file(tract_path)
+            df_ward.to_file(ward_path)
+            for pipeline in ['legacy', 'spatial']:
+                with ProcessPoolExecutor(max_workers = 1) as executor:
+                    wall_time, peak, trips = executor.submit(run_pipeline, (pipeline, tract_path, ward_path, chunk_size)).result()
+                records.append({'n_tracts': len(df_tract), 'pipeline': pipeline, 'time_s': wall_time, 'peak_memory_mb': peak,
+                                'allocated_trips': trips, 'ward_trips': df_ward['morning trips'].sum()})
+                print(records[-1])
+    df_points = pd.DataFrame({'longitude': np.random.uniform(TRT_LNG[0], TRT_LNG[1], n_points),
+                              'latitude': np.random.uniform(TRT_LAT[0], TRT_LAT[1], n_points)})
+    start = time.perf_counter()
+    legacy_df_to_gdf(df_points.copy())
+    legacy_time = time.perf_counter() - start
+    start = time.perf_counter()
+    df_to_gdf(df_points.copy())
+    print('df_to_gdf of', n_points, 'points:', legacy_time, 's before,', time.perf_counter() - start, 's after')
+    return pd.DataFrame(records)
+
+
+if __name__ == '__main__':
+    print(benchmark())
@@ -0,0 +1,150 @@
+"""Reproducible benchmark of the optimization on synthetic Toronto-sized and 10x instances
+
+Every cluster, scenario and solver backend of a run is appended to a JSON lines metrics log (see instrumentation.py),
+tagged with the run, instance and mode. The summary of a run has a row per solver to compare the
+backends, and the run is compared with a baseline run of the same log to catch regressions of time,
+memory or objective.
+
+run from the scripts folder: python benchmark_suite.py [run name] [baseline run name]
+the instances are toronto unless listed in BENCHMARK_INSTANCES, e.g. BENCHMARK_INSTANCES=toronto,toronto_10x,
+and the solvers cbc unless listed in BENCHMARK_SOLVERS, e.g. BENCHMARK_SOLVERS=cbc,highs (see solvers.py)
+"""
+import os
+import sys
+import time
+import uuid
+import numpy as np
+import pandas as pd
+from synthetic import gen_synthetic_data
+from clustering import balanced_clusters, largest_first
+from optimization import sweep_clusters, solve_clusters
+from instrumentation import write_metrics, read_metrics
+from solvers import OPTIMAL
+
+# instance: (number of demand locations, number of parking lots, number of clusters), Toronto has
+# about 600 census tracts and a few thousand parking lots
+INSTANCES = {'toronto': (600, 2000, 40),
+             'toronto_10x': (6000, 20000, 400)}
+
+# mode: (function, options), both with the service pairs pruned to the nearest stations
+MODES = {'sweep': (sweep_clusters, {'k_nearest': 20}),
+         'solve': (solve_clusters, {'k_nearest': 20})}
+
+# metrics compared with the baseline, an increase of any of them is a regression
+COMPARED = ['wall_time', 'build_time', 'solve_time', 'peak_rss_mb', 'solver_peak_rss_mb', 'objective']
+
+
+def make_instance(name, seed = 0):
+    """synthetic demand and parking lots of an instance, in balanced clusters (see clustering.py)"""
+    n_demand, n_parking, n_clusters = INSTANCES[name]
+    df_demand, df_parking = gen_synthetic_data(n_demand, n_parking, seed = seed)
+    df_parking['cluster'], df_demand['parking_cluster'] = balanced_clusters(df_parking[['longitude', 'latitude']].values,
+                                                                            df_demand[['long', 'lat']].values, n_clusters)
+    return df_demand, df_parking
+
+
+def run_benchmark(run, instances = ('toronto',), modes = ('sweep',), solvers = ('cbc',), list_demand_ratio = (0.005, 0.01), n_workers = 4,
+                  metrics_log = 'benchmark/metrics.jsonl', **options):
+    """Solve every instance in every mode with every solver and append the metrics to the log
+
+    Args
+    -----------
+    run: name of the run, to compare it with other runs of the log
+    instances: keys of INSTANCES
+    modes: keys of MODES, 'sweep' builds each cluster's model once for all ratios, 'solve' once per ratio
+    solvers: solver backends to compare (see solvers.py)
+    list_demand_ratio: demand ratios of the scenarios
+    n_workers: number of worker processes
+    metrics_log: JSON lines file the metrics are appended to
+    options: other solver options of all solves, e.g. time_limit or mip_gap (see optimize_cls)
+
+    Returns
+    -----------
+    summary dataframe of the run (see summarize)
+    """
+    # every line of this run gets the same id, to tell it from other runs of the same name
+    run_id = uuid.uuid4().hex
+    for instance in instances:
+        df_demand, df_parking = make_instance(instance)
+        cluster_list = largest_first(sorted(df_parking['cluster'].unique()), df_demand, df_parking)
+        for mode in modes:
+            for solver in solvers:
+                function, mode_options = MODES[mode]
+                mode_options = dict(mode_options, solver = solver, **options)
+                start = time.perf_counter()
+                if mode == 'sweep':
+                    scenario_results = function(cluster_list, df_demand, df_parking, list(list_demand_ratio), n_workers, **mode_options)
+                else:
+                    scenario_results = dict((demand_ratio, function(cluster_list, df_demand, df_parking, demand_ratio, n_workers, **mode_options))
+                                            for demand_ratio in list_demand_ratio)
+                total_time = time.perf_counter() - start
+                for demand_ratio, (_, df_status) in sorted(scenario_results.items()):
+                    write_metrics(metrics_log, df_status.assign(demand_ratio = demand_ratio), run = run, run_id = run_id,
+                                  instance = instance, mode = mode, n_workers = n_workers, total_time = total_time)
+                print(run, instance, mode, solver, 'done in', round(total_time, 2), 's')
+    return summarize(metrics_log, run)
+
+
+def summarize(metrics_log, run):
+    """totals per instance, mode, solver and demand ratio of a run of the log: time, memory, objective and size
+
+    Returns
+    -----------
+    dataframe indexed by (instance, mode, solver, demand_ratio), with the number of clusters and of optimal ones,
+    the sum over clusters of wall_time, build_time, solve_time, objective, n_vars and nodes, the largest gap,
+    the peak memory of the solvers and of the workers, and the total time of the run of this instance, mode and solver
+    """
+    df = pd.DataFrame([record for record in read_metrics(metrics_log) if record.get('run') == run])
+    if df.empty:
+        raise ValueError('run %s is not in %s' % (run, metrics_log))
+    # the log may have several runs of the same name, keep the last one of each instance, mode and solver
+    # (lines are appended in order; lines logged before runs had ids are told apart by their time)
+    df['run_id'] = df['run_id'].fillna(df['time']) if 'run_id' in df else df['time']
+    df = df[df['run_id'] == df.groupby(['instance', 'mode', 'solver'])['run_id'].transform('last')]
+    grouped = df.groupby(['instance', 'mode', 'solver', 'demand_ratio'])
+    return pd.DataFrame({'clusters': grouped['cluster'].count(),
+                         'optimal': grouped['status'].apply(lambda status: (status == OPTIMAL).sum()),
+                         'wall_time': grouped['wall_time'].sum(), 'build_time': grouped['build_time'].sum(),
+                         'solve_time': grouped['solve_time'].sum(), 'objective': grouped['objective'].sum(),
+                         'n_vars': grouped['n_vars'].sum(), 'nodes': grouped['nodes'].sum(),
+                         'gap': grouped['gap'].max(), 'solver_peak_rss_mb': grouped['solver_peak_rss_mb'].max(),
+                         'peak_rss_mb': grouped['peak_rss_mb'].max(), 'total_time': grouped['total_time'].max()})
+
+
+def compare(metrics_log, run, baseline, tolerance = 0.2, objective_tolerance = 1e-4):
+    """Compare a run with a baseline run of the same log (the same instances, modes and solvers)
+
+    Args
+    -----------
+    metrics_log: JSON lines file of both runs
+    run, baseline: names of the runs
+    tolerance: relative increase of a time or memory metric flagged as a regression
+    objective_tolerance: relative increase of the objective flagged as a regression
+
+    Returns
+    -----------
+    dataframe of the compared metrics of both runs, their relative change and whether it is a regression
+    """
+    df_run, df_baseline = summarize(metrics_log, run), summarize(metrics_log, baseline)
+    records = []
+    for key in df_run.index.intersection(df_baseline.index):
+        for metric in COMPARED:
+            new, old = df_run.loc[key, metric], df_baseline.loc[key, metric]
+            change = (new - old) / abs(old) if old else np.nan
+            limit = objective_tolerance if metric == 'objective' else tolerance
+            records.append({'instance': key[0], 'mode': key[1], 'solver': key[2], 'demand_ratio': key[3], 'metric': metric,
+                            'baseline': old, 'run': new, 'change': change,
+                            'regression': bool(change > limit)})
+    return pd.DataFrame(records)
+
+
+if __name__ == '__main__':
+    run = sys.argv[1] if len(sys.argv) > 1 else time.strftime('%Y%m%d-%H%M%S')
+    instances = os.environ.get('BENCHMARK_INSTANCES', 'toronto').split(',')
+    solvers = os.environ.get('BENCHMARK_SOLVERS', 'cbc').split(',')
+    print(run_benchmark(run, instances, modes = ('sweep', 'solve'), solvers = solvers))
+    if len(sys.argv) > 2:
+        df_compare = compare('benchmark/metrics.jsonl', run, sys.argv[2])
+        print(df_compare)
+        print('regressions:')
+        print(df_compare[df_compare['regression']])
@@ -0,0 +1,66 @@
+import numpy as np
+from scipy.spatial import cKDTree
+
+
+def nearest_arcs(coords_pk, coords_trip, radius = None, k_nearest = None, capacity = None, demand = None):
+    """Generate the service arcs (demand location, charging station) worth creating in the model:
+    only stations within a radius and/or the k nearest stations of each demand location
+
+    To keep the model feasible, every demand location is given more of its nearest stations
+    until it has at least one and their total capacity covers its demand.
+
+    Args
+    -----------
+    coords_pk: array (n_chg, 2) of coordinates of charging station candidates
+    coords_trip: array (n_demand, 2) of coordinates of demand locations
+    radius: only create arcs to stations within this distance (in coordinate units)
+    k_nearest: create arcs to the k nearest stations
+    capacity: array (n_chg,) of capacity of each station, used for the feasibility fallback
+    demand: array (n_demand,) of demand at each location, used for the feasibility fallback
+
+    Returns
+    -----------
+    arc_i, arc_j: arrays of positions of the demand location and the station of each arc, sorted by demand location
+    """
+    coords_pk = np.asarray(coords_pk, dtype = float)
+    coords_trip = np.asarray(coords_trip, dtype = float)
+    n_chg, n_demand = len(coords_pk), len(coords_trip)
+    tree = cKDTree(coords_pk)
+    candidates = [set() for i in range(n_demand)]
+    if radius is not None:
+        for i, js in enumerate(tree.query_ball_point(coords_trip, r = radius)):
+            candidates[i].update(js)
+    if k_nearest is not None:
+        k = min(k_nearest, n_chg)
+        _, idx = tree.query(coords_trip, k = k)
+        for i, js in enumerate(np.asarray(idx).reshape(n_demand, k)):
+            candidates[i].update(js)
+
+    # fallback: add nearest stations until each location could be served on its own
+    if capacity is None:
+        capacity = np.ones(n_chg)
+    if demand is None:
+        demand = np.zeros(n_demand)
+    capacity = np.asarray(capacity, dtype = float)
+    demand = np.asarray(demand, dtype = float)
+    covered = np.array([capacity[list(js)].sum() >= max(d, 1e-9) for js, d in zip(candidates, demand)], dtype = bool)
+    k = 1
+    while not covered.all() and k < 2 * n_chg:
+        lacking = np.flatnonzero(~covered)
+        k = min(max(k, max(len(candidates[i]) for i in lacking)) * 2, n_chg)
+        _, idx = tree.query(coords_trip[lacking], k = k)
+        idx = np.asarray(idx).reshape(len(lacking), k)
+        for i, js in zip(lacking, idx):
+            # take stations in order of distance until the demand is covered
+            cum_capacity = capacity[list(candidates[i])].sum()
+            for j in js:
+                if cum_capacity >= max(demand[i], 1e-9):
+                    break
+                if j not in candidates[i]:
+                    candidates[i].add(j)
+                    cum_capacity += capacity[j]
+            covered[i] = cum_capacity >= max(demand[i], 1e-9) or len(candidates[i]) == n_chg
+
+    arc_i = np.repeat(np.arange(n_demand), [len(js) for js in candidates])
+    arc_j = np.concatenate([np.sort(list(js)) for js in candidates]).astype(int) if n_demand else np.zeros(0, dtype = int)
+    return arc_i, arc_j
@@ -0,0 +1,96 @@
+import heapq
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from distance_engine import local_km
+
+# Partition of parking lots (and the demand locations nearest to them) into clusters of similar problem size,
+# by recursive bisection: the largest cluster is cut in two along its wider side, at the position that
+# balances the size of both halves, until there are enough clusters and none is larger than a maximum.
+# The size of a cluster is its number of candidates times its number of demand locations (pairs of the model).
+
+
+def bisect(x, demand_count):
+    """position in the order of x that cuts a cluster into the two halves of most similar size"""
+    order = np.argsort(x, kind = 'mergesort')
+    n = len(x)
+    k = np.arange(1, n)
+    demand_left = np.cumsum(demand_count[order])[:-1]
+    demand_right = demand_count.sum() - demand_left
+    sizes = np.maximum(k * demand_left, (n - k) * demand_right)
+    return order, int(k[np.argmin(sizes)])
+
+
+def balanced_clusters(coords_pk, coords_trip, n_clusters = 40, max_size = None):
+    """Cluster parking lots into clusters of similar size, each demand location going with its nearest parking lot
+
+    Args
+    -----------
+    coords_pk: array (n_parking, 2) of (longitude, latitude) of parking lots
+    coords_trip: array (n_demand, 2) of (longitude, latitude) of demand locations
+    n_clusters: minimum number of clusters
+    max_size: maximum number of (parking lot, demand location) pairs of a cluster (no maximum if None),
+              clusters of a single parking lot are not split further
+
+    Returns
+    -----------
+    labels_pk: array (n_parking,) of the cluster of each parking lot
+    labels_trip: array (n_demand,) of the cluster of each demand location
+    """
+    lat0 = np.mean(np.asarray(coords_pk, dtype = float)[:, 1])
+    xy_pk, xy_trip = local_km(coords_pk, lat0), local_km(coords_trip, lat0)
+    nearest = cKDTree(xy_pk).query(xy_trip)[1]
+    demand_count = np.bincount(nearest, minlength = len(xy_pk)).astype(float)
+
+    def size(members):
+        return len(members) * demand_count[members].sum()
+
+    # heap of (-size, id, members), so that the largest cluster is split first
+    heap = [(-size(np.arange(len(xy_pk))), 0, np.arange(len(xy_pk)))]
+    unsplittable = []
+    next_id = 1
+    while heap:
+        neg_size, _, members = heap[0]
+        if len(heap) + len(unsplittable) >= n_clusters and (max_size is None or -neg_size <= max_size):
+            break
+        heapq.heappop(heap)
+        if len(members) < 2:
+            unsplittable.append(members)
+            continue
+        xy = xy_pk[members]
+        axis = np.argmax(xy.max(axis = 0) - xy.min(axis = 0))
+        order, k = bisect(xy[:, axis], demand_count[members])
+        for half in [members[order[:k]], members[order[k:]]]:
+            heapq.heappush(heap, (-size(half), next_id, half))
+            next_id += 1
+    # number the clusters from west to east
+    clusters = sorted(unsplittable + [members for _, _, members in heap], key = lambda members: xy_pk[members, 0].mean())
+    labels_pk = np.empty(len(xy_pk), dtype = int)
+    for label, members in enumerate(clusters):
+        labels_pk[members] = label
+    return labels_pk, labels_pk[nearest]
+
+
+def cluster_cost(df_demand, df_parking):
+    """Estimated solve cost of every cluster, its number of (parking lot, demand location) pairs
+
+    Args
+    -----------
+    df_demand: dataframe of demand for charging, with column parking_cluster
+    df_parking: dataframe of parking lots, with column cluster
+
+    Returns
+    -----------
+    dataframe of number of parking lots, demand locations and pairs of each cluster
+    """
+    df_cost = pd.DataFrame({'n_parking': df_parking.groupby('cluster').size(),
+                            'n_demand': df_demand.groupby('parking_cluster').size()}).fillna(0).astype(int)
+    df_cost['n_pairs'] = df_cost['n_parking'] * df_cost['n_demand']
+    df_cost.index.name = 'cluster'
+    return df_cost
+
+
+def largest_first(cluster_list, df_demand, df_parking):
+    """cluster_list ordered by decreasing estimated solve cost, to start the longest solves first"""
+    n_pairs = cluster_cost(df_demand, df_parking)['n_pairs']
+    return sorted(cluster_list, key = lambda cluster_id: -n_pairs.get(cluster_id, 0))
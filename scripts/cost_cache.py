@@ -0,0 +1,124 @@
+import os
+import uuid
+import hashlib
+import numpy as np
+from distance_engine import distance_matrix, metric_name
+
+
+def coords_hash(coords, metric = 'haversine'):
+    """content hash of an array of coordinates (rounded to about 1 cm, so that file round trips do not change it)
+    and of the distance metric"""
+    coords = np.ascontiguousarray(np.round(np.asarray(coords, dtype = float).reshape(-1, 2), 7))
+    return hashlib.sha1(coords.tobytes() + metric_name(metric).encode()).hexdigest()
+
+
+class DistanceCache(object):
+    """Cache of distance matrices of charging station candidates to demand locations, shared by
+    data_cleaning.py, optimization.py and later analysis
+
+    There is one block per set of demand locations (keyed by a content hash of their coordinates), stored as
+    a float32 .npy file with one row per parking lot, memory-mapped when read. Rows are matched to parking
+    lots by coordinates, so when parking lots are added only their rows are computed and appended;
+    rows of removed parking lots are ignored (and dropped by compact).
+
+    Each save of a block writes a new version of its rows and coordinates, then points the block's
+    'current' file to it with one rename, so that readers (e.g. the webapp and its background solves)
+    always load rows and coordinates of the same version.
+
+    Args
+    -----------
+    cache_dir: folder of the cache
+    metric: distance metric (see distance_engine.py), blocks of different metrics are kept apart
+    memory_budget: bytes of temporary arrays when computing rows (see distance_engine.distance_matrix)
+    """
+
+    def __init__(self, cache_dir, metric = 'haversine', memory_budget = 256 * 2 ** 20):
+        self.cache_dir = cache_dir
+        self.metric = metric
+        self.memory_budget = memory_budget
+        self.indexes = {}
+
+    def block_dir(self, coords_trip):
+        return os.path.join(self.cache_dir, coords_hash(coords_trip, self.metric))
+
+    def load_block(self, block, retries = 5):
+        """memory-mapped rows and coordinates of the current version of a block, and a dictionary of coordinates: row"""
+        current_path = os.path.join(block, 'current')
+        for attempt in range(retries):
+            if not os.path.exists(current_path):
+                return None, np.zeros((0, 2)), {}
+            with open(current_path) as f:
+                version = f.read().strip()
+            try:
+                rows = np.load(os.path.join(block, 'rows.%s.npy' % version), mmap_mode = 'r')
+                coords = np.load(os.path.join(block, 'coords.%s.npy' % version))
+                break
+            except (IOError, OSError):
+                # a newer version was saved and this one removed while reading, read the newer one
+                if attempt == retries - 1:
+                    raise
+        if self.indexes.get(block, (None,))[0] != version:
+            self.indexes[block] = version, dict((tuple(c), k) for k, c in enumerate(np.round(coords, 7)))
+        return rows, coords, self.indexes[block][1]
+
+    def save_block(self, block, rows, coords):
+        if not os.path.exists(block):
+            os.makedirs(block)
+        version = uuid.uuid4().hex
+        for name, array in [('coords', coords), ('rows', rows)]:
+            np.save(os.path.join(block, '%s.%s.npy' % (name, version)), array)
+        current_path = os.path.join(block, 'current')
+        previous = None
+        if os.path.exists(current_path):
+            with open(current_path) as f:
+                previous = f.read().strip()
+        # switch to the new version at once, readers never see rows and coordinates of different versions
+        tmp_path = os.path.join(block, 'current.%s.tmp' % version)
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+        os.replace(tmp_path, current_path)
+        if previous is not None and previous != version:
+            for name in ['coords', 'rows']:
+                try:
+                    os.remove(os.path.join(block, '%s.%s.npy' % (name, previous)))
+                except OSError:
+                    # already removed by another writer, or still open by a reader on some platforms
+                    pass
+
+    def get(self, coords_pk, coords_trip):
+        """Distance matrix (km) of charging station candidates to demand locations, computing only missing rows
+
+        Args
+        -----------
+        coords_pk: array (n_chg, 2) of (longitude, latitude) of charging station candidates
+        coords_trip: array (n_demand, 2) of (longitude, latitude) of demand locations
+
+        Returns
+        -----------
+        float32 array (n_chg, n_demand)
+        """
+        coords_pk = np.asarray(coords_pk, dtype = float).reshape(-1, 2)
+        coords_trip = np.asarray(coords_trip, dtype = float).reshape(-1, 2)
+        block = self.block_dir(coords_trip)
+        rows, coords, index = self.load_block(block)
+        keys = [tuple(c) for c in np.round(coords_pk, 7)]
+        missing = [k for k, key in enumerate(keys) if key not in index]
+        if missing:
+            # drop duplicates so that each new parking lot gets one row
+            new_keys = dict((keys[k], k) for k in missing)
+            new_coords = coords_pk[list(new_keys.values())]
+            new_rows = distance_matrix(new_coords, coords_trip, self.metric, self.memory_budget)
+            rows = new_rows if rows is None else np.concatenate([rows, new_rows])
+            coords = np.concatenate([coords, new_coords])
+            self.save_block(block, rows, coords)
+            rows, coords, index = self.load_block(block)
+        return np.asarray(rows[[index[key] for key in keys]]).reshape(len(keys), len(coords_trip))
+
+    def compact(self, coords_pk, coords_trip):
+        """drop the rows of a block that are not for any of coords_pk (e.g. removed parking lots)"""
+        coords_pk = np.asarray(coords_pk, dtype = float).reshape(-1, 2)
+        block = self.block_dir(coords_trip)
+        rows, coords, index = self.load_block(block)
+        keep = sorted(set(index[key] for key in (tuple(c) for c in np.round(coords_pk, 7)) if key in index))
+        if rows is not None and len(keep) < len(coords):
+            self.save_block(block, np.asarray(rows[keep]), coords[keep])
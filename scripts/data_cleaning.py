@@ -1,14 +1,20 @@
 import pandas as pd
 import geopandas as gpd
-from sklearn.cluster import KMeans
-from sklearn.neighbors import KNeighborsClassifier
-from scipy.spatial import distance
-from shapely.geometry import Point
+from spatial import df_to_gdf, read_chunks, allocate_trips
+from cost_cache import DistanceCache
+from clustering import balanced_clusters
+from storage import ArtifactStore, file_hash, DEMAND_ARTIFACT, PARKING_ARTIFACT
 
 import os
 file_dir = os.path.dirname(os.path.abspath('__file__'))
 os.chdir(file_dir)
 
+# intermediate datasets are stored as Parquet tables with schema and content hash sidecars (see storage.py),
+# stages whose inputs did not change are skipped; set export_excel to also write Excel files
+export_excel = False
+processed = ArtifactStore('data/processed')
+cleaned = ArtifactStore('data/cleaned')
+
 # Read trip data from Toronto's Transportation Survey 2016
 df = pd.read_excel('data/raw/tts2016_ward_Toronto.xlsx')
 df_trip = df[df.variable.str.contains('Number of trips made to the area as auto driver during ')].copy()
@@ -16,41 +22,35 @@ df_trip['time_of_day'] = ['morning', 'afternoon']
 df_trip = df_trip.drop('variable', axis = 1).transpose()
 df_trip['ward'] = df_trip.index
 df_trip.columns = ['morning trips', 'afternoon trips', 'ward']
-df_trip.to_excel('data/processed/trip_to_wards.xlsx', index=False)
+processed.write('trip_to_wards', df_trip, excel = export_excel)
 
 # draw map to visualize number of trips to each ward
 shp_path = 'data/raw/Toronto_wards/icitw_wgs84.shp'
 df_ward = gpd.read_file(shp_path)
+# the ward shapefile is an input of the tract and cluster stages (shp_path is reused below)
+ward_hash = file_hash(shp_path)
 df_ward['SCODE_NAME']=df_ward['SCODE_NAME'].astype(int)
 df_ward['ward'] = 'Ward '+ df_ward['SCODE_NAME'].astype(str)
 ward_trip_shp = df_ward.merge(df_trip, how='left')
 ward_trip_shp.plot(figsize=(10,10), column = 'morning trips',cmap='OrRd')
 
 # combine with census tract shapefiles
+# the trips of each ward are allocated to the census tracts intersecting it by area of intersection (see spatial.py),
+# tracts are read in chunks so that region-wide tract or parcel files do not have to fit in memory
 shp_path2 ='data/raw/Toronto_shp/Toronto_CMA_01_popn_age_sex_marital.shp'
-df_TRT_shp = gpd.read_file(shp_path2)
-ward_trip_shp.crs = {'init' :'epsg:4326'}
-df_TRT_shp.crs == ward_trip_shp.crs
-ward_trip_shp = ward_trip_shp.to_crs(df_TRT_shp.crs)
-CT_trips = gpd.sjoin(df_TRT_shp, ward_trip_shp, how="inner", op="intersects")
-# get the CTs' centroids
-CT_trips['centroid'] = CT_trips['geometry'].centroid
-CT_trips['long']=CT_trips.centroid.x
-CT_trips['lat']=CT_trips.centroid.y
-
-CT_trips_clean = CT_trips[['CTNAME','POP06', 'L_AREA', 'ward', 'long', 'lat', 'morning trips', 'afternoon trips']].copy()
-CT_trips_clean.loc[CT_trips_clean['morning trips'].isnull(),'morning trips'] = 0
-CT_trips_clean.loc[CT_trips_clean['afternoon trips'].isnull(),'afternoon trips'] = 0
-
-# evenly distribute Census Tracts to different wards if they intersect with various wards
-CT_trips_clean['CT_ward_count'] = CT_trips_clean.groupby(['CTNAME'])['CTNAME'].transform('size')
-CT_trips_clean['CT_ward_weight'] = 1/CT_trips_clean['CT_ward_count']
-CT_trips_clean['ward_count_weighted']=CT_trips_clean['CT_ward_weight'].groupby(CT_trips_clean['ward']).transform('sum')
-CT_trips_clean['CT_avg_AM_trips'] = CT_trips_clean['morning trips']/CT_trips_clean['ward_count_weighted']*CT_trips_clean['CT_ward_weight']
-CT_trips_clean['CT_AM_trips'] = CT_trips_clean['CT_avg_AM_trips'].groupby(CT_trips_clean['CTNAME']).transform('sum')
-CT_trips_clean=CT_trips_clean.drop_duplicates(subset = ['CTNAME'])
-# each row represents a census tract, the info of "# trips in the ward that this CT belongs to" is added
-CT_trips_clean = CT_trips_clean[['CTNAME', 'POP06', 'L_AREA', 'ward', 'long', 'lat', 'CT_AM_trips']]
+tract_columns = ['CTNAME', 'POP06', 'L_AREA', 'ward', 'long', 'lat', 'CT_AM_trips', 'CT_PM_trips']
+tract_inputs = {'trips': processed.content_hash('trip_to_wards'), 'wards': ward_hash, 'tracts': file_hash(shp_path2),
+                'columns': tract_columns}
+if processed.is_fresh('CT_trips', tract_inputs):
+    CT_trips_clean = processed.read('CT_trips')
+else:
+    ward_trip_shp.crs = 'EPSG:4326'
+    CT_trips_clean = allocate_trips(read_chunks(shp_path2), ward_trip_shp, ['morning trips', 'afternoon trips'], ['CTNAME','POP06', 'L_AREA'])
+    # each row represents a census tract, with the trips allocated to it from the wards it intersects
+    # morning trips are the demand of the model, afternoon trips the second period of its AM/PM variant (see model_variants.py)
+    CT_trips_clean = CT_trips_clean.rename(columns = {'morning trips': 'CT_AM_trips', 'afternoon trips': 'CT_PM_trips'})
+    CT_trips_clean = CT_trips_clean[tract_columns]
+    processed.write('CT_trips', CT_trips_clean, inputs = tract_inputs, excel = export_excel)
 
 # merge with count of charging stations
 shp_path = 'data/processed/shape_join_points.shp'
@@ -58,66 +58,61 @@ df_TRT_shp = gpd.read_file(shp_path)
 df_TRT_shp = df_TRT_shp[['CTNAME','charging s']]
 CT_trips_pts = pd.merge(df_TRT_shp, CT_trips_clean, on = 'CTNAME')
 CT_trips_pts = CT_trips_pts.set_index('CTNAME')
-CT_trips_pts.to_excel('data/cleaned/optimization_CT_AM_trips_chgstn.xlsx')
+cleaned.write('optimization_CT_AM_trips_chgstn', CT_trips_pts, excel = export_excel)
 
 
 
 # Locations of parking lots
-df_parking = pd.read_excel('data/raw/TRT_parking_lots_2.xlsx')
-def df_to_gdf(df):
-    """takes a dataframe with columns named 'longitude' and 'latitude' 
-    to transform to a geodataframe with point features"""
-    
-    df['coordinates'] = df[['longitude', 'latitude']].values.tolist()
-    df['coordinates'] = df['coordinates'].apply(Point)
-    df = gpd.GeoDataFrame(df, geometry = 'coordinates')
-    return df
+parking_path = 'data/raw/TRT_parking_lots_2.xlsx'
+df_parking = pd.read_excel(parking_path)
 gdf_parking = df_to_gdf(df_parking)
 
 # spacial join with ward's shapefile
-gdf_parking.crs = {'init' :'epsg:4326'}
-gdf_parking.crs == df_ward.crs
-parking_ward = gpd.sjoin(gdf_parking, df_ward, how="inner", op="within")
+parking_ward = gpd.sjoin(gdf_parking, df_ward, how="inner", predicate="within")
 parking_ward_hr = parking_ward[parking_ward['Rating']>0][['latitude','longitude','Rating','Name','Url','ID','ward']].copy()
 parking_ward_hr = parking_ward_hr.set_index('ID')
-parking_ward_hr.to_excel('data/cleaned/optimization_parking_location.xlsx')
+cleaned.write('optimization_parking_location', parking_ward_hr, excel = export_excel)
 
 # cluster the parking lots (to break down the problem for faster optimization)
-gdf_parking = gdf_parking.reset_index()
-gdf_parking2 = gdf_parking[['latitude','longitude']]
-gdf_parking2 = gdf_parking2[['latitude','longitude']]
-
-# Scaling the data to normalize
-model = KMeans(n_clusters=40).fit(gdf_parking2)
-x = gdf_parking2.latitude
-y = gdf_parking2.longitude
-
-gdf_parking2['cluster'] = model.labels_
-gdf_parking3 = pd.merge(gdf_parking, gdf_parking2).drop_duplicates(subset=['latitude','longitude'])
-df_parking_cluster = gdf_parking3[['latitude','longitude','Rating','Name','Url','ID','ward','cluster']].copy()
-df_parking_cluster.to_excel('data/cleaned/optimization_parking_location_cluster.xlsx')
-
-
-# assign trip destination points to nearest parking lots' cluster
-classifier = KNeighborsClassifier(n_neighbors=1)
-classifier.fit(gdf_parking3[['longitude','latitude']], gdf_parking3['cluster'])
-CT_trips_pts['parking_cluster'] = classifier.predict(CT_trips_pts[['long','lat']])
-CT_trips_pts.to_excel('data/cleaned/optimization_CT_AM_trips_cluster.xlsx')
+# into clusters of similar problem size (number of parking lots x number of trip destinations, see clustering.py),
+# trip destination points going with the cluster of their nearest parking lot
+n_clusters = 40
+max_cluster_size = None # maximum number of (parking lot, destination) pairs of a cluster, if any
+# (kept as they are if the demand, the parking lots and the parameters did not change, so that cached distances are reused)
+cluster_inputs = {'demand': cleaned.content_hash('optimization_CT_AM_trips_chgstn'), 'parking': file_hash(parking_path), 'wards': ward_hash,
+                  'n_clusters': n_clusters, 'max_cluster_size': max_cluster_size}
+if cleaned.is_fresh(PARKING_ARTIFACT, cluster_inputs) and cleaned.is_fresh(DEMAND_ARTIFACT, cluster_inputs):
+    df_parking_cluster = cleaned.read(PARKING_ARTIFACT)
+    CT_trips_pts = cleaned.read(DEMAND_ARTIFACT).set_index('CTNAME')
+else:
+    gdf_parking = gdf_parking.reset_index()
+    gdf_parking3 = gdf_parking.drop_duplicates(subset=['latitude','longitude']).copy()
+    labels_pk, labels_trip = balanced_clusters(gdf_parking3[['longitude','latitude']].values, CT_trips_pts[['long','lat']].values,
+                                               n_clusters, max_cluster_size)
+    gdf_parking3['cluster'] = labels_pk
+    df_parking_cluster = gdf_parking3[['latitude','longitude','Rating','Name','Url','ID','ward','cluster']].copy()
+    cleaned.write(PARKING_ARTIFACT, df_parking_cluster, inputs = cluster_inputs, excel = export_excel)
+
+    # assign trip destination points to nearest parking lots' cluster
+    CT_trips_pts['parking_cluster'] = labels_trip
+    cleaned.write(DEMAND_ARTIFACT, CT_trips_pts, inputs = cluster_inputs, excel = export_excel)
 
 # create distance matrix of parking lots to destination points
-
-cluster_list = [i for i in range(40)]
+# the matrices are cached (see cost_cache.py) and read from the cache by optimization.py,
+# only parking lots not in the cache yet are computed (also written to Excel files if export_excel is set)
+# distances are great circle distances in km (see distance_engine.py for the other metrics)
+cache = DistanceCache('data/cache/distance', metric = 'haversine')
+cluster_list = sorted(df_parking_cluster['cluster'].unique())
 for cluster_id in cluster_list:
-    df_chg = gdf_parking3.loc[gdf_parking3['cluster']==cluster_id]
+    df_chg = df_parking_cluster.loc[df_parking_cluster['cluster']==cluster_id]
     coords_pk = [(x,y) for x,y in zip(df_chg['longitude'],df_chg['latitude'])]
     df_demand = CT_trips_pts.loc[CT_trips_pts['parking_cluster']==cluster_id]
     coords_trip = [(x,y) for x,y in zip(df_demand['long'],df_demand['lat'])]
 
-    distance_matrix = distance.cdist(coords_pk, coords_trip, 'euclidean')
-    transfer_ratio = 85 # roughly transfer distance to km
-    distance_matrix2 = transfer_ratio*distance_matrix
-    df_distance = pd.DataFrame(distance_matrix2, index = df_chg.ID.tolist() ,columns = df_demand.index.tolist())
-    # print (df_distance.shape)
-    df_distance.to_excel('data/cleaned/distance_mtx_cluster'+str(cluster_id)+'.xlsx')
-
-
+    distance_matrix2 = cache.get(coords_pk, coords_trip)
+    # drop rows of parking lots that are no longer candidates
+    cache.compact(coords_pk, coords_trip)
+    if export_excel:
+        df_distance = pd.DataFrame(distance_matrix2, index = df_chg.ID.tolist() ,columns = df_demand.index.tolist())
+        # print (df_distance.shape)
+        df_distance.to_excel('data/cleaned/distance_mtx_cluster'+str(cluster_id)+'.xlsx')
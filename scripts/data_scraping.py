@@ -1,100 +1,353 @@
-from googleplaces import GooglePlaces
+import csv
 import pandas as pd
 import numpy as np
 import os
-file_dir = os.path.dirname(os.path.abspath('__file__'))
-os.chdir(file_dir)
-# read my Google API
-API_path = os.path.join(file_dir, "..")
-my_API_key = open(API_path+'/'+"GoogleAPIKey.txt", "r").read()
-
-google_places = GooglePlaces(my_API_key)
-def googleplaces_query_to_dataframe (lng, lat, keyword, radius, *place_type):
-    """Transform query results from Google API to pandas dataframe
-    
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+import threading
+from places_api import PlacesClient
+from distance_engine import haversine_distance
+
+# columns of the scraped places
+OUTPUT_COLUMNS = ['ID', 'Name', 'latitude', 'longitude', 'Rating', 'Url']
+# bounding box (lat_min, lng_min, lat_max, lng_max) of the search in Toronto
+TRT_BBOX = (43.582157, -79.639066, 43.792441, -79.118471)
+# a nearby search returns at most 60 results (3 pages of 20)
+MAX_RESULTS = 60
+
+
+def place_row(client, result):
+    """row of a place found by a nearby search, with the url from its details"""
+    details = client.details(result['place_id']).get('result', {})
+    location = result['geometry']['location']
+    return [result['place_id'], result.get('name'), float(location['lat']), float(location['lng']),
+            result.get('rating'), details.get('url')]
+
+
+def search_cell(client, lng, lat, keyword, radius, place_type):
+    """Query all pages of a nearby search (up to 60 results)
+
+    Returns
+    ------------
+    list of the results (raw, as returned by the web service)
+    """
+    for refresh in [False, True]:
+        results = []
+        page_token = None
+        #default query only returns the first 20, up to 2 more pages follow
+        while True:
+            response = client.nearby_search(lat, lng, keyword, radius, place_type, page_token, refresh = refresh)
+            if response.get('status') not in ('OK', 'ZERO_RESULTS'):
+                break
+            results += response.get('results', [])
+            page_token = response.get('next_page_token')
+            if not page_token:
+                return results
+        # the page tokens of a cached first page may have expired, query the cell again
+    raise RuntimeError('nearby search at %s, %s failed: %s' % (lat, lng, response.get('status')))
+
+
+def query_cell(client, lng, lat, keyword, radius, place_type, details_executor):
+    """Query all pages of a nearby search and the details of every place found
+
     Args
     ------------
+    client: PlacesClient
     lng: longitude of the searching point
     lat: latitude of the searching point
     keyword: keyword to search for, e.g., parking lot, charging station, etc.
     radius: radius of the search range
-    place_type: type of the place
-    
+    place_type: type of the place (or None)
+    details_executor: thread pool to look up the details in
+
     Returns
     ------------
-    dataframe of searching result
+    list of rows of the places found (columns OUTPUT_COLUMNS)
     """
-    places_data_list = []
-    query_result = google_places.nearby_search(
-    lat_lng={'lat': lat, 'lng': lng}, keyword=keyword,
-    radius=radius)    
-#    query_result = google_places.nearby_search(
-#    lat_lng={'lat': lat, 'lng': lng}, keyword=keyword,
-#    radius=radius, rankby = 'distance')
-    for place in query_result.places: 
-        place.get_details()
-        places_data_list.append([place.place_id, place.name, float(place.geo_location['lat']),float(place.geo_location['lng']), place.rating, place.url])
-    #default query only returns the first 20
-    while query_result.has_next_page_token :
-        query_result= google_places.nearby_search(pagetoken=query_result.next_page_token)
-        for place in query_result.places:
-            place.get_details()
-            places_data_list.append([place.place_id, place.name, float(place.geo_location['lat']),float(place.geo_location['lng']), place.rating, place.url])
-    df = pd.DataFrame(places_data_list, columns = ['ID','Name', 'latitude', 'longitude', 'Rating', 'Url'])
-    return df
+    results = search_cell(client, lng, lat, keyword, radius, place_type)
+    return list(details_executor.map(lambda result: place_row(client, result), results))
+
 # Google place ranks by prominanse and shows up to 60 results
 # If only search nearby one coordinate, can not get all data
 # therefore will search over a grid of coordinates with reasonable distance away from each other and then delete the repeated ones
 
-# create coordinates grid to search for
-lat_list = np.arange(43.582157, 43.792441, 0.025)
-lng_list = np.arange(-79.639066, -79.118471,0.05)
-xx,yy = np.meshgrid(lat_list,lng_list) 
-coords = np.array([xx, yy]).reshape(2,-1).T
-coords = pd.DataFrame(coords, columns = ['Lat', 'Lon'])
+def grid_coords():
+    """create coordinates grid to search for"""
+    lat_list = np.arange(43.582157, 43.792441, 0.025)
+    lng_list = np.arange(-79.639066, -79.118471,0.05)
+    xx,yy = np.meshgrid(lat_list,lng_list)
+    coords = np.array([xx, yy]).reshape(2,-1).T
+    return pd.DataFrame(coords, columns = ['Lat', 'Lon'])
+
+
+def cell_key(lat, lng):
+    return '%.7f,%.7f' % (lat, lng)
+
+
+def read_progress(progress_path):
+    """keys of the grid cells already scraped"""
+    if not os.path.exists(progress_path):
+        return set()
+    with open(progress_path) as f:
+        return set(line.split('\t')[0] for line in f if line.strip())
+
+
+def poi_scrape(centroids_df, keyword, output_file_name, *place_type, client = None, radius = 3000,
+               n_workers = 8, output_dir = 'data/raw'):
+    """ Scraping points of interests given a dataframe that contains geo-coordinates of centroids
+
+    Grid cells are queried in a pool of n_workers threads (details in another pool), and the rows of
+    each cell are appended to <output>.csv as soon as it is done, then the cell is written to
+    <output>.progress. Running it again skips the cells in the progress file, so a crashed scrape
+    resumes where it stopped (raw responses are cached by the client, see places_api.py).
 
-def poi_scrape(centroids_df, keyword, output_file_name, *place_type):
-    """ Scraping points of interests given a dataframe that contains geo-coordinates of centroids 
-    
     Args
     ---------
-    centroids_df: a dataframe of points to search for, must contain columns 'Lat' and 'Lon' 
+    centroids_df: a dataframe of points to search for, must contain columns 'Lat' and 'Lon'
     keyword: searching keyword
-    output_file_name: file name of the search output
+    output_file_name: file name of the search output (Excel), written to output_dir
     place_type: type of the searched place
-    
+    client: PlacesClient to query with
+    radius: radius of the search range (m)
+    n_workers: number of grid cells queried at the same time
+    output_dir: folder of the outputs
+
     Returns
     ---------
     a dataframe of searching result
-    
-    
+
+
     """
-    df = pd.DataFrame()
-    row_index = 0
-    radius = 3000
-    for index, row in centroids_df.iterrows():
-        lat, lng= row['Lat'], row['Lon']   
-        current_length = len(df)
-        df = df.append(googleplaces_query_to_dataframe (lng, lat, keyword, radius, *place_type ))
-        print('scraped row ', row_index, ' and found', len(df)-current_length, 'results')
-        row_index += 1
+    place_type = place_type[0] if place_type else None
+    stem = os.path.join(output_dir, os.path.splitext(output_file_name)[0])
+    csv_path, progress_path = stem + '.csv', stem + '.progress'
+    done = read_progress(progress_path)
+    cells = [(row['Lat'], row['Lon']) for _, row in centroids_df.iterrows() if cell_key(row['Lat'], row['Lon']) not in done]
+    print('scraping', len(cells), 'cells,', len(done), 'already done')
+    new_file = not os.path.exists(csv_path)
+    with open(csv_path, 'a', newline = '') as f_csv, open(progress_path, 'a') as f_progress, \
+            ThreadPoolExecutor(max_workers = n_workers) as cell_executor, \
+            ThreadPoolExecutor(max_workers = n_workers) as details_executor:
+        writer = csv.writer(f_csv)
+        if new_file:
+            writer.writerow(OUTPUT_COLUMNS)
+        futures = dict((cell_executor.submit(query_cell, client, lng, lat, keyword, radius, place_type, details_executor), (lat, lng))
+                       for lat, lng in cells)
+        row_index = 0
+        for future in as_completed(futures):
+            lat, lng = futures[future]
+            try:
+                rows = future.result()
+            except Exception as error:
+                # not marked done, it is queried again next time
+                print('failed cell', cell_key(lat, lng), error)
+                continue
+            writer.writerows(rows)
+            f_csv.flush()
+            f_progress.write('%s\t%d\n' % (cell_key(lat, lng), len(rows)))
+            f_progress.flush()
+            print('scraped row ', row_index, ' and found', len(rows), 'results')
+            row_index += 1
+    df = pd.read_csv(csv_path)
     print('# results before dup drop', len(df))
     df_drop_dup = df.drop_duplicates('ID')
     print('# results after dup drop', len(df_drop_dup))
-    df_drop_dup.to_excel('/data/raw/'+output_file_name)
+    df_drop_dup.to_excel(os.path.join(output_dir, output_file_name))
     return df_drop_dup
 
-# scrape charging stations in Toronto
-df_charging = poi_scrape(coords, 'charging station','TRT_charging.xlsx')
-# scrape parking lots in Toronto
-df_parking = poi_scrape(coords, 'parking', 'TRT_parking_type_parking.xlsx', 'parking')
-# drop the "parks" observations
-df_parking2 = df_parking[df_parking.Name.str.endswith('Park') == False]
-df_parking2.to_excel('/data/raw/TRT_parking_lots_2.xlsx')
-
-df_foodcourt = poi_scrape(coords, 'food court', 'TRT_foodcourt.xlsx')
-df_shopping = poi_scrape(coords, 'shopping center', 'TRT_shopping.xlsx')
-df_restaurant = poi_scrape(coords, 'restaurant', 'TRT_restaurant.xlsx')
-df_grocery = poi_scrape(coords, 'grocery store', 'TRT_grocery.xlsx')
-df_gas = poi_scrape(coords, 'gas station', 'TRT_gas.xlsx')
-df_university = poi_scrape(coords, 'university', 'TRT_university.xlsx')
+
+# Adaptive grid: a quadtree over the bounding box. Each cell is searched from its center with the radius
+# of the circle covering it; a search that comes back with MAX_RESULTS results may have been truncated,
+# so the cell is split in 4 and its children are searched, otherwise the cell is fully covered.
+# Sparse areas cost one search per root cell, dense areas are refined as deep as needed.
+
+def root_cells(bbox = TRT_BBOX, n_lat = 2, n_lng = 4):
+    """cells (lat_min, lng_min, lat_max, lng_max, depth) of an n_lat by n_lng grid over the bounding box"""
+    lat_edges = np.linspace(bbox[0], bbox[2], n_lat + 1)
+    lng_edges = np.linspace(bbox[1], bbox[3], n_lng + 1)
+    return [(lat_edges[i], lng_edges[j], lat_edges[i + 1], lng_edges[j + 1], 0)
+            for i in range(n_lat) for j in range(n_lng)]
+
+
+def subdivide(cell):
+    """the 4 children of a cell"""
+    lat_min, lng_min, lat_max, lng_max, depth = cell
+    lat_mid, lng_mid = (lat_min + lat_max) / 2, (lng_min + lng_max) / 2
+    return [(lat_min, lng_min, lat_mid, lng_mid, depth + 1), (lat_min, lng_mid, lat_mid, lng_max, depth + 1),
+            (lat_mid, lng_min, lat_max, lng_mid, depth + 1), (lat_mid, lng_mid, lat_max, lng_max, depth + 1)]
+
+
+def cell_center(cell):
+    return (cell[0] + cell[2]) / 2, (cell[1] + cell[3]) / 2
+
+
+def cell_radius(cell):
+    """radius (m, rounded up) of the circle around the center of a cell that covers the cell"""
+    lat, lng = cell_center(cell)
+    corners = np.array([[cell[1], cell[0]], [cell[3], cell[0]], [cell[1], cell[2]], [cell[3], cell[2]]])
+    return int(np.ceil(haversine_distance(np.array([[lng, lat]]), corners).max() * 1000))
+
+
+def quad_key(cell):
+    return '%.7f,%.7f,%.7f,%.7f' % cell[:4]
+
+
+def read_quad_progress(progress_path):
+    """cells already scraped: key -> whether the search was saturated"""
+    done = {}
+    if os.path.exists(progress_path):
+        with open(progress_path) as f:
+            for line in f:
+                if line.strip():
+                    key, n_results, saturated = line.rstrip('\n').split('\t')
+                    done[key] = saturated == '1'
+    return done
+
+
+def query_quad(client, cell, keyword, place_type, seen, lock, details_executor):
+    """Search a quadtree cell and look up the details of the places not seen before
+
+    Args
+    ------------
+    client: PlacesClient
+    cell: (lat_min, lng_min, lat_max, lng_max, depth)
+    keyword: keyword to search for
+    place_type: type of the place (or None)
+    seen: set of the IDs of the places already found (shared by all cells), updated here
+    lock: lock of seen
+    details_executor: thread pool to look up the details in
+
+    Returns
+    ------------
+    number of results of the search, rows of the new places (columns OUTPUT_COLUMNS)
+    """
+    lat, lng = cell_center(cell)
+    results = search_cell(client, lng, lat, keyword, cell_radius(cell), place_type)
+    with lock:
+        new = [result for result in results if result['place_id'] not in seen]
+        seen.update(result['place_id'] for result in new)
+    try:
+        rows = list(details_executor.map(lambda result: place_row(client, result), new))
+    except Exception:
+        # release the places, the cell is searched again
+        with lock:
+            seen.difference_update(result['place_id'] for result in new)
+        raise
+    return len(results), rows
+
+
+def calls_spent(client, calls_before):
+    """API calls of each endpoint made by the client since calls_before (a copy of client.calls)"""
+    return dict((endpoint, client.calls.get(endpoint, 0) - calls_before.get(endpoint, 0))
+                for endpoint in ['nearbysearch', 'details'])
+
+
+def quadtree_scrape(keyword, output_file_name, *place_type, client = None, bbox = TRT_BBOX, n_lat = 2, n_lng = 4,
+                    max_depth = 6, n_workers = 8, output_dir = 'data/raw'):
+    """ Scraping points of interests over an adaptive quadtree grid of the bounding box
+
+    A cell is split in 4 only when its search is saturated (MAX_RESULTS results). Places are
+    de-duplicated by ID as the results come in (the details of a place are looked up once), and
+    written to <output>.csv, the cells to <output>.progress, so that running it again resumes.
+
+    Args
+    ---------
+    keyword: searching keyword
+    output_file_name: file name of the search output (Excel), written to output_dir
+    place_type: type of the searched place
+    client: PlacesClient to query with
+    bbox: bounding box (lat_min, lng_min, lat_max, lng_max) of the search
+    n_lat, n_lng: number of root cells along latitude and longitude
+    max_depth: maximum number of splits of a root cell
+    n_workers: number of cells queried at the same time
+    output_dir: folder of the outputs
+
+    Returns
+    ---------
+    a dataframe of searching result, a dict of the API calls spent on each endpoint
+    """
+    place_type = place_type[0] if place_type else None
+    stem = os.path.join(output_dir, os.path.splitext(output_file_name)[0])
+    csv_path, progress_path = stem + '.csv', stem + '.progress'
+    done = read_quad_progress(progress_path)
+    new_file = not os.path.exists(csv_path)
+    seen = set() if new_file else set(pd.read_csv(csv_path, usecols = ['ID'])['ID'])
+    calls_before = dict(client.calls)
+    # cells left to search, below the saturated cells of a previous run
+    pending, stack = [], root_cells(bbox, n_lat, n_lng)
+    while stack:
+        cell = stack.pop()
+        if quad_key(cell) not in done:
+            pending.append(cell)
+        elif done[quad_key(cell)] and cell[4] < max_depth:
+            stack += subdivide(cell)
+    print('scraping', len(pending), 'cells,', len(done), 'already done')
+    lock = threading.Lock()
+    n_cells = 0
+    with open(csv_path, 'a', newline = '') as f_csv, open(progress_path, 'a') as f_progress, \
+            ThreadPoolExecutor(max_workers = n_workers) as cell_executor, \
+            ThreadPoolExecutor(max_workers = n_workers) as details_executor:
+        writer = csv.writer(f_csv)
+        if new_file:
+            writer.writerow(OUTPUT_COLUMNS)
+
+        def submit(cell):
+            return cell_executor.submit(query_quad, client, cell, keyword, place_type, seen, lock, details_executor)
+        futures = dict((submit(cell), cell) for cell in pending)
+        while futures:
+            finished, _ = wait(futures, return_when = FIRST_COMPLETED)
+            for future in finished:
+                cell = futures.pop(future)
+                try:
+                    n_results, rows = future.result()
+                except Exception as error:
+                    # not marked done, it is queried again next time
+                    print('failed cell', quad_key(cell), error)
+                    continue
+                saturated = n_results >= MAX_RESULTS
+                writer.writerows(rows)
+                f_csv.flush()
+                f_progress.write('%s\t%d\t%d\n' % (quad_key(cell), n_results, saturated))
+                f_progress.flush()
+                n_cells += 1
+                if saturated and cell[4] < max_depth:
+                    for child in subdivide(cell):
+                        futures[submit(child)] = child
+                elif saturated:
+                    print('cell', quad_key(cell), 'is saturated at the maximum depth, results may be missing')
+    calls = calls_spent(client, calls_before)
+    df = pd.read_csv(csv_path)
+    print('searched', n_cells, 'cells and found', len(df), 'places of', keyword, 'with', calls, 'API calls')
+    df.to_excel(os.path.join(output_dir, output_file_name))
+    return df, calls
+
+
+if __name__ == '__main__':
+    file_dir = os.path.dirname(os.path.abspath('__file__'))
+    os.chdir(file_dir)
+    # read my Google API
+    API_path = os.path.join(file_dir, "..")
+    my_API_key = open(API_path+'/'+"GoogleAPIKey.txt", "r").read().strip()
+    client = PlacesClient(my_API_key, cache_dir = 'data/cache/places', rate = 10)
+
+    # keyword, output file (searches are by keyword only, see PlacesClient.nearby_search)
+    searches = [('charging station', 'TRT_charging.xlsx'),
+                ('parking', 'TRT_parking_type_parking.xlsx'),
+                ('food court', 'TRT_foodcourt.xlsx'),
+                ('shopping center', 'TRT_shopping.xlsx'),
+                ('restaurant', 'TRT_restaurant.xlsx'),
+                ('grocery store', 'TRT_grocery.xlsx'),
+                ('gas station', 'TRT_gas.xlsx'),
+                ('university', 'TRT_university.xlsx')]
+    results, report = {}, []
+    for keyword, output_file_name in searches:
+        results[keyword], calls = quadtree_scrape(keyword, output_file_name, client = client)
+        report.append(dict(calls, keyword = keyword, places = len(results[keyword])))
+    # API calls spent per keyword
+    df_report = pd.DataFrame(report).set_index('keyword')
+    print(df_report)
+    df_report.to_csv('data/raw/api_calls.csv')
+
+    # drop the "parks" observations
+    df_parking = results['parking']
+    df_parking2 = df_parking[df_parking.Name.str.endswith('Park') == False]
+    df_parking2.to_excel('data/raw/TRT_parking_lots_2.xlsx')
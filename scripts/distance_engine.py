@@ -0,0 +1,167 @@
+from functools import lru_cache
+import numpy as np
+from scipy.spatial import distance, cKDTree
+
+# Distances (km) between charging station candidates and demand locations given as (longitude, latitude):
+# 'haversine'  great circle distance
+# 'utm'        Euclidean distance in the UTM zone of the coordinates (needs pyproj)
+# 'degree'     Euclidean distance of the raw degrees times 85, as the first versions of the optimization did
+# or a RoadNetworkMatrix of precomputed road distances (or travel times) loaded from a file.
+# distance_matrix computes them in chunks of rows, so that large matrices fit in a memory budget.
+
+EARTH_RADIUS = 6371.0088 # km
+KM_PER_DEGREE = np.pi * EARTH_RADIUS / 180
+
+
+def unit_vectors(coords):
+    """(x, y, z) on the unit sphere of (longitude, latitude) in degrees"""
+    lng, lat = np.radians(coords[:, 0]), np.radians(coords[:, 1])
+    cos_lat = np.cos(lat)
+    return np.column_stack([cos_lat * np.cos(lng), cos_lat * np.sin(lng), np.sin(lat)])
+
+
+def haversine_distance(coords_a, coords_b):
+    """great circle distance (km) of every pair of coords_a and coords_b"""
+    # the chord between unit vectors comes from one matrix product, much faster than
+    # trigonometric functions of every pair (and exact to about a decimetre)
+    u_a, u_b = unit_vectors(coords_a), unit_vectors(coords_b)
+    chord2 = np.dot(u_a, -2 * u_b.T)
+    chord2 += (u_a ** 2).sum(axis = 1)[:, None]
+    chord2 += (u_b ** 2).sum(axis = 1)[None, :]
+    # in place, to keep one temporary per pair
+    np.clip(chord2, 0, 4, out = chord2)
+    np.sqrt(chord2, out = chord2)
+    chord2 *= 0.5
+    np.arcsin(chord2, out = chord2)
+    chord2 *= 2 * EARTH_RADIUS
+    return chord2
+
+
+def utm_crs(coords):
+    """EPSG code of the UTM zone of the center of the coordinates"""
+    lng, lat = np.mean(coords, axis = 0)
+    zone = int((lng + 180) // 6) % 60 + 1
+    return (32600 if lat >= 0 else 32700) + zone
+
+
+@lru_cache(maxsize = 8)
+def utm_transformer(crs):
+    """transformer of (longitude, latitude) to a UTM zone (slow to create, so created once per zone)"""
+    from pyproj import Transformer
+    return Transformer.from_crs(4326, crs, always_xy = True)
+
+
+def to_utm(coords, crs):
+    """(easting, northing) in km of (longitude, latitude) in degrees"""
+    x, y = utm_transformer(crs).transform(coords[:, 0], coords[:, 1])
+    return np.column_stack([x, y]) / 1000
+
+
+def degree_distance(coords_a, coords_b):
+    """distance (km) roughly transferred from Euclidean distance of the degrees"""
+    transfer_ratio = 85 # roughly transfer distance to km
+    return transfer_ratio * distance.cdist(coords_a, coords_b, 'euclidean')
+
+
+def local_km(coords, lat0 = None):
+    """(x, y) in km of (longitude, latitude) in an equirectangular projection around latitude lat0,
+    good enough for nearest neighbour searches within a city"""
+    coords = np.asarray(coords, dtype = float).reshape(-1, 2)
+    if lat0 is None:
+        lat0 = coords[:, 1].mean() if len(coords) else 0.
+    return np.column_stack([coords[:, 0] * np.cos(np.radians(lat0)), coords[:, 1]]) * KM_PER_DEGREE
+
+
+class RoadNetworkMatrix(object):
+    """Precomputed road network distances (or travel times) of origins to destinations, e.g. from OSRM
+
+    The file is a NumPy .npz with arrays 'origins' (n, 2) and 'destinations' (m, 2) of (longitude, latitude)
+    and 'matrix' (n, m). Coordinates are snapped to the nearest origin/destination of the file.
+
+    Args
+    -----------
+    path: path of the .npz file
+    scale: factor applied to the matrix, e.g. to turn travel times into the km the travel cost is based on
+    """
+
+    def __init__(self, path, scale = 1.):
+        data = np.load(path)
+        self.matrix = data['matrix']
+        self.lat0 = data['origins'][:, 1].mean()
+        self.origins = cKDTree(local_km(data['origins'], self.lat0))
+        self.destinations = cKDTree(local_km(data['destinations'], self.lat0))
+        self.scale = scale
+        self.name = 'road:%s:%r' % (path, scale)
+
+    def snap(self, coords_a, coords_b):
+        _, rows = self.origins.query(local_km(coords_a, self.lat0))
+        _, cols = self.destinations.query(local_km(coords_b, self.lat0))
+        return rows, cols
+
+    def __call__(self, coords_a, coords_b):
+        rows, cols = self.snap(coords_a, coords_b)
+        return self.scale * self.matrix[np.ix_(rows, cols)].astype(float)
+
+    def paired(self, coords_a, coords_b):
+        rows, cols = self.snap(coords_a, coords_b)
+        return self.scale * self.matrix[rows, cols].astype(float)
+
+
+def metric_name(metric):
+    """name of a metric, e.g. to key cached matrices"""
+    return metric if isinstance(metric, str) else metric.name
+
+
+def distance_matrix(coords_a, coords_b, metric = 'haversine', memory_budget = 256 * 2 ** 20, out = None, dtype = np.float32):
+    """Distance matrix (km) of coords_a to coords_b, computed in chunks of rows
+
+    Args
+    -----------
+    coords_a: array (n, 2) of (longitude, latitude), e.g. of charging station candidates
+    coords_b: array (m, 2) of (longitude, latitude), e.g. of demand locations
+    metric: 'haversine', 'utm', 'degree' or a RoadNetworkMatrix
+    memory_budget: bytes of temporary arrays of a chunk (the output not included)
+    out: optional array (n, m) to write into, e.g. a np.memmap for matrices larger than memory
+    dtype: data type of the output if out is not given
+
+    Returns
+    -----------
+    array (n, m) of distances
+    """
+    coords_a = np.asarray(coords_a, dtype = float).reshape(-1, 2)
+    coords_b = np.asarray(coords_b, dtype = float).reshape(-1, 2)
+    if out is None:
+        out = np.empty((len(coords_a), len(coords_b)), dtype = dtype)
+    if metric == 'utm':
+        crs = utm_crs(np.concatenate([coords_a, coords_b]))
+        coords_a, coords_b = to_utm(coords_a, crs), to_utm(coords_b, crs)
+        function = lambda a, b: distance.cdist(a, b, 'euclidean')
+    elif metric == 'haversine':
+        function = haversine_distance
+    elif metric == 'degree':
+        function = degree_distance
+    elif callable(metric):
+        function = metric
+    else:
+        raise ValueError('unknown metric %r' % (metric,))
+    # a few float64 temporaries per pair
+    chunk = max(1, int(memory_budget // (32 * max(1, len(coords_b)))))
+    for start in range(0, len(coords_a), chunk):
+        out[start:start + chunk] = function(coords_a[start:start + chunk], coords_b)
+    return out
+
+
+def paired_distance(coords_a, coords_b, metric = 'haversine'):
+    """distance (km) of each pair coords_a[k], coords_b[k]"""
+    coords_a = np.asarray(coords_a, dtype = float).reshape(-1, 2)
+    coords_b = np.asarray(coords_b, dtype = float).reshape(-1, 2)
+    if metric == 'utm':
+        crs = utm_crs(np.concatenate([coords_a, coords_b]))
+        return np.linalg.norm(to_utm(coords_a, crs) - to_utm(coords_b, crs), axis = 1)
+    if metric == 'haversine':
+        return 2 * EARTH_RADIUS * np.arcsin(np.clip(np.linalg.norm(unit_vectors(coords_a) - unit_vectors(coords_b), axis = 1) / 2, 0, 1))
+    if metric == 'degree':
+        return 85 * np.linalg.norm(coords_a - coords_b, axis = 1)
+    if hasattr(metric, 'paired'):
+        return metric.paired(coords_a, coords_b)
+    raise ValueError('unknown metric %r' % (metric,))
@@ -0,0 +1,111 @@
+import os
+import sys
+import json
+import time
+import resource
+import numpy as np
+
+# Structured metrics of the optimization: one JSON object per line (JSON lines) for every solved
+# (cluster, demand ratio), with the size and build time of the model, the solver and the solve time, MIP gap
+# and node count it reports (see solvers.py), the peak resident memory of the solver and of the Python
+# process, and the objective. optimize_cls and sweep_cls put these in their df_status, and
+# solve_clusters / sweep_clusters append them to a log file if they are given one (metrics_log).
+
+# columns of df_status written to the log
+METRIC_COLUMNS = ['cluster', 'demand_ratio', 'variant', 'budget', 'solver', 'status', 'objective', 'lower_bound', 'unmet', 'N_chg',
+                  'n_arcs', 'n_vars', 'n_constraints', 'n_nonzeros', 'build_time', 'solve_time', 'wall_time', 'gap', 'nodes',
+                  'iterations', 'retries', 'solver_peak_rss_mb', 'peak_rss_mb']
+
+
+def maxrss_kb(usage):
+    """ru_maxrss of a resource usage in kB (getrusage reports it in kB on Linux but in bytes on macOS)"""
+    return usage.ru_maxrss / 1024. if sys.platform == 'darwin' else usage.ru_maxrss
+
+
+def peak_rss_mb():
+    """peak resident memory of this process so far (MB)"""
+    return maxrss_kb(resource.getrusage(resource.RUSAGE_SELF)) / 1024.
+
+
+def process_hwm_kb(pid):
+    """peak resident memory (VmHWM, kB) of a running process, None if it is not available"""
+    try:
+        with open('/proc/%d/status' % pid) as f:
+            for line in f:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1])
+    except (IOError, OSError, ValueError):
+        pass
+    return None
+
+
+def wait_peak_rss_mb(process, max_interval = 0.05):
+    """Wait for a subprocess.Popen process to finish and measure its peak resident memory (MB)
+
+    On Linux the maximum resident memory that wait4 reports for a child includes the memory of this
+    process it was forked from, so it is only used when it is larger than the peak of this process,
+    and otherwise the peak is sampled from /proc while the process runs (a lower bound, sampled more
+    often at the start so that short solves are measured too). None if neither is available.
+    """
+    if not hasattr(os, 'wait4'):
+        process.wait()
+        return None
+    peak, interval = None, 0.001
+    while True:
+        pid, status, usage = os.wait4(process.pid, os.WNOHANG)
+        if pid:
+            break
+        hwm = process_hwm_kb(process.pid)
+        if hwm is not None:
+            peak = max(peak or 0, hwm)
+        time.sleep(interval)
+        interval = min(2 * interval, max_interval)
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else -os.WTERMSIG(status)
+    if maxrss_kb(usage) > maxrss_kb(resource.getrusage(resource.RUSAGE_SELF)):
+        peak = max(peak or 0, maxrss_kb(usage))
+    return peak / 1024. if peak is not None else None
+
+
+def model_size(model):
+    """number of variables, constraints and nonzeros of a FacilityModel (see model_builder.py)"""
+    return {'n_vars': model.n_cols, 'n_constraints': model.n_rows, 'n_nonzeros': int(np.count_nonzero(model.vals))}
+
+
+def to_json(value):
+    """value of a metric as JSON (numpy scalars as Python numbers, NaN as null)"""
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, float) and value != value:
+        return None
+    return value
+
+
+def write_metrics(path, df_status, **context):
+    """Append the metrics of every row of df_status to a JSON lines file
+
+    Args
+    -----------
+    path: log file (created if needed)
+    df_status: dataframe of the status of solved clusters (see optimize_cls), missing metric columns are skipped
+    context: other fields added to every line, e.g. run = 'nightly', mode = 'sweep'
+    """
+    columns = [column for column in METRIC_COLUMNS if column in df_status.columns]
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%S')
+    lines = []
+    for record in df_status[columns].to_dict('records'):
+        record = dict((key, to_json(value)) for key, value in record.items())
+        record.update(context)
+        record['time'] = timestamp
+        lines.append(json.dumps(record) + '\n')
+    folder = os.path.dirname(path)
+    if folder and not os.path.exists(folder):
+        os.makedirs(folder)
+    # one write per call, so that lines of concurrent writers are not interleaved
+    with open(path, 'a') as f:
+        f.write(''.join(lines))
+
+
+def read_metrics(path):
+    """metrics log as a list of dictionaries (see write_metrics)"""
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
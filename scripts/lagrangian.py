@@ -0,0 +1,175 @@
+"""Citywide optimization by Lagrangian relaxation, without the fixed partition into clusters
+
+Relaxing the demand constraints (sum_j x_ij = d_i) with multipliers lambda_i splits the problem into one
+subproblem per station: open it if its fixed cost plus the best use of its capacity at reduced costs
+c_ij - lambda_i is negative. The subproblems of all stations are solved at once with NumPy, the multipliers
+are updated by subgradient steps, and feasible solutions are built from the stations opened by the
+subproblems with the greedy repair of repair.py, the best of them being priced at last with the optimal
+assignment of demand to its stations (a transportation LP solved by CBC). The best relaxation value is a lower bound of the
+citywide optimum, so it also measures the cost of solving the 40 clusters separately.
+
+run from the scripts folder: python lagrangian.py
+"""
+import time
+import numpy as np
+import pandas as pd
+from optimization import gen_sets, gen_parameters, gen_demand, solve_clusters
+from repair import repair
+from model_builder import build_facility_model
+from solvers import solve_model, OPTIMAL
+
+
+def solve_subproblems(cost_matrix, fixed_cost, capacity, demand, lam):
+    """Solve the station subproblems of the relaxation for multipliers lam
+
+    Returns
+    -----------
+    value: value of the relaxation (a lower bound of the optimum)
+    is_open: boolean array of the stations opened by the subproblems
+    served: array of demand served at each demand location by the open stations
+    """
+    # only pairs with negative reduced cost are worth serving
+    j, i = np.nonzero(cost_matrix < lam[None, :])
+    reduced = cost_matrix[j, i] - lam[i]
+    # serve the most negative reduced costs of each station first, up to its capacity
+    order = np.lexsort((reduced, j))
+    j, i, reduced = j[order], i[order], reduced[order]
+    cum_demand = np.cumsum(demand[i])
+    starts = np.searchsorted(j, np.arange(len(fixed_cost)))
+    group_start = np.concatenate([[0.], cum_demand])[starts][j]
+    x = np.clip(capacity[j] - (cum_demand - demand[i] - group_start), 0, demand[i])
+    station_value = fixed_cost + np.bincount(j, weights = x * reduced, minlength = len(fixed_cost))
+    is_open = station_value < 0
+    served = np.bincount(i, weights = x * is_open[j], minlength = len(demand))
+    return (lam * demand).sum() + station_value[is_open].sum(), is_open, served
+
+
+def optimal_assignment(cost_matrix, capacity, demand, is_open, threads = None):
+    """Travel cost of the cheapest assignment of demand to a set of open stations (inf if they cannot serve it)"""
+    open_j = np.flatnonzero(is_open)
+    model = build_facility_model(cost_matrix[open_j], np.zeros(len(open_j)), capacity[open_j], demand)
+    # with the stations fixed, this is a linear program
+    model.integer[:] = False
+    status, objective, x = solve_model(model, threads = threads)
+    return objective if status == OPTIMAL else np.inf
+
+
+def lagrangian_bound(cost_matrix, fixed_cost, capacity, demand, max_iter = 300, primal_every = 10, step = 2.,
+                     min_step = 1e-4, patience = 20, tolerance = 1e-3, threads = None, upper = np.inf):
+    """Lower and upper bounds of the facility location problem by subgradient optimization
+
+    Args
+    -----------
+    cost_matrix: array (n_chg, n_demand) of travel cost
+    fixed_cost, capacity: arrays (n_chg,) of fixed cost and capacity of each station
+    demand: array (n_demand,) of demand at each location
+    max_iter: maximum number of subgradient iterations
+    primal_every: iterations between two repairs of the subproblems' stations into feasible solutions
+                  (None to only compute the lower bound, towards the objective upper of a known solution)
+    step: initial step size factor (halved when the bound has not improved for patience iterations)
+    min_step: stop when the step size factor gets below this
+    tolerance: stop when the gap gets below this
+    threads: number of threads the solver may use for the final assignment
+    upper: objective of a known feasible solution, the target of the subgradient steps
+
+    Returns
+    -----------
+    is_open: boolean array of the stations of the best feasible solution found (None if none was built)
+    upper: objective of that solution (the upper given if none was built, inf if the problem is infeasible)
+    lower: best lower bound (inf if the problem is infeasible)
+    history: dataframe of the bounds at each iteration
+    """
+    fixed_cost = np.asarray(fixed_cost, dtype = float)
+    capacity = np.asarray(capacity, dtype = float)
+    demand = np.asarray(demand, dtype = float)
+    if capacity.sum() < demand.sum():
+        # no set of stations can serve all demand
+        return None, np.inf, np.inf, pd.DataFrame(columns = ['iteration', 'value', 'lower', 'upper', 'step'])
+    # start from the cheapest cost per unit of serving each location (travel plus fixed cost per unit of capacity)
+    lam = (cost_matrix + (fixed_cost / capacity)[:, None]).min(axis = 0)
+    lower, best_open = -np.inf, None
+    since_improved = 0
+    tried = set()
+    history = []
+    for iteration in range(max_iter):
+        value, is_open, served = solve_subproblems(cost_matrix, fixed_cost, capacity, demand, lam)
+        if value > lower + 1e-9 * abs(value):
+            lower, since_improved = value, 0
+        else:
+            since_improved += 1
+            if since_improved >= patience:
+                step, since_improved = step / 2, 0
+        key = is_open.tobytes()
+        if primal_every is not None and (iteration % primal_every == 0 or upper == np.inf) and key not in tried:
+            # only make the stations feasible here, the best solution is improved further at the end
+            tried.add(key)
+            candidate, objective, unmet = repair(cost_matrix, fixed_cost, capacity, demand, is_open, max_rounds = 0)
+            if unmet <= 1e-9 and objective < upper:
+                upper, best_open = objective, candidate
+        history.append({'iteration': iteration, 'value': value, 'lower': lower, 'upper': upper, 'step': step})
+        subgradient = demand - served
+        norm = (subgradient ** 2).sum()
+        if norm <= 1e-12 or step < min_step or 1 - lower / upper <= tolerance:
+            break
+        # step towards the best objective, or above the relaxation until a feasible solution is found
+        target = upper if upper < np.inf else value + abs(value)
+        lam = lam + step * (target - value) / norm * subgradient
+    if best_open is not None:
+        best_open, upper, unmet = repair(cost_matrix, fixed_cost, capacity, demand, best_open)
+        upper = min(upper, fixed_cost[best_open].sum() + optimal_assignment(cost_matrix, capacity, demand, best_open, threads))
+    return best_open, upper, lower, pd.DataFrame(history)
+
+
+def solve_citywide(df_demand, df_parking, demand_ratio, cache = None, **options):
+    """Optimize charging station locations over the whole city at once
+
+    Args
+    -----------
+    df_demand: dataframe of demand for charging
+    df_parking: dataframe of parking lots (candidates for charging stations)
+    demand_ratio: a ratio that equals number of electric cars needs charging divided by number of car trips
+    cache: optional DistanceCache to read the distance matrix from (see cost_cache.py)
+    options: keyword arguments of lagrangian_bound
+
+    Returns
+    -----------
+    opt_chg_location: list of the selected locations (index of df_parking)
+    df_output_status: dataframe of status (Feasible/Infeasible), objective, lower bound, gap and solve time
+    """
+    start = time.perf_counter()
+    demand_lc, chg_lc = gen_sets(None, df_demand, df_parking)
+    fixed_cost, capacity, cost_matrix = gen_parameters(None, df_demand, df_parking, as_dict = False, cache = cache)
+    demand = gen_demand(df_demand, demand_ratio)['demand_chg'].values
+    is_open, upper, lower, history = lagrangian_bound(cost_matrix, fixed_cost, capacity, demand, **options)
+    opt_chg_location = [] if is_open is None else [j for j, use in zip(chg_lc, is_open) if use]
+    df_output_status = pd.DataFrame({'cluster': [None], 'status': ['Infeasible' if is_open is None else 'Feasible'],
+                                     'N_chg': [len(opt_chg_location)], 'objective': [upper], 'lower_bound': [lower],
+                                     'gap': [np.nan if is_open is None else 1 - lower / upper], 'iterations': [len(history)],
+                                     'wall_time': [time.perf_counter() - start]})
+    return opt_chg_location, df_output_status
+
+
+def compare_with_clusters(cluster_list, df_demand, df_parking, demand_ratio, n_workers = 1, cache = None, **options):
+    """Compare the clustered optimization with the citywide bounds
+
+    Returns
+    -----------
+    dataframe with objective, number of stations and gap to the citywide lower bound of both methods
+    """
+    start = time.perf_counter()
+    opt_cls, df_status_cls = solve_clusters(cluster_list, df_demand, df_parking, demand_ratio, n_workers = n_workers, cache = cache)
+    time_cls = time.perf_counter() - start
+    opt_city, df_status_city = solve_citywide(df_demand, df_parking, demand_ratio, cache = cache, **options)
+    lower = df_status_city['lower_bound'].iloc[0]
+    objective_cls = df_status_cls['objective'].sum() if (df_status_cls['status'] == 'Optimal').all() else np.nan
+    return pd.DataFrame({'method': ['clusters', 'citywide'],
+                         'objective': [objective_cls, df_status_city['objective'].iloc[0]],
+                         'N_chg': [len(opt_cls), len(opt_city)],
+                         'gap_to_lower_bound': [1 - lower / objective_cls, df_status_city['gap'].iloc[0]],
+                         'time_s': [time_cls, df_status_city['wall_time'].iloc[0]]})
+
+
+if __name__ == '__main__':
+    from synthetic import gen_synthetic_data
+    df_demand, df_parking = gen_synthetic_data(300, 800, n_clusters = 8)
+    print(compare_with_clusters(list(range(8)), df_demand, df_parking, 0.004))
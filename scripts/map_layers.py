@@ -0,0 +1,49 @@
+import os
+import json
+import numpy as np
+
+# Map layers of the webapp as GeoJSON: the existing charging stations are a static base layer written once
+# (write_base_layer), the stations selected in a scenario are an overlay built from the scenario store when
+# the map page asks for it (scenario_geojson), so that no map is rendered per scenario.
+# Coordinates are rounded to 6 decimals (about 10 cm) to keep the layers small.
+
+
+def points_geojson(df, properties = ('Name',), lng = 'longitude', lat = 'latitude', precision = 6):
+    """Compact GeoJSON text of a FeatureCollection of points
+
+    Args
+    -----------
+    df: dataframe with a row per point
+    properties: columns of df to add as properties of the features (missing values as null)
+    lng, lat: columns of the coordinates
+    precision: decimals of the coordinates
+
+    Returns
+    -----------
+    GeoJSON text
+    """
+    lngs = np.round(df[lng].values.astype(float), precision).tolist()
+    lats = np.round(df[lat].values.astype(float), precision).tolist()
+    values = [df[p].astype(object).where(df[p].notnull(), None).tolist() for p in properties]
+    features = [{'type': 'Feature', 'geometry': {'type': 'Point', 'coordinates': [x, y]},
+                 'properties': dict(zip(properties, row))}
+                for x, y, row in zip(lngs, lats, zip(*values))]
+    return json.dumps({'type': 'FeatureCollection', 'features': features}, separators = (',', ':'))
+
+
+def write_base_layer(path, df_chg_stn):
+    """Write the base layer of the map (existing charging stations) once for all scenarios
+
+    Args
+    -----------
+    path: GeoJSON file to write (replaced atomically)
+    df_chg_stn: dataframe of current charging stations, with columns Name, longitude and latitude
+    """
+    with open(path + '.tmp', 'w') as f:
+        f.write(points_geojson(df_chg_stn, ('Name',)))
+    os.replace(path + '.tmp', path)
+
+
+def scenario_geojson(store, scenario_index, properties = ('Name', 'Url')):
+    """GeoJSON text of the charging stations selected in a scenario of a ScenarioStore (see results_store.py)"""
+    return points_geojson(store.locations(scenario_index), properties)
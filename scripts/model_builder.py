@@ -0,0 +1,301 @@
+import numpy as np
+from scipy import sparse
+
+
+class FacilityModel(object):
+    """Facility-location MILP stored as flat NumPy arrays instead of PuLP objects
+
+    Columns are ordered as [Service arcs of every period, UseLocation stations, Unmet demand of every period],
+    rows as [demand (==) of every period, capacity (<=), budget (<=), linking (<=) of every period].
+    The model of optimize_cls has one period and no unmet demand or budget (see build_variant_model).
+    The constraint matrix is kept in COO form (rows, cols, vals) so that scenario data can be updated in place.
+
+    Attributes
+    -----------
+    arc_i, arc_j: positions of the demand location / charging station of every service arc
+    n_demand, n_chg: number of demand locations and charging station candidates
+    c: objective coefficients
+    rows, cols, vals: nonzero entries of the constraint matrix
+    sense: 'E' or 'L' for every row
+    rhs: right hand side of every row
+    ub: upper bound of every column (lower bounds are all 0)
+    integer: boolean mask of the integer (binary) columns
+    n_periods: number of demand periods sharing the stations
+    unmet: whether demand may be left unmet (at a penalty)
+    budget_row: position of the budget row (None if there is no budget)
+    """
+
+    def __init__(self, arc_i, arc_j, n_demand, n_chg, c, rows, cols, vals, sense, rhs, ub, integer,
+                 n_periods=1, unmet=False, budget_row=None):
+        self.arc_i = arc_i
+        self.arc_j = arc_j
+        self.n_demand = n_demand
+        self.n_chg = n_chg
+        self.c = c
+        self.rows = rows
+        self.cols = cols
+        self.vals = vals
+        self.sense = sense
+        self.rhs = rhs
+        self.ub = ub
+        self.integer = integer
+        self.n_periods = n_periods
+        self.unmet = unmet
+        self.budget_row = budget_row
+
+    @property
+    def n_arcs(self):
+        """number of service arcs of a period"""
+        return len(self.arc_i)
+
+    @property
+    def n_cols(self):
+        return len(self.c)
+
+    @property
+    def n_rows(self):
+        return len(self.rhs)
+
+    @property
+    def use_cols(self):
+        """column positions of the UseLocation variables"""
+        return np.arange(self.n_periods * self.n_arcs, self.n_periods * self.n_arcs + self.n_chg)
+
+    def service_cols(self, period=0):
+        """column positions of the Service variables of a period"""
+        return period * self.n_arcs + np.arange(self.n_arcs)
+
+    def unmet_cols(self, period=0):
+        """column positions of the Unmet demand variables of a period (empty if demand cannot be unmet)"""
+        if not self.unmet:
+            return np.arange(0)
+        start = self.n_periods * self.n_arcs + self.n_chg + period * self.n_demand
+        return np.arange(start, start + self.n_demand)
+
+    def update_demand(self, demand):
+        """Update the model in place for a new demand scenario,
+        only the demand right hand side and the linking coefficients depend on demand
+
+        Args
+        -----------
+        demand: array (n_demand,) of demand, or (n_periods, n_demand) of demand of every period
+        """
+        demand = np.asarray(demand, dtype=float).reshape(self.n_periods, self.n_demand)
+        self.rhs[:self.n_periods * self.n_demand] = demand.ravel()
+        # the linking coefficients of UseLocation are the last block of entries (see build_variant_model)
+        self.vals[len(self.vals) - self.n_periods * self.n_arcs:] = -demand[:, self.arc_i].ravel()
+
+    def update_budget(self, budget):
+        """Update the budget of the model in place (see build_variant_model)"""
+        if self.budget_row is None:
+            raise ValueError('the model has no budget constraint')
+        self.rhs[self.budget_row] = budget
+
+    def matrix(self, fmt='csr'):
+        """constraint matrix as a scipy sparse matrix"""
+        A = sparse.coo_matrix((self.vals, (self.rows, self.cols)), shape=(self.n_rows, self.n_cols))
+        return A.asformat(fmt)
+
+
+class ModelCore(object):
+    """Sets, travel costs and capacity structure of a facility-location problem, compiled once
+    and shared by the models of every variant and scenario (see build_variant_model)
+
+    Attributes
+    -----------
+    arc_i, arc_j: positions of the demand location / charging station of every service arc
+    arc_cost: travel cost of every service arc
+    fixed_cost: fixed cost to build each charging station
+    capacity: capacity of each charging station
+    n_demand: number of demand locations
+    """
+
+    def __init__(self, arc_i, arc_j, arc_cost, fixed_cost, capacity, n_demand):
+        self.arc_i = arc_i
+        self.arc_j = arc_j
+        self.arc_cost = arc_cost
+        self.fixed_cost = fixed_cost
+        self.capacity = capacity
+        self.n_demand = n_demand
+
+    @property
+    def n_arcs(self):
+        return len(self.arc_i)
+
+    @property
+    def n_chg(self):
+        return len(self.fixed_cost)
+
+
+def full_arcs(n_demand, n_chg):
+    """all (demand location, charging station) pairs, sorted by demand location"""
+    arc_i = np.repeat(np.arange(n_demand), n_chg)
+    arc_j = np.tile(np.arange(n_chg), n_demand)
+    return arc_i, arc_j
+
+
+def compile_core(cost_matrix, fixed_cost, capacity, n_demand, arcs=None):
+    """Compile the arrays of a facility-location problem that do not depend on demand, budget or variant
+
+    Args
+    -----------
+    cost_matrix: array (n_chg, n_demand) of travel cost from each charging station candidate to each demand location,
+                 or array (n_arcs,) of travel cost of each arc if arcs are given
+    fixed_cost: array (n_chg,) of fixed cost to build each charging station
+    capacity: array (n_chg,) of capacity of each charging station
+    n_demand: number of demand locations
+    arcs: optional tuple (arc_i, arc_j) of the service arcs to create, defaults to all pairs
+
+    Returns
+    -----------
+    ModelCore of the problem
+    """
+    cost_matrix = np.asarray(cost_matrix, dtype=float)
+    fixed_cost = np.asarray(fixed_cost, dtype=float)
+    capacity = np.asarray(capacity, dtype=float)
+    if arcs is None:
+        arc_i, arc_j = full_arcs(n_demand, len(fixed_cost))
+    else:
+        arc_i, arc_j = np.asarray(arcs[0]), np.asarray(arcs[1])
+    arc_cost = cost_matrix if cost_matrix.ndim == 1 else cost_matrix[arc_j, arc_i]
+    return ModelCore(arc_i, arc_j, arc_cost, fixed_cost, capacity, n_demand)
+
+
+def build_variant_model(core, demand, penalty=None, budget=None):
+    """Build a variant of the facility-location MILP from a compiled ModelCore
+
+    The base model (one period, no penalty, no budget) is the model of optimize_cls: minimize the fixed cost
+    of the stations and the travel cost, serving all demand within the capacity of the stations.
+    - several periods (e.g. AM and PM trips) share the stations and their daily capacity, every period's
+      demand being served by the stations built for all periods
+    - with a penalty, demand may be left unmet at this cost per unit
+    - with a budget, the fixed cost of the stations is not in the objective but limited to the budget
+      (the alternative model of the README, which needs a penalty so that it stays feasible)
+
+    Args
+    -----------
+    core: ModelCore of the problem (see compile_core)
+    demand: array (n_demand,) of demand for charging at each demand location,
+            or array (n_periods, n_demand) of the demand of every period
+    penalty: cost per unit of unmet demand (all demand is served if None)
+    budget: maximum total fixed cost of the stations (no budget if None)
+
+    Returns
+    -----------
+    FacilityModel of the problem
+    """
+    demand = np.asarray(demand, dtype=float)
+    n_periods = 1 if demand.ndim == 1 else len(demand)
+    demand = demand.reshape(n_periods, core.n_demand)
+    n_demand, n_chg, n_arcs = core.n_demand, core.n_chg, core.n_arcs
+    arc_i, arc_j = core.arc_i, core.arc_j
+    unmet = penalty is not None
+    periods = np.arange(n_periods)
+    # columns of the Service arcs of every period, UseLocation and Unmet demand of every period
+    arc_cols = (periods[:, None] * n_arcs + np.arange(n_arcs)).ravel()
+    use_cols = n_periods * n_arcs + np.arange(n_chg)
+    unmet_cols = n_periods * n_arcs + n_chg + np.arange(n_periods * n_demand if unmet else 0)
+    arc_period_i = (periods[:, None] * n_demand + arc_i).ravel()
+    arc_period_j = np.tile(arc_j, n_periods)
+    arc_period_demand = demand[:, arc_i].ravel()
+
+    # objective: fixed cost of stations (unless limited by the budget) + travel cost of every unit served
+    # + penalty of every unit of demand unmet
+    c = np.concatenate([np.tile(core.arc_cost, n_periods), core.fixed_cost if budget is None else np.zeros(n_chg),
+                        np.full(len(unmet_cols), penalty if unmet else 0.)])
+
+    # constraint 1: demand at each location is satisfied (or unmet) in every period
+    demand_rows = arc_period_i
+    unmet_rows = np.arange(len(unmet_cols))
+    # constraint 2: service of a station in all periods does not exceed its capacity if it is used
+    cap_rows = n_periods * n_demand + arc_period_j
+    cap_use_rows = n_periods * n_demand + np.arange(n_chg)
+    # constraint 3: the fixed cost of the stations used does not exceed the budget
+    if budget is None:
+        budget_row, budget_rows = None, np.arange(0)
+    else:
+        budget_row = n_periods * n_demand + n_chg
+        budget_rows = np.full(n_chg, budget_row)
+    n_budget = 0 if budget is None else 1
+    # constraint 4: a location can only be served by a station that is used
+    link_rows = n_periods * n_demand + n_chg + n_budget + np.arange(n_periods * n_arcs)
+
+    # the linking coefficients of UseLocation come last, so that update_demand can find them
+    rows = np.concatenate([demand_rows, unmet_rows, cap_rows, cap_use_rows, budget_rows, link_rows, link_rows])
+    cols = np.concatenate([arc_cols, unmet_cols, arc_cols, use_cols, use_cols[:len(budget_rows)], arc_cols,
+                           use_cols[arc_period_j]])
+    vals = np.concatenate([np.ones(n_periods * n_arcs), np.ones(len(unmet_cols)), np.ones(n_periods * n_arcs), -core.capacity,
+                           core.fixed_cost[:len(budget_rows)], np.ones(n_periods * n_arcs), -arc_period_demand])
+
+    sense = np.array(['E'] * (n_periods * n_demand) + ['L'] * (n_chg + n_budget + n_periods * n_arcs))
+    rhs = np.concatenate([demand.ravel(), np.zeros(n_chg), [budget] * n_budget, np.zeros(n_periods * n_arcs)]).astype(float)
+    ub = np.concatenate([np.full(n_periods * n_arcs, np.inf), np.ones(n_chg), np.full(len(unmet_cols), np.inf)])
+    integer = np.concatenate([np.zeros(n_periods * n_arcs, dtype=bool), np.ones(n_chg, dtype=bool), np.zeros(len(unmet_cols), dtype=bool)])
+    return FacilityModel(arc_i, arc_j, n_demand, n_chg, c, rows, cols, vals, sense, rhs, ub, integer,
+                         n_periods=n_periods, unmet=unmet, budget_row=budget_row)
+
+
+def build_facility_model(cost_matrix, fixed_cost, capacity, demand, arcs=None):
+    """Build the facility-location MILP of optimize_cls in bulk from NumPy arrays
+
+    Args
+    -----------
+    cost_matrix: array (n_chg, n_demand) of travel cost from each charging station candidate to each demand location,
+                 or array (n_arcs,) of travel cost of each arc if arcs are given
+    fixed_cost: array (n_chg,) of fixed cost to build each charging station
+    capacity: array (n_chg,) of capacity of each charging station
+    demand: array (n_demand,) of demand for charging at each demand location
+    arcs: optional tuple (arc_i, arc_j) of the service arcs to create, defaults to all pairs
+
+    Returns
+    -----------
+    FacilityModel of the problem
+    """
+    core = compile_core(cost_matrix, fixed_cost, capacity, len(demand), arcs=arcs)
+    return build_variant_model(core, demand)
+
+
+def write_mps(model, path):
+    """Write a FacilityModel to a free MPS file in one pass (values are written with 12 significant
+    digits, wider than the fields of fixed MPS, so solvers must read it as free MPS)
+
+    Args
+    -----------
+    model: FacilityModel to write
+    path: path of the output MPS file
+    """
+    # objective entries are written as row -1 so they come first in each column
+    nz = model.vals != 0
+    obj_cols = np.flatnonzero(model.c)
+    rows = np.concatenate([np.full(len(obj_cols), -1), model.rows[nz]])
+    cols = np.concatenate([obj_cols, model.cols[nz]])
+    vals = np.concatenate([model.c[obj_cols], model.vals[nz]])
+    order = np.lexsort((rows, cols))
+    rows, cols, vals = rows[order], cols[order], vals[order]
+
+    row_names = ['obj'] + ['r%d' % r for r in range(model.n_rows)]
+    # binary columns are all grouped together (after the Service columns), between the integer markers
+    int_cols = np.flatnonzero(model.integer)
+    if len(int_cols):
+        int_start, int_end = np.searchsorted(cols, int_cols[0]), np.searchsorted(cols, int_cols[-1], side='right')
+    else:
+        int_start = int_end = len(cols)
+
+    def entries(start, end):
+        return ('    %-8s  %-8s  %.12g\n' % ('c%d' % j, row_names[r + 1], v)
+                for j, r, v in zip(cols[start:end], rows[start:end], vals[start:end]))
+
+    with open(path, 'w') as f:
+        f.write('NAME          FacilityLocation\nROWS\n N  obj\n')
+        f.writelines(' %s  %s\n' % (s, 'r%d' % r) for r, s in enumerate(model.sense))
+        f.write('COLUMNS\n')
+        f.writelines(entries(0, int_start))
+        f.write("    MARKER                 'MARKER'                 'INTORG'\n")
+        f.writelines(entries(int_start, int_end))
+        f.write("    MARKER                 'MARKER'                 'INTEND'\n")
+        f.writelines(entries(int_end, len(cols)))
+        f.write('RHS\n')
+        f.writelines('    RHS       %-8s  %.12g\n' % ('r%d' % r, v) for r, v in enumerate(model.rhs) if v != 0)
+        f.write('BOUNDS\n')
+        f.writelines(' UP BND       %-8s  %.12g\n' % ('c%d' % j, v) for j, v in enumerate(model.ub) if np.isfinite(v))
+        f.write('ENDATA\n')
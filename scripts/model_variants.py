@@ -0,0 +1,238 @@
+"""Variants of the optimization built on one compiled model core per cluster
+
+The sets, travel costs and capacity of a cluster are compiled once (compile_cluster), and the model of every
+variant is assembled from them with NumPy (see build_variant_model in model_builder.py):
+- base:   the model of optimize_cls, serving the morning (AM) demand at minimum fixed and travel cost
+- ampm:   the morning and afternoon (PM) demand served by the same stations, sharing their daily capacity
+- budget: the alternative model of the README, minimizing travel cost and a penalty for unmet demand with the
+          fixed cost of the stations limited to a budget, solved for a list of budgets: one model whose budget
+          is updated in place, each solve starting from the solution of the previous (smaller) budget
+so that running all variants costs little more than computing the distances once and solving each model.
+
+run from the scripts folder: python model_variants.py
+"""
+import numpy as np
+import pandas as pd
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from optimization import gen_sets, gen_arcs, gen_parameters, gen_demand, select_cluster, status_frame, limit_threads
+from model_builder import compile_core, build_variant_model
+from instrumentation import model_size, write_metrics
+from clustering import largest_first
+from solvers import solve_model, INFEASIBLE, FEASIBLE
+
+VARIANTS = ('base', 'ampm', 'budget')
+# demand columns of the periods of the ampm variant
+PERIOD_COLUMNS = ('CT_AM_trips', 'CT_PM_trips')
+# fixed cost of a station (see gen_parameters), budgets are split over the clusters in multiples of it
+STATION_COST = 11000
+
+
+def compile_cluster(cluster_id, df_demand, df_parking, max_demand = None, radius = None, k_nearest = None, cache = None):
+    """Compile the core of a cluster's model: its sets, travel costs and capacity
+
+    Args
+    -----------
+    cluster_id: id of the cluster to optimize over (None for the whole city)
+    df_demand: dataframe of demand for charging
+    df_parking: dataframe of parking lots (candidates for charging stations)
+    max_demand: array of the largest demand of each demand location over the variants, to size pruned pairs
+    radius, k_nearest: prune the service pairs as in optimize_cls
+    cache: optional DistanceCache to read distance matrices from (see cost_cache.py)
+
+    Returns
+    -----------
+    ModelCore of the cluster (see model_builder.py)
+    """
+    demand_lc, chg_lc = gen_sets(cluster_id, df_demand, df_parking)
+    arcs = None
+    if radius is not None or k_nearest is not None:
+        arcs = gen_arcs(cluster_id, df_demand, df_parking, max_demand, radius, k_nearest)
+    fixed_cost, capacity, cost = gen_parameters(cluster_id, df_demand, df_parking, as_dict = False, arcs = arcs, cache = cache)
+    return compile_core(cost, fixed_cost, capacity, len(demand_lc), arcs = arcs)
+
+
+def period_demand(df_demand_cls, demand_ratio, columns = PERIOD_COLUMNS):
+    """array (n_periods, n_demand) of demand for charging of every period (see gen_demand)"""
+    return np.array([gen_demand(df_demand_cls, demand_ratio, column)['demand_chg'].values for column in columns])
+
+
+def cluster_budgets(df_demand, cluster_list, demand_ratio, n_stations):
+    """Split a citywide budget of n_stations stations over the clusters in proportion to their demand,
+    rounded by largest remainder so that the stations of all clusters add up to n_stations
+
+    Returns
+    -----------
+    dictionary of cluster id: budget of the cluster (a whole number of stations times STATION_COST)
+    """
+    demand = gen_demand(df_demand, demand_ratio).groupby('parking_cluster')['demand_chg'].sum()
+    quota = n_stations * demand.reindex(cluster_list).fillna(0).values / demand.sum()
+    stations = np.floor(quota).astype(int)
+    # the stations left by rounding down go to the clusters with the largest remainders
+    stations[np.argsort(stations - quota, kind = 'stable')[:n_stations - stations.sum()]] += 1
+    return dict((cluster_id, STATION_COST * int(k)) for cluster_id, k in zip(cluster_list, stations))
+
+
+def solve_variant(model, chg_lc, cluster_id, demand_ratio, variant, metrics, budget = None, initial_solution = None, **options):
+    """Solve a variant's model and describe its solution as optimize_cls does, with the variant, budget and unmet demand
+
+    Returns
+    -----------
+    opt_location, df_status and the column values of the solution
+    """
+    status, objective, x = solve_model(model, initial_solution = initial_solution, stats = metrics, **options)
+    metrics.update(model_size(model))
+    print(cluster_id, variant, budget, "Status: ", status)
+    opt_location = [i for i, use in zip(chg_lc, x[model.use_cols]) if use > .00001]
+    df_status = status_frame(cluster_id, demand_ratio, status, opt_location, objective, model.n_arcs, metrics)
+    df_status['variant'] = variant
+    df_status['budget'] = budget
+    df_status['unmet'] = x[model.unmet_cols()].sum() if status in FEASIBLE and model.unmet else 0.
+    return opt_location, df_status, x
+
+
+def variants_cls(cluster_id, df_demand, df_parking, demand_ratio, variants = VARIANTS, budgets = (), penalty = 1650,
+                 radius = None, k_nearest = None, cache = None, warm_start = True, **options):
+    """Solve several variants of a cluster's model, all built from one compiled core
+
+    Args
+    -----------
+    cluster_id: id of the cluster to optimize over (None for the whole city)
+    df_demand: dataframe of demand for charging, with the columns of PERIOD_COLUMNS for the ampm variant
+    df_parking: dataframe of parking lots (candidates for charging stations)
+    demand_ratio: a ratio that equals number of electric cars needs charging divided by number of car trips
+    variants: variants to solve, keys of VARIANTS
+    budgets: budgets of the budget variant (fixed cost of the stations)
+    penalty: cost per unit of unmet demand of the budget variant
+    radius, k_nearest: prune the service pairs as in optimize_cls (sized for the largest demand of the variants),
+                       if the base or ampm model is infeasible with the pruned pairs it is solved with all pairs
+    cache: optional DistanceCache to read distance matrices from (see cost_cache.py)
+    warm_start: whether to start the solve of a budget from the solution of the previous one
+    options: solver options of solve_model (solver, time_limit, mip_gap, threads)
+
+    Returns
+    -----------
+    dictionary of (variant, budget): (opt_location, df_status) as returned by optimize_cls, budget being None
+    for the variants without a budget, with the variant, budget and unmet demand added to df_status
+    """
+    demand_lc, chg_lc = gen_sets(cluster_id, df_demand, df_parking)
+    df_demand_cls = select_cluster(df_demand, 'parking_cluster', cluster_id)
+    periods = PERIOD_COLUMNS if 'ampm' in variants else PERIOD_COLUMNS[:1]
+    demand = period_demand(df_demand_cls, demand_ratio, periods)
+    start = perf_counter()
+    core = compile_cluster(cluster_id, df_demand, df_parking, demand.max(axis = 0), radius, k_nearest, cache)
+    # the compile time is counted in the build time of the first model
+    compile_time = perf_counter() - start
+    pruned = core.n_arcs < len(demand_lc) * len(chg_lc)
+
+    results = {}
+    for variant in variants:
+        variant_budgets = sorted(budgets) if variant == 'budget' else [None]
+        if not variant_budgets:
+            continue
+        start = perf_counter()
+        if variant == 'base':
+            model = build_variant_model(core, demand[0])
+        elif variant == 'ampm':
+            model = build_variant_model(core, demand)
+        elif variant == 'budget':
+            model = build_variant_model(core, demand[0], penalty = penalty, budget = variant_budgets[0])
+        else:
+            raise ValueError('unknown variant %s, available: %s' % (variant, ', '.join(VARIANTS)))
+        build_time = compile_time + perf_counter() - start
+        compile_time = 0.
+        initial_solution = None
+        for budget in variant_budgets:
+            if budget is not None:
+                model.update_budget(budget)
+            metrics = {'build_time': build_time}
+            build_time = 0.
+            opt_location, df_status, x = solve_variant(model, chg_lc, cluster_id, demand_ratio, variant, metrics, budget,
+                                                       initial_solution, **options)
+            if df_status['status'].iloc[0] == INFEASIBLE and pruned and variant != 'budget':
+                # the pruned pairs may not be enough to serve all demand, solve with all pairs
+                start = perf_counter()
+                full_core = compile_cluster(cluster_id, df_demand, df_parking, cache = cache)
+                model = build_variant_model(full_core, demand[0] if variant == 'base' else demand)
+                # the build time counts both models
+                metrics = {'build_time': metrics['build_time'] + perf_counter() - start}
+                opt_location, df_status, x = solve_variant(model, chg_lc, cluster_id, demand_ratio, variant, metrics, budget, **options)
+            results[(variant, budget)] = opt_location, df_status
+            if warm_start and df_status['status'].iloc[0] in FEASIBLE:
+                # the stations of a smaller budget are within any larger one
+                initial_solution = x
+    return results
+
+
+def variants_cls_timed(job):
+    """Run variants_cls on one cluster and record its wall time (the unit of work of variant_clusters)"""
+    cluster_id, df_demand_cls, df_parking_cls, demand_ratio, options = job
+    if options.get('threads') is not None:
+        limit_threads(options['threads'])
+    start = perf_counter()
+    results = variants_cls(cluster_id, df_demand_cls, df_parking_cls, demand_ratio, **options)
+    wall_time = perf_counter() - start
+    for opt_location, df_status in results.values():
+        df_status['wall_time'] = wall_time / len(results)
+    return results
+
+
+def variant_clusters(cluster_list, df_demand, df_parking, demand_ratio, variants = VARIANTS, list_n_stations = (),
+                     n_workers = 1, threads = 1, metrics_log = None, **options):
+    """Solve the variants over every cluster, each cluster's core being compiled once
+
+    Args
+    -----------
+    cluster_list: list of the cluster ids to optimize over
+    df_demand: dataframe of demand for charging
+    df_parking: dataframe of parking lots (candidates for charging stations)
+    demand_ratio: a ratio that equals number of electric cars needs charging divided by number of car trips
+    variants: variants to solve, keys of VARIANTS
+    list_n_stations: citywide budgets of the budget variant, in number of stations (see cluster_budgets)
+    n_workers: number of worker processes, each solving the variants of one cluster at a time
+    threads: number of threads each solver may use
+    metrics_log: optional JSON lines file to append the metrics of every cluster and variant to (see instrumentation.py)
+    options: other keyword arguments of variants_cls
+
+    Returns
+    -----------
+    dictionary of (variant, number of stations of the budget or None): (opt_chg_location, df_output_status)
+    as returned by solve_clusters (wall_time is the cluster's time averaged over its models)
+    """
+    budgets = [cluster_budgets(df_demand, cluster_list, demand_ratio, n_stations) for n_stations in list_n_stations]
+    schedule = largest_first(cluster_list, df_demand, df_parking)
+    jobs = [(cluster_id, select_cluster(df_demand, 'parking_cluster', cluster_id), select_cluster(df_parking, 'cluster', cluster_id),
+             demand_ratio, dict(options, variants = variants, budgets = sorted(set(b[cluster_id] for b in budgets)), threads = threads))
+            for cluster_id in schedule]
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers = n_workers) as executor:
+            cluster_results = dict(zip(schedule, executor.map(variants_cls_timed, jobs)))
+    else:
+        cluster_results = dict(zip(schedule, map(variants_cls_timed, jobs)))
+
+    keys = [(variant, None) for variant in variants if variant != 'budget']
+    if 'budget' in variants:
+        keys += [('budget', n_stations) for n_stations in list_n_stations]
+    variant_results = {}
+    for variant, n_stations in keys:
+        results = []
+        for cluster_id in cluster_list:
+            budget = None if n_stations is None else budgets[list(list_n_stations).index(n_stations)][cluster_id]
+            results.append(cluster_results[cluster_id][(variant, budget)])
+        opt_chg_location = [i for opt_location, _ in results for i in opt_location]
+        df_output_status = pd.concat([df_status for _, df_status in results], ignore_index = True)
+        variant_results[(variant, n_stations)] = opt_chg_location, df_output_status
+        if metrics_log is not None:
+            write_metrics(metrics_log, df_output_status, mode = 'variants', n_stations = n_stations)
+    return variant_results
+
+
+if __name__ == '__main__':
+    from synthetic import gen_synthetic_data
+    df_demand, df_parking = gen_synthetic_data(120, 400, n_clusters = 4)
+    cluster_list = sorted(df_parking['cluster'].unique())
+    variant_results = variant_clusters(cluster_list, df_demand, df_parking, 0.01, list_n_stations = (20, 40, 80),
+                                       n_workers = 2, k_nearest = 20)
+    for key, (opt_chg_location, df_output_status) in variant_results.items():
+        print(key, len(opt_chg_location), 'stations, objective', df_output_status['objective'].sum(),
+              'unmet demand', df_output_status['unmet'].sum())
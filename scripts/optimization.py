@@ -1,30 +1,35 @@
 import os
 import pandas as pd
 import numpy as np
-import geopandas as gpd
 import matplotlib.pyplot as plt
-from shapely.geometry import Point
-from scipy.spatial import distance
 from pulp import *
-import folium
-from folium.plugins import MarkerCluster
-file_dir = os.path.dirname(os.path.abspath('__file__'))
-os.chdir(file_dir)
+from time import perf_counter
+from concurrent.futures import ProcessPoolExecutor
+from model_builder import build_facility_model
+from solvers import solve_model, pulp_solver, TIME_LIMIT, INFEASIBLE, FEASIBLE
+from candidate_arcs import nearest_arcs
+from distance_engine import distance_matrix, paired_distance, local_km
+from results_store import write_store
+from cost_cache import DistanceCache
+from clustering import largest_first
+from spatial import df_to_gdf
+from storage import read_cleaned_data
+from map_layers import write_base_layer
+from instrumentation import model_size, peak_rss_mb, write_metrics
 
-# load cleaned datasets
-df_demand = pd.read_excel('data/cleaned/optimization_CT_AM_trips_cluster.xlsx')
-df_parking= pd.read_excel('data/cleaned/optimization_parking_location_cluster.xlsx')
-
-# To speed up the optimization process, optimize over 40 clusters of parking lots, then combine the results
-cluster_list = [i for i in range(40)]
 
+def select_cluster(df, column, cluster_id):
+    """rows of df that belong to a cluster (all rows if cluster_id is None, i.e. optimize over the whole city)"""
+    if cluster_id is None:
+        return df
+    return df.loc[df[column] == cluster_id]
 
 def gen_sets(cluster_id, df_demand, df_parking):
     """Generate sets to use in the optimization problem
     
     Args
     -----------
-    cluster_id: id of the cluster to optimize over
+    cluster_id: id of the cluster to optimize over (None for the whole city)
     df_demand: dataframe of demand for charging
     df_parking: dataframe of parking lots (candidates for charging stations)
     
@@ -34,31 +39,64 @@ def gen_sets(cluster_id, df_demand, df_parking):
     
     """
     # set of charging demand locations (destinations)
-    df_demand_cls = df_demand.loc[df_demand['parking_cluster'] == cluster_id]
+    df_demand_cls = select_cluster(df_demand, 'parking_cluster', cluster_id)
     demand_lc = df_demand_cls.index.tolist()
     # set of candidates for charging station locations (currently existing parking lots)
-    df_parking_cls = df_parking.loc[df_parking['cluster'] == cluster_id]
+    df_parking_cls = select_cluster(df_parking, 'cluster', cluster_id)
     chg_lc = df_parking_cls.index.tolist()
     return demand_lc, chg_lc
 
-def gen_parameters(cluster_id, df_demand, df_parking):
+def gen_arcs(cluster_id, df_demand, df_parking, demand = None, radius = None, k_nearest = None):
+    """Generate the pairs of demand location and charging station that can serve it,
+    limited to stations within a radius and/or the k nearest stations (see candidate_arcs.py)
+    
+    Args
+    -----------
+    cluster_id: id of the cluster to optimize over (None for the whole city)
+    df_demand: dataframe of demand for charging
+    df_parking: dataframe of parking lots (candidates for charging stations)
+    demand: array of demand for charging at each demand location, so that every location can still be served
+    radius: maximum distance (km) from a demand location to a station serving it
+    k_nearest: number of nearest stations that can serve each demand location
+    
+    Returns
+    -----------
+    arrays of positions (as ordered in gen_sets) of the demand location and the station of each pair
+    """
+    df_demand_cls = select_cluster(df_demand, 'parking_cluster', cluster_id)
+    df_parking_cls = select_cluster(df_parking, 'cluster', cluster_id)
+    capacity = np.full(len(df_parking_cls), 20)
+    # nearest stations are searched for in km
+    lat0 = df_parking_cls['latitude'].mean()
+    return nearest_arcs(local_km(df_parking_cls[['longitude', 'latitude']].values, lat0),
+                        local_km(df_demand_cls[['long', 'lat']].values, lat0),
+                        radius = radius, k_nearest = k_nearest, capacity = capacity, demand = demand)
+
+def gen_parameters(cluster_id, df_demand, df_parking, as_dict=True, arcs=None, cache=None, metric='haversine'):
     """Generate parameters to use in the optimization problem, 
     including capacity of charging station, cost to install charging stations, 
     and travel costs to and from the charging stations (present value)
     
     Args
     -----------
-    cluster_id: id of the cluster to optimize over
+    cluster_id: id of the cluster to optimize over (None for the whole city)
     df_demand: dataframe of demand for charging
     df_parking: dataframe of parking lots (candidates for charging stations)
+    as_dict: if False, return NumPy arrays (ordered as in gen_sets) instead of dictionaries
+    arcs: optional pairs from gen_arcs, if given (with as_dict False) travel cost is only computed for these pairs
+    cache: optional DistanceCache (see cost_cache.py) to read the distance matrix from instead of computing it
+    metric: distance metric if no cache is given, 'haversine', 'utm', 'degree' (85 times the Euclidean
+            distance of the degrees, as in the first versions) or a RoadNetworkMatrix (see distance_engine.py)
 
     Returns
     -----------
     dictionaries of fixed cost to build charging stations, capacity of charging stations,
     travel cost matrix of demand points to charging stations
+    (arrays of fixed cost, capacity and a (parking x demand) travel cost matrix if as_dict is False,
+    or an array of travel cost of each pair if arcs are given)
     """
     # fixed cost to install a charging station with 5 level II chargers
-    df_parking_cls = df_parking.loc[df_parking['cluster'] == cluster_id].copy()
+    df_parking_cls = select_cluster(df_parking, 'cluster', cluster_id).copy()
     df_parking_cls['fixed_cost'] = 11000
     fixed_cost = df_parking_cls['fixed_cost'].to_dict()
     
@@ -69,14 +107,23 @@ def gen_parameters(cluster_id, df_demand, df_parking):
     # distance matrix of charging station location candidates and charging demand location
     
     coords_pk = [(x,y) for x,y in zip(df_parking_cls['longitude'],df_parking_cls['latitude'])]
-    df_demand_cls = df_demand.loc[df_demand['parking_cluster']==cluster_id]
+    df_demand_cls = select_cluster(df_demand, 'parking_cluster', cluster_id)
     coords_trip = [(x,y) for x,y in zip(df_demand_cls['long'],df_demand_cls['lat'])]
-
-    distance_matrix = distance.cdist(coords_pk, coords_trip, 'euclidean')
-    transfer_ratio = 85
-    distance_matrix2 = transfer_ratio*distance_matrix
+    if cache is not None:
+        distance_matrix2 = cache.get(coords_pk, coords_trip).astype(float)
+        if arcs is not None and not as_dict:
+            arc_i, arc_j = arcs
+            return df_parking_cls['fixed_cost'].values, df_parking_cls['chg_capacity'].values, distance_matrix2[arc_j, arc_i]*1457
+    elif arcs is not None and not as_dict:
+        arc_i, arc_j = arcs
+        arc_distance = paired_distance(np.array(coords_pk).reshape(-1, 2)[arc_j], np.array(coords_trip).reshape(-1, 2)[arc_i], metric)
+        return df_parking_cls['fixed_cost'].values, df_parking_cls['chg_capacity'].values, arc_distance*1457
+    else:
+        distance_matrix2 = distance_matrix(coords_pk, coords_trip, metric, dtype = float)
     df_distance = pd.DataFrame(distance_matrix2, index = df_parking_cls.index.tolist() ,columns = df_demand_cls.index.tolist())
     df_travel_cost = df_distance * 1457
+    if not as_dict:
+        return df_parking_cls['fixed_cost'].values, df_parking_cls['chg_capacity'].values, df_travel_cost.values
     dic_cost_matrix = df_travel_cost.to_dict('index')
     return fixed_cost, capacity, dic_cost_matrix
 
@@ -111,28 +158,20 @@ def gen_demand(df, demand_ratio, column = 'CT_AM_trips'):
 list_demand_ratio = np.linspace(0.00118, 0.038, num=30).tolist()
 # will iterate through the 30 numbers to plot the map with optimal locations of stations
 
-def optimize_cls(cluster_id, df_demand, df_parking, demand_ratio):
-    """
-    Optimize over a cluster of parking lots to find optimal charging station locations
+def build_pulp_problem(demand_lc, chg_lc, fixed_cost, capacity, dic_cost_matrix, demand):
+    """Build the facility location problem with one PuLP variable and constraint per (demand, station) pair
     
     Args
     -----------
-    cluster_id: id of the cluster to optimize over
-    df_demand: dataframe of demand for charging
-    df_parking: dataframe of parking lots (candidates for charging stations)
-    demand_ratio: a ratio that equals number of electric cars needs charging divided by number of car trips
+    demand_lc, chg_lc: lists of demand location and potential charging station location (from gen_sets)
+    fixed_cost, capacity, dic_cost_matrix: dictionaries of parameters (from gen_parameters)
+    demand: dictionary of demand for charging at each demand location
 
     Returns
     -----------
-    opt_location: a list of optimal locations
-    df_status: the status of the optimization (Optimal/Infeasible)
+    prob: the PuLP problem
+    use_vars: dictionary of the binary variables of using each charging station location
     """
-    demand_lc, chg_lc = gen_sets(cluster_id, df_demand, df_parking)
-    fixed_cost, capacity, dic_cost_matrix = gen_parameters(cluster_id, df_demand, df_parking)
-    df_demand_cls = df_demand.loc[df_demand['parking_cluster'] == cluster_id]
-    df_demand = gen_demand(df_demand_cls, demand_ratio)
-    demand = df_demand['demand_chg'].to_dict()
-    # set up the optimization problem
     prob = LpProblem('FacilityLocation', LpMinimize)
     serv_vars = LpVariable.dicts("Service",
                                  [(i,j) for i in demand_lc
@@ -147,33 +186,289 @@ def optimize_cls(cluster_id, df_demand, df_parking, demand_ratio):
     for i in demand_lc:
         for j in chg_lc:
             prob += serv_vars[(i,j)] <= demand[i]*use_vars[j]
+    return prob, use_vars
+
+def optimize_cls(cluster_id, df_demand, df_parking, demand_ratio, builder = 'sparse', radius = None, k_nearest = None, threads = None, cache = None,
+                 solver = 'cbc', time_limit = None, mip_gap = None):
+    """
+    Optimize over a cluster of parking lots to find optimal charging station locations
+    
+    Args
+    -----------
+    cluster_id: id of the cluster to optimize over (None for the whole city)
+    df_demand: dataframe of demand for charging
+    df_parking: dataframe of parking lots (candidates for charging stations)
+    demand_ratio: a ratio that equals number of electric cars needs charging divided by number of car trips
+    builder: 'sparse' to build the model in bulk from the cost matrix (see model_builder.py),
+             'pulp' to build it with one PuLP variable/constraint per pair
+    radius: (sparse builder only) only let stations within this distance (km) serve a demand location
+    k_nearest: (sparse builder only) only let the k nearest stations serve a demand location
+               if the pruned model is infeasible, radius and k_nearest are doubled until it is not (or nothing is pruned),
+               the number of retries is in the metrics (unless the capacity of all stations is below total demand)
+    threads: number of threads the solver may use
+    cache: optional DistanceCache to read distance matrices from (see cost_cache.py)
+    solver: solver backend, 'cbc', 'highs' or 'glpk' (see solvers.py)
+    time_limit: maximum solve time (seconds) of the cluster, no limit if None
+    mip_gap: relative MIP gap at which a solution is accepted as optimal (the solver's default if None)
+
+    Returns
+    -----------
+    opt_location: a list of optimal locations (of the best solution found if the time limit is reached)
+    df_status: the status of the optimization (Optimal/TimeLimit/Infeasible/Not Solved), objective value,
+               number of service pairs and the metrics of the build and solve (see status_frame)
+    """
+    demand_lc, chg_lc = gen_sets(cluster_id, df_demand, df_parking)
+    df_demand_cls = select_cluster(df_demand, 'parking_cluster', cluster_id)
+    df_demand_cls = gen_demand(df_demand_cls, demand_ratio)
     print(cluster_id)
-    prob.solve()
-    print("Status: ", LpStatus[prob.status])
+    metrics = {'build_time': 0., 'solver': solver}
+    if builder == 'pulp':
+        start = perf_counter()
+        fixed_cost, capacity, dic_cost_matrix = gen_parameters(cluster_id, df_demand, df_parking, cache = cache)
+        demand = df_demand_cls['demand_chg'].to_dict()
+        prob, use_vars = build_pulp_problem(demand_lc, chg_lc, fixed_cost, capacity, dic_cost_matrix, demand)
+        metrics.update(build_time = perf_counter() - start, n_vars = prob.numVariables(), n_constraints = prob.numConstraints(),
+                       n_nonzeros = sum(len(constraint) for constraint in prob.constraints.values()))
+        start = perf_counter()
+        prob.solve(pulp_solver(solver, time_limit, mip_gap, threads))
+        metrics['solve_time'] = perf_counter() - start
+        status = LpStatus[prob.status]
+        if getattr(prob, 'sol_status', None) == LpSolutionIntegerFeasible:
+            status = TIME_LIMIT
+        objective = value(prob.objective)
+        n_arcs = len(demand_lc) * len(chg_lc)
+        use_values = [use_vars[j].varValue for j in chg_lc]
+    else:
+        demand = df_demand_cls['demand_chg'].values
+        if radius is None and k_nearest is None:
+            start = perf_counter()
+            fixed_cost, capacity, cost_matrix = gen_parameters(cluster_id, df_demand, df_parking, as_dict = False, cache = cache)
+            model = build_facility_model(cost_matrix, fixed_cost, capacity, demand)
+            metrics['build_time'] = perf_counter() - start
+            status, objective, x = solve_model(model, solver, time_limit, mip_gap, threads, stats = metrics)
+        else:
+            # build time of all attempts, solver metrics of the last one, number of widened attempts in retries
+            metrics['retries'] = 0
+            while True:
+                start = perf_counter()
+                arcs = gen_arcs(cluster_id, df_demand, df_parking, demand, radius, k_nearest)
+                fixed_cost, capacity, arc_cost = gen_parameters(cluster_id, df_demand, df_parking, as_dict = False, arcs = arcs, cache = cache)
+                model = build_facility_model(arc_cost, fixed_cost, capacity, demand, arcs = arcs)
+                metrics['build_time'] += perf_counter() - start
+                if np.sum(capacity) < demand.sum():
+                    # no set of stations can serve all demand, however many pairs there are
+                    status, objective, x = INFEASIBLE, None, np.zeros(model.n_cols)
+                    break
+                status, objective, x = solve_model(model, solver, time_limit, mip_gap, threads, stats = metrics)
+                if status != INFEASIBLE or model.n_arcs == len(demand_lc) * len(chg_lc):
+                    break
+                # stations are shared by nearby demand locations, widen the candidate sets and try again
+                radius = None if radius is None else radius * 2
+                k_nearest = None if k_nearest is None else k_nearest * 2
+                metrics['retries'] += 1
+        n_arcs = model.n_arcs
+        use_values = x[model.use_cols]
+        metrics.update(model_size(model))
+    print("Status: ", status)
     TOL = .00001
     opt_location = []
-    for i in chg_lc:
-        if use_vars[i].varValue > TOL:
+    for i, use in zip(chg_lc, use_values):
+        if use is not None and use > TOL:
             opt_location.append(i)
             print("Eslablish charging station at site", i)
-    df_status = pd.DataFrame({"cluster": [cluster_id], "status": [LpStatus[prob.status]], "N_chg": [len(opt_location)]})
+    df_status = status_frame(cluster_id, demand_ratio, status, opt_location, objective, n_arcs, metrics)
+    return opt_location, df_status
+
+def status_frame(cluster_id, demand_ratio, status, opt_location, objective, n_arcs, metrics):
+    """One-row df_status of a solved cluster with its metrics (see instrumentation.py):
+    solver, lower_bound, build_time, n_vars, n_constraints, n_nonzeros, solve_time, gap, nodes, iterations,
+    solver_peak_rss_mb (of the solver process), retries (of a pruned model, see optimize_cls) and
+    peak_rss_mb (of this process so far)"""
+    record = {"cluster": cluster_id, "demand_ratio": demand_ratio, "status": status, "N_chg": len(opt_location),
+              "objective": objective, "n_arcs": n_arcs}
+    for name in ['solver', 'lower_bound', 'build_time', 'n_vars', 'n_constraints', 'n_nonzeros', 'solve_time', 'gap', 'nodes',
+                 'iterations', 'solver_peak_rss_mb', 'retries']:
+        record[name] = metrics.get(name)
+    record['peak_rss_mb'] = peak_rss_mb()
+    return pd.DataFrame([record], columns = list(record))
+
+def limit_threads(threads):
+    """keep numerical libraries and solvers started from this process to a number of threads"""
+    for var in ['OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS']:
+        os.environ[var] = str(threads)
+
+def optimize_cls_timed(job):
+    """Run optimize_cls on one cluster and record its wall time (the unit of work of solve_clusters)
+    
+    Args
+    -----------
+    job: tuple of (cluster_id, df_demand, df_parking, demand_ratio, options), where the dataframes
+         can be only the cluster's slices and options are keyword arguments of optimize_cls
+    
+    Returns
+    -----------
+    the output of optimize_cls, with the wall time added to df_status
+    """
+    cluster_id, df_demand_cls, df_parking_cls, demand_ratio, options = job
+    if options.get('threads') is not None:
+        limit_threads(options['threads'])
+    start = perf_counter()
+    opt_location, df_status = optimize_cls(cluster_id, df_demand_cls, df_parking_cls, demand_ratio, **options)
+    df_status['wall_time'] = perf_counter() - start
     return opt_location, df_status
 
-def df_to_gdf(df):
-    """takes a dataframe with columns named 'longitude' and 'latitude' 
-    to transform to a geodataframe with point features    
+def solve_clusters(cluster_list, df_demand, df_parking, demand_ratio, n_workers = 1, threads = 1, metrics_log = None, **options):
+    """Optimize over every cluster, in parallel worker processes if n_workers > 1
+    
+    Args
+    -----------
+    cluster_list: list of the cluster ids to optimize over
+    df_demand: dataframe of demand for charging
+    df_parking: dataframe of parking lots (candidates for charging stations)
+    demand_ratio: a ratio that equals number of electric cars needs charging divided by number of car trips
+    n_workers: number of worker processes (1 solves the clusters one after another in this process)
+    threads: number of threads each solver may use, so that workers * threads does not exceed the cores
+    metrics_log: optional JSON lines file to append the metrics of every cluster to (see instrumentation.py)
+    options: other keyword arguments of optimize_cls
+    
+    Returns
+    -----------
+    opt_chg_location: list of optimal locations of all clusters
+    df_output_status: dataframe of the status and wall time of each cluster, in the order of cluster_list
+    """
+    # only ship each cluster's rows to the workers, largest clusters first so that they do not finish last
+    schedule = largest_first(cluster_list, df_demand, df_parking)
+    jobs = [(cluster_id, select_cluster(df_demand, 'parking_cluster', cluster_id),
+             select_cluster(df_parking, 'cluster', cluster_id), demand_ratio, dict(options, threads = threads))
+            for cluster_id in schedule]
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers = n_workers) as executor:
+            results = dict(zip(schedule, executor.map(optimize_cls_timed, jobs)))
+    else:
+        results = dict(zip(schedule, map(optimize_cls_timed, jobs)))
+    results = [results[cluster_id] for cluster_id in cluster_list]
+    opt_chg_location = [i for opt_location, _ in results for i in opt_location]
+    df_output_status = pd.concat([df_status for _, df_status in results], ignore_index = True)
+    if metrics_log is not None:
+        write_metrics(metrics_log, df_output_status, mode = 'solve')
+    return opt_chg_location, df_output_status
+
+def sweep_cls(cluster_id, df_demand, df_parking, list_demand_ratio, radius = None, k_nearest = None, threads = None, warm_start = True, cache = None,
+              solver = 'cbc', time_limit = None, mip_gap = None):
+    """
+    Optimize over a cluster of parking lots for a list of demand ratios, building the model only once:
+    between scenarios only the demand and the linking coefficients are updated, and the optimal
+    locations of the previous (smaller) demand ratio are passed to the solver as a MIP start
+    
+    Args
+    -----------
+    cluster_id: id of the cluster to optimize over (None for the whole city)
+    df_demand: dataframe of demand for charging
+    df_parking: dataframe of parking lots (candidates for charging stations)
+    list_demand_ratio: list of demand ratios to optimize for
+    radius, k_nearest: prune the service pairs as in optimize_cls (sized for the largest demand ratio)
+    threads: number of threads the solver may use
+    warm_start: whether to pass the previous solution as a MIP start
+    cache: optional DistanceCache to read distance matrices from (see cost_cache.py)
+    solver, time_limit, mip_gap: solver backend and its options as in optimize_cls (the time limit is per demand ratio)
+    
+    Returns
+    -----------
+    dictionary of demand ratio: (opt_location, df_status) as returned by optimize_cls
     """
+    demand_lc, chg_lc = gen_sets(cluster_id, df_demand, df_parking)
+    df_demand_cls = select_cluster(df_demand, 'parking_cluster', cluster_id)
+    list_demand_ratio = sorted(list_demand_ratio)
+    arcs = None
+    if radius is not None or k_nearest is not None:
+        max_demand = gen_demand(df_demand_cls, list_demand_ratio[-1])['demand_chg'].values
+        arcs = gen_arcs(cluster_id, df_demand, df_parking, max_demand, radius, k_nearest)
+    start = perf_counter()
+    fixed_cost, capacity, cost = gen_parameters(cluster_id, df_demand, df_parking, as_dict = False, arcs = arcs, cache = cache)
+    demand = gen_demand(df_demand_cls, list_demand_ratio[0])['demand_chg'].values
+    model = build_facility_model(cost, fixed_cost, capacity, demand, arcs = arcs)
+    build_time = perf_counter() - start
+
+    results = {}
+    initial_solution = None
+    for demand_ratio in list_demand_ratio:
+        print(cluster_id, 'demand ratio = ', demand_ratio)
+        # the build time of the first scenario includes building the model, the others only updating it
+        start = perf_counter()
+        model.update_demand(gen_demand(df_demand_cls, demand_ratio)['demand_chg'].values)
+        metrics = dict(model_size(model), build_time = build_time + perf_counter() - start)
+        build_time = 0.
+        status, objective, x = solve_model(model, solver, time_limit, mip_gap, threads, initial_solution, stats = metrics)
+        if status == INFEASIBLE and arcs is not None:
+            # the pruned pairs may not be enough, let optimize_cls widen them
+            results[demand_ratio] = optimize_cls(cluster_id, df_demand, df_parking, demand_ratio, radius = radius, k_nearest = k_nearest,
+                                                 threads = threads, cache = cache, solver = solver, time_limit = time_limit, mip_gap = mip_gap)
+            continue
+        print("Status: ", status)
+        opt_location = [i for i, use in zip(chg_lc, x[model.use_cols]) if use > .00001]
+        df_status = status_frame(cluster_id, demand_ratio, status, opt_location, objective, model.n_arcs, metrics)
+        results[demand_ratio] = opt_location, df_status
+        if warm_start and status in FEASIBLE:
+            initial_solution = x
+    return results
+
+def sweep_cls_timed(job):
+    """Run sweep_cls on one cluster and record its wall time (the unit of work of sweep_clusters)"""
+    cluster_id, df_demand_cls, df_parking_cls, list_demand_ratio, options = job
+    if options.get('threads') is not None:
+        limit_threads(options['threads'])
+    start = perf_counter()
+    results = sweep_cls(cluster_id, df_demand_cls, df_parking_cls, list_demand_ratio, **options)
+    wall_time = perf_counter() - start
+    for opt_location, df_status in results.values():
+        df_status['wall_time'] = wall_time / len(results)
+    return results
+
+def sweep_clusters(cluster_list, df_demand, df_parking, list_demand_ratio, n_workers = 1, threads = 1, metrics_log = None, **options):
+    """Optimize over every cluster for every demand ratio, each cluster's model being built once (see sweep_cls)
+    
+    Args
+    -----------
+    cluster_list: list of the cluster ids to optimize over
+    df_demand: dataframe of demand for charging
+    df_parking: dataframe of parking lots (candidates for charging stations)
+    list_demand_ratio: list of demand ratios to optimize for
+    n_workers: number of worker processes, each sweeping one cluster at a time
+    threads: number of threads each solver may use
+    metrics_log: optional JSON lines file to append the metrics of every cluster and scenario to (see instrumentation.py)
+    options: other keyword arguments of sweep_cls
     
-    df['coordinates'] = df[['longitude', 'latitude']].values.tolist()
-    df['coordinates'] = df['coordinates'].apply(Point)
-    df = gpd.GeoDataFrame(df, geometry = 'coordinates')
-    return df
+    Returns
+    -----------
+    dictionary of demand ratio: (opt_chg_location, df_output_status) as returned by solve_clusters
+    (wall_time is the cluster's sweep time averaged over the demand ratios)
+    """
+    schedule = largest_first(cluster_list, df_demand, df_parking)
+    jobs = [(cluster_id, select_cluster(df_demand, 'parking_cluster', cluster_id),
+             select_cluster(df_parking, 'cluster', cluster_id), list_demand_ratio, dict(options, threads = threads))
+            for cluster_id in schedule]
+    if n_workers > 1:
+        with ProcessPoolExecutor(max_workers = n_workers) as executor:
+            cluster_results = dict(zip(schedule, executor.map(sweep_cls_timed, jobs)))
+    else:
+        cluster_results = dict(zip(schedule, map(sweep_cls_timed, jobs)))
+    cluster_results = [cluster_results[cluster_id] for cluster_id in cluster_list]
+    scenario_results = {}
+    for demand_ratio in list_demand_ratio:
+        results = [cluster_result[demand_ratio] for cluster_result in cluster_results]
+        opt_chg_location = [i for opt_location, _ in results for i in opt_location]
+        df_output_status = pd.concat([df_status for _, df_status in results], ignore_index = True)
+        scenario_results[demand_ratio] = opt_chg_location, df_output_status
+        if metrics_log is not None:
+            write_metrics(metrics_log, df_output_status, mode = 'sweep')
+    return scenario_results
 
-# load current charging stations to be shown on map
-df_chg_stn = pd.read_excel('data/raw/TRT_charging.xlsx')
-gdf_chg_stn = df_to_gdf(df_chg_stn)
+def load_chg_stn():
+    """load current charging stations to be shown on map"""
+    df_chg_stn = pd.read_excel('data/raw/TRT_charging.xlsx')
+    return df_to_gdf(df_chg_stn)
 
-def main_map_generater(demand_ratio, df_demand, df_parking, cluster_list):
+def main_map_generater(demand_ratio, df_demand, df_parking, cluster_list, n_workers = 1, threads = 1, solution = None, save_excel = False):
     """
     Because the optimization process takes about 3 - 5 minutes per iteration, 
     I prepare the results of optimization beforehead for the webapp.
@@ -184,6 +479,12 @@ def main_map_generater(demand_ratio, df_demand, df_parking, cluster_list):
     df_demand: dataframe of demand for charging
     df_parking: dataframe of parking lots (candidates for charging stations)
     demand_ratio: a ratio that equals number of electric cars needs charging divided by number of car trips
+    n_workers: number of worker processes solving clusters in parallel
+    threads: number of threads each solver may use
+    solution: optional (opt_chg_location, df_output_status) already solved for this demand ratio, e.g. by sweep_clusters
+    save_excel: whether to also save the status and optimal locations to Excel files
+                (the webapp reads them from the scenario store, see results_store.py, and draws them
+                on its map page over the base layer of existing stations, see map_layers.py)
     
     Returns
     ------------
@@ -191,50 +492,40 @@ def main_map_generater(demand_ratio, df_demand, df_parking, cluster_list):
     gdf_optimal_parking: geodataframe of optimal locations for charging stations
     
     """
-    opt_chg_location = []
-    df_output_status = pd.DataFrame(columns = ['cluster', 'status', 'N_chg'])
-    for cluster_id in cluster_list:
-        opt_location, df_status = optimize_cls(cluster_id, df_demand, df_parking, demand_ratio)
-        opt_chg_location += opt_location
-        df_output_status =df_output_status.append(df_status)
-    df_output_status.to_excel('data/processed/chg_stn_status_cluster_demand_ratio'+str(demand_ratio)[2:]+'.xlsx')
-    df_opt_chg_lc = df_parking.ix[opt_chg_location]
-    df_opt_chg_lc.to_excel('data/processed/chg_stn_location_cluster_demand_ratio'+str(demand_ratio)[2:]+'.xlsx')
+    if solution is None:
+        solution = solve_clusters(cluster_list, df_demand, df_parking, demand_ratio, n_workers, threads)
+    opt_chg_location, df_output_status = solution
+    print('slowest clusters:')
+    print(df_output_status.sort_values('wall_time', ascending = False).head())
+    df_opt_chg_lc = df_parking.loc[opt_chg_location]
+    if save_excel:
+        df_output_status.to_excel('data/processed/chg_stn_status_cluster_demand_ratio'+str(demand_ratio)[2:]+'.xlsx')
+        df_opt_chg_lc.to_excel('data/processed/chg_stn_location_cluster_demand_ratio'+str(demand_ratio)[2:]+'.xlsx')
     gdf_optimal_parking = df_to_gdf(df_opt_chg_lc)
     gdf_optimal_parking.plot()
     plt.savefig('graphs/location_cluster_demand_ratio_'+str(demand_ratio)[2:]+'.jpg')
-    # draw map using folium
-    # add base layer --- map of Toronto
-    lat, lng = 43.653908, -79.384293  # Toronto City Hall
-    map_TRT = folium.Map(location=[lat, lng], zoom_start = 14) 
-    # add layer --- existing charging stations
-    chg_layer = folium.FeatureGroup(name = 'Existing Charging Stations')
-    marker_cluster = MarkerCluster()
-    for idx, row in gdf_chg_stn.iterrows():
-        folium.Marker([float(row['coordinates'].y), 
-                       float(row['coordinates'].x)], 
-                     popup = row['Name']).add_to(marker_cluster)
-    chg_layer.add_child(marker_cluster)
-    map_TRT.add_child(chg_layer)
-    # add layer --- suggested extra charging stations
-    opt_chg_layer = folium.FeatureGroup(name = 'Suggested Charging Station Locations')
-    marker_cluster = MarkerCluster()
-    for idx, row in gdf_optimal_parking.iterrows():
-        folium.Marker([float(row['coordinates'].y), 
-                       float(row['coordinates'].x)], 
-                    icon = folium.Icon(color = 'green', icon = 'circle'),
-                     popup = row['Name']).add_to(marker_cluster)
-    opt_chg_layer.add_child(marker_cluster)
-    map_TRT.add_child(opt_chg_layer)
-    map_TRT.add_child(folium.LayerControl())
-    map_TRT.save('graphs/folium/TRT_map_demand_ratio_'+str(demand_ratio)[2:]+'.html')
     return df_output_status, gdf_optimal_parking
 
-# iterate through possible demand ratios, optimize and draw maps
-counter = 0
-for demand_ratio in list_demand_ratio:    
-    print('demand ratio = ', demand_ratio)
-    main_map_generater(demand_ratio, df_demand, df_parking, cluster_list) 
-    print('progress: ', counter)
-    counter += 1
+if __name__ == '__main__':
+    file_dir = os.path.dirname(os.path.abspath('__file__'))
+    os.chdir(file_dir)
+
+    # load cleaned datasets
+    df_demand, df_parking = read_cleaned_data('data/cleaned')
+
+    # To speed up the optimization process, optimize over clusters of parking lots (made by data_cleaning.py), then combine the results
+    cluster_list = sorted(df_parking['cluster'].unique())
+    # clusters are independent, solve them in parallel with single-threaded solvers
+    n_workers = os.cpu_count()
+
+    # distance matrices computed by data_cleaning.py (or by earlier runs) are read from the cache
+    cache = DistanceCache('data/cache/distance', metric = 'haversine')
 
+    # optimize all demand ratios at once (each cluster's model is built once and warm started)
+    # metrics of every cluster and scenario are appended to a JSON lines log (see instrumentation.py),
+    # a cluster that is not solved to optimality in 10 minutes keeps the best solution found (status TimeLimit)
+    scenario_results = sweep_clusters(cluster_list, df_demand, df_parking, list_demand_ratio, n_workers, cache = cache,
+                                      metrics_log = 'data/processed/solve_metrics.jsonl', solver = 'cbc', time_limit = 600)
+    write_store('data/processed/scenario_store', df_parking, scenario_results)
+    # the webapp draws any scenario of the store over one static layer of the existing charging stations
+    write_base_layer('data/processed/base_layer.geojson', load_chg_stn())
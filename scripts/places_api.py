@@ -0,0 +1,142 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+# Thin client of the Google Places web service (nearby search and place details) for data_scraping.py:
+# every raw response is kept in an on-disk cache, so that a scrape can be re-run or resumed without
+# paying for the same calls again, and calls are spaced by a rate limiter shared by all threads.
+# The transport (fetch) can be replaced, e.g. by the local stub in places_stub.py.
+
+PLACES_URL = 'https://maps.googleapis.com/maps/api/place'
+
+
+def http_fetch(endpoint, params):
+    """GET a Places web service endpoint ('nearbysearch' or 'details') and decode the JSON response"""
+    with urlopen(PLACES_URL + '/' + endpoint + '/json?' + urlencode(params), timeout = 30) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+class RateLimiter(object):
+    """Let at most `rate` calls per second through, across threads
+
+    Args
+    -----------
+    rate: calls per second (no limit if None)
+    """
+
+    def __init__(self, rate):
+        self.interval = 1. / rate if rate else 0.
+        self.lock = threading.Lock()
+        self.next_time = 0.
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time)
+            self.next_time = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class ResponseCache(object):
+    """Raw responses stored as JSON files, one per request key
+
+    Args
+    -----------
+    cache_dir: folder of the cache (None for no cache)
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if cache_dir is not None and not os.path.exists(cache_dir):
+            os.makedirs(cache_dir)
+
+    def path(self, key):
+        digest = hashlib.sha1(json.dumps(key, sort_keys = True).encode()).hexdigest()
+        return os.path.join(self.cache_dir, digest[:2], digest + '.json')
+
+    def get(self, key):
+        if self.cache_dir is None:
+            return None
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)['response']
+
+    def put(self, key, response):
+        if self.cache_dir is None:
+            return
+        path = self.path(key)
+        if not os.path.exists(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path), exist_ok = True)
+        # written to a temporary file and renamed, so that a crash never leaves a partial response
+        tmp_path = '%s.%d.%d.tmp' % (path, os.getpid(), threading.get_ident())
+        with open(tmp_path, 'w') as f:
+            json.dump({'key': key, 'response': response}, f)
+        os.replace(tmp_path, path)
+
+
+class PlacesClient(object):
+    """Cached, rate limited calls to the Places nearby search and place details
+
+    Args
+    -----------
+    api_key: Google API key
+    cache_dir: folder of the response cache (None for no cache)
+    rate: maximum calls per second to the web service
+    fetch: function (endpoint, params) -> decoded response, http_fetch by default
+    page_token_delay: seconds to wait before retrying a page token that is not valid yet
+    max_retries: number of retries of a page token
+    """
+
+    def __init__(self, api_key, cache_dir = None, rate = 10, fetch = http_fetch, page_token_delay = 2., max_retries = 5):
+        self.api_key = api_key
+        self.cache = ResponseCache(cache_dir)
+        self.limiter = RateLimiter(rate)
+        self.fetch = fetch
+        self.page_token_delay = page_token_delay
+        self.max_retries = max_retries
+        self.lock = threading.Lock()
+        self.calls = {}
+
+    def call(self, endpoint, key, params, refresh = False):
+        """response of a request, from the cache if it is there (and refresh is False)"""
+        response = None if refresh else self.cache.get(key)
+        if response is not None:
+            return response
+        self.limiter.wait()
+        response = self.fetch(endpoint, dict(params, key = self.api_key))
+        with self.lock:
+            self.calls[endpoint] = self.calls.get(endpoint, 0) + 1
+        # errors are not cached, so that they are retried next time
+        if response.get('status') in ('OK', 'ZERO_RESULTS'):
+            self.cache.put(key, response)
+        return response
+
+    def nearby_search(self, lat, lng, keyword, radius, place_type = None, page_token = None, refresh = False):
+        """one page (up to 20 results) of a nearby search, the first page if page_token is None
+        (refresh to query it again even if it is cached, e.g. when its next page token expired)
+
+        place_type is not sent: like the original scraper, the search is by keyword only, so that the
+        same places are found (a type would also filter out places of other types matching the keyword)"""
+        key = ['nearbysearch', round(lat, 7), round(lng, 7), keyword, radius, page_token]
+        if page_token is None:
+            params = {'location': '%.7f,%.7f' % (lat, lng), 'radius': radius, 'keyword': keyword}
+        else:
+            params = {'pagetoken': page_token}
+        for _ in range(self.max_retries + 1):
+            response = self.call('nearbysearch', key, params, refresh)
+            # a new page token takes a moment to become valid
+            if page_token is None or response.get('status') != 'INVALID_REQUEST':
+                break
+            time.sleep(self.page_token_delay)
+        return response
+
+    def details(self, place_id):
+        """details of a place"""
+        return self.call('details', ['details', place_id], {'place_id': place_id})
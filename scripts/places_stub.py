@@ -0,0 +1,73 @@
+import threading
+import numpy as np
+import pandas as pd
+from distance_engine import haversine_distance
+from synthetic import TRT_LAT, TRT_LNG
+
+# Local stub of the Places web service, to run data_scraping.py without an API key or network:
+# pass a StubPlaces as the fetch function of places_api.PlacesClient. Like the real service, a nearby
+# search returns pages of 20 results ranked by prominence (here the rating), at most 60 in total.
+
+
+def gen_places(n_places, keywords = ('parking',), seed = 0):
+    """synthetic places in the Toronto area, each matching one of the keywords"""
+    rng = np.random.RandomState(seed)
+    return pd.DataFrame({'place_id': ['stub%d' % k for k in range(n_places)],
+                         'name': ['Place %d' % k for k in range(n_places)],
+                         'lat': rng.uniform(TRT_LAT[0], TRT_LAT[1], n_places),
+                         'lng': rng.uniform(TRT_LNG[0], TRT_LNG[1], n_places),
+                         'rating': np.round(rng.uniform(1, 5, n_places), 1),
+                         'keyword': rng.choice(list(keywords), n_places)})
+
+
+class StubPlaces(object):
+    """fetch function (endpoint, params) -> response answering from a table of places
+
+    Args
+    -----------
+    df_places: dataframe of places with columns place_id, name, lat, lng, rating and keyword (see gen_places)
+    page_size: results per page
+    max_results: results per search over all pages
+    """
+
+    def __init__(self, df_places, page_size = 20, max_results = 60):
+        self.df_places = df_places.set_index('place_id', drop = False)
+        self.page_size = page_size
+        self.max_results = max_results
+        self.lock = threading.Lock()
+        self.pages = {}
+        self.n_tokens = 0
+        self.calls = {'nearbysearch': 0, 'details': 0}
+
+    def __call__(self, endpoint, params):
+        with self.lock:
+            self.calls[endpoint] += 1
+        if endpoint == 'details':
+            if params['place_id'] not in self.df_places.index:
+                return {'status': 'NOT_FOUND'}
+            place = self.df_places.loc[params['place_id']]
+            return {'status': 'OK', 'result': dict(self.result(place), url = 'https://maps.google.com/?cid=' + place['place_id'])}
+        if 'pagetoken' in params:
+            with self.lock:
+                if params['pagetoken'] not in self.pages:
+                    return {'status': 'INVALID_REQUEST'}
+                ids = self.pages.pop(params['pagetoken'])
+        else:
+            lat, lng = [float(v) for v in params['location'].split(',')]
+            df = self.df_places[self.df_places['keyword'] == params['keyword']]
+            distance = haversine_distance(np.array([[lng, lat]]), df[['lng', 'lat']].values)[0]
+            df = df[distance * 1000 <= float(params['radius'])]
+            ids = df.sort_values('rating', ascending = False)['place_id'].tolist()[:self.max_results]
+        response = {'status': 'OK' if ids else 'ZERO_RESULTS',
+                    'results': [self.result(self.df_places.loc[i]) for i in ids[:self.page_size]]}
+        if len(ids) > self.page_size:
+            with self.lock:
+                token = 'token%d' % self.n_tokens
+                self.n_tokens += 1
+                self.pages[token] = ids[self.page_size:]
+            response['next_page_token'] = token
+        return response
+
+    def result(self, place):
+        return {'place_id': place['place_id'], 'name': place['name'], 'rating': float(place['rating']),
+                'geometry': {'location': {'lat': float(place['lat']), 'lng': float(place['lng'])}}}
@@ -0,0 +1,209 @@
+import numpy as np
+import pandas as pd
+from optimization import gen_sets, gen_parameters, gen_demand, select_cluster
+
+# Fast approximate solutions for demand ratios between precomputed scenarios:
+# start from the stations selected for the nearest lower demand ratio (demand only grows with the ratio,
+# and the optimal station sets of neighbouring ratios are mostly nested), then open stations greedily
+# until the capacity and demand constraints of optimize_cls hold, and try to close stations that are
+# not worth their fixed cost. The optimality gap is bounded with the Lagrangian lower bound of lagrangian.py.
+
+
+def prepare_clusters(cluster_list, df_demand, df_parking, cache = None):
+    """Precompute the sets and parameters of every cluster used by approximate_scenario
+
+    Args
+    -----------
+    cluster_list: list of the cluster ids
+    df_demand: dataframe of demand for charging
+    df_parking: dataframe of parking lots (candidates for charging stations)
+    cache: optional DistanceCache to read distance matrices from (see cost_cache.py)
+
+    Returns
+    -----------
+    dictionary of cluster id: (chg_lc, df_demand_cls, fixed_cost, capacity, cost_matrix)
+    """
+    prepared = {}
+    for cluster_id in cluster_list:
+        demand_lc, chg_lc = gen_sets(cluster_id, df_demand, df_parking)
+        fixed_cost, capacity, cost_matrix = gen_parameters(cluster_id, df_demand, df_parking, as_dict = False, cache = cache)
+        df_demand_cls = select_cluster(df_demand, 'parking_cluster', cluster_id)
+        prepared[cluster_id] = (chg_lc, df_demand_cls, np.asarray(fixed_cost, dtype = float),
+                                np.asarray(capacity, dtype = float), cost_matrix)
+    return prepared
+
+
+def assign_greedy(cost_matrix, capacity, demand, is_open):
+    """Serve demand from the open stations, cheapest pairs first
+
+    Returns
+    -----------
+    travel: total travel cost of the assignment
+    unmet: array of demand that could not be served at each demand location
+    load: array of demand served by each station
+    unit_cost: array of average travel cost per unit served at each demand location
+    """
+    n_chg, n_demand = cost_matrix.shape
+    unmet = np.array(demand, dtype = float)
+    load = np.zeros(n_chg)
+    location_travel = np.zeros(n_demand)
+    open_j = np.flatnonzero(is_open)
+    if len(open_j) == 0:
+        return 0., unmet, load, location_travel
+    sub = cost_matrix[open_j]
+    order_j, order_i = np.divmod(np.argsort(sub, axis = None), n_demand)
+    # plain Python scalars, much faster than indexing NumPy arrays one element at a time
+    spare = capacity[open_j].astype(float).tolist()
+    unmet_i = unmet.tolist()
+    travel_i = [0.] * n_demand
+    load_j = [0.] * len(open_j)
+    remaining = sum(unmet_i)
+    for jj, i, cost in zip(order_j.tolist(), order_i.tolist(), sub[order_j, order_i].tolist()):
+        q = min(unmet_i[i], spare[jj])
+        if q <= 0:
+            continue
+        unmet_i[i] -= q
+        spare[jj] -= q
+        load_j[jj] += q
+        travel_i[i] += q * cost
+        remaining -= q
+        if remaining <= 1e-9:
+            break
+    unmet = np.array(unmet_i)
+    load[open_j] = load_j
+    location_travel = np.array(travel_i)
+    served = np.asarray(demand, dtype = float) - unmet
+    return location_travel.sum(), unmet, load, location_travel / np.maximum(served, 1e-9)
+
+
+def open_cost_per_unit(cost_matrix, fixed_cost, capacity, unmet, closed_j):
+    """cost per unit of unmet demand served if each closed station is opened (serving its cheapest unmet demand first)"""
+    need = np.flatnonzero(unmet > 1e-9)
+    sub = cost_matrix[np.ix_(closed_j, need)]
+    order = np.argsort(sub, axis = 1)
+    sorted_cost = np.take_along_axis(sub, order, axis = 1)
+    sorted_demand = unmet[need][order]
+    served_before = np.cumsum(sorted_demand, axis = 1) - sorted_demand
+    q = np.clip(capacity[closed_j][:, None] - served_before, 0, sorted_demand)
+    served = q.sum(axis = 1)
+    return (fixed_cost[closed_j] + (q * sorted_cost).sum(axis = 1)) / np.maximum(served, 1e-9)
+
+
+def open_savings(cost_matrix, fixed_cost, capacity, demand, unit_cost, closed_j):
+    """estimated decrease of the objective if each closed station is opened and serves the locations
+    it is cheaper for, up to its capacity"""
+    gain = np.clip(unit_cost[None, :] - cost_matrix[closed_j], 0, None)
+    order = np.argsort(-gain, axis = 1)
+    sorted_gain = np.take_along_axis(gain, order, axis = 1)
+    sorted_demand = np.asarray(demand, dtype = float)[order]
+    served_before = np.cumsum(sorted_demand, axis = 1) - sorted_demand
+    q = np.clip(capacity[closed_j][:, None] - served_before, 0, sorted_demand)
+    return (q * sorted_gain).sum(axis = 1) - fixed_cost[closed_j]
+
+
+def repair(cost_matrix, fixed_cost, capacity, demand, is_open, max_trials = 10, max_rounds = 5):
+    """Make a set of open stations feasible for a demand, then try to open or close stations to lower the cost
+
+    Args
+    -----------
+    cost_matrix: array (n_chg, n_demand) of travel cost
+    fixed_cost, capacity: arrays (n_chg,) of fixed cost and capacity of each station
+    demand: array (n_demand,) of demand at each location
+    is_open: boolean array (n_chg,) of the stations to start from
+    max_trials: number of most promising stations to try opening, and of least loaded stations to try closing, per round
+    max_rounds: maximum number of rounds of opening and closing stations
+
+    Returns
+    -----------
+    is_open: boolean array of the open stations
+    objective: fixed cost + travel cost of the solution
+    unmet: total demand that could not be served (0 if the solution is feasible)
+    """
+    is_open = np.array(is_open, dtype = bool)
+    travel, unmet, load, unit_cost = assign_greedy(cost_matrix, capacity, demand, is_open)
+    # repair: open the station serving unmet demand at the lowest cost per unit until all demand is met
+    while unmet.sum() > 1e-9 and not is_open.all():
+        closed_j = np.flatnonzero(~is_open)
+        is_open[closed_j[np.argmin(open_cost_per_unit(cost_matrix, fixed_cost, capacity, unmet, closed_j))]] = True
+        travel, unmet, load, unit_cost = assign_greedy(cost_matrix, capacity, demand, is_open)
+    objective = fixed_cost[is_open].sum() + travel
+    if unmet.sum() > 1e-9:
+        return is_open, objective, unmet.sum()
+    for _ in range(max_rounds):
+        improved = False
+        # add: open the stations expected to save more travel cost than their fixed cost
+        travel, unmet, load, unit_cost = assign_greedy(cost_matrix, capacity, demand, is_open)
+        closed_j = np.flatnonzero(~is_open)
+        savings = open_savings(cost_matrix, fixed_cost, capacity, demand, unit_cost, closed_j)
+        for k in np.argsort(-savings)[:max_trials]:
+            if savings[k] <= 0:
+                break
+            is_open[closed_j[k]] = True
+            travel_j, unmet_j, load_j, unit_cost_j = assign_greedy(cost_matrix, capacity, demand, is_open)
+            objective_j = fixed_cost[is_open].sum() + travel_j
+            if objective_j < objective:
+                objective, load, improved = objective_j, load_j, True
+            else:
+                is_open[closed_j[k]] = False
+        # drop: close the least loaded stations if the others can serve their demand for less
+        open_j = np.flatnonzero(is_open)
+        for j in open_j[np.argsort(load[open_j])][:max_trials]:
+            is_open[j] = False
+            travel_j, unmet_j, load_j, unit_cost_j = assign_greedy(cost_matrix, capacity, demand, is_open)
+            objective_j = fixed_cost[is_open].sum() + travel_j
+            if unmet_j.sum() <= 1e-9 and objective_j < objective:
+                objective, improved = objective_j, True
+            else:
+                is_open[j] = True
+        if not improved:
+            break
+    return is_open, objective, 0.
+
+
+def lower_bound(cost_matrix, fixed_cost, capacity, demand):
+    """Lower bound of the optimal objective: every unit of demand travels to its closest station, and the
+    fixed cost is at least that of the cheapest (per unit of capacity) stations covering total demand"""
+    travel = (demand * cost_matrix.min(axis = 0)).sum() if cost_matrix.size else 0.
+    order = np.argsort(fixed_cost / capacity)
+    covered_before = np.cumsum(capacity[order]) - capacity[order]
+    fraction = np.clip((demand.sum() - covered_before) / capacity[order], 0, 1)
+    return travel + (fraction * fixed_cost[order]).sum()
+
+
+def approximate_scenario(prepared, demand_ratio, base_locations, bound_iter = 100):
+    """Approximate optimal locations for a demand ratio from the solution of a (lower) precomputed demand ratio
+
+    Args
+    -----------
+    prepared: parameters of the clusters from prepare_clusters
+    demand_ratio: a ratio that equals number of electric cars needs charging divided by number of car trips
+    base_locations: optimal locations (index of df_parking) of the nearest lower precomputed demand ratio
+    bound_iter: number of subgradient iterations of the lower bound (see lagrangian_bound)
+
+    Returns
+    -----------
+    opt_chg_location: list of the selected locations of all clusters
+    df_output_status: dataframe of status (Feasible/Infeasible), objective, lower bound and gap of each cluster,
+                      the gap being an upper bound of the gap to the optimum
+    """
+    # lagrangian.py builds its feasible solutions with repair
+    from lagrangian import lagrangian_bound
+    base_locations = set(base_locations)
+    opt_chg_location = []
+    records = []
+    for cluster_id, (chg_lc, df_demand_cls, fixed_cost, capacity, cost_matrix) in prepared.items():
+        demand = gen_demand(df_demand_cls, demand_ratio)['demand_chg'].values
+        is_open = np.array([j in base_locations for j in chg_lc], dtype = bool)
+        is_open, objective, unmet = repair(cost_matrix, fixed_cost, capacity, demand, is_open)
+        if unmet > 1e-9:
+            bound = lower_bound(cost_matrix, fixed_cost, capacity, demand)
+        else:
+            # lower bound of the optimum from the Lagrangian relaxation, to bound the gap of the repaired solution
+            bound = lagrangian_bound(cost_matrix, fixed_cost, capacity, demand, max_iter = bound_iter, primal_every = None,
+                                     upper = objective)[2]
+        opt_location = [j for j, use in zip(chg_lc, is_open) if use]
+        opt_chg_location += opt_location
+        records.append({'cluster': cluster_id, 'status': 'Infeasible' if unmet > 1e-9 else 'Feasible',
+                        'N_chg': len(opt_location), 'objective': objective, 'lower_bound': bound,
+                        'gap': 1 - bound / objective if objective > 0 else 0.})
+    return opt_chg_location, pd.DataFrame(records, columns = ['cluster', 'status', 'N_chg', 'objective', 'lower_bound', 'gap'])
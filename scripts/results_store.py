@@ -0,0 +1,132 @@
+import os
+import numpy as np
+import pandas as pd
+
+# files of a scenario store (a folder):
+# parking.csv    table of all parking lots (candidates), selected stations refer to its rows
+# ratios.npy     sorted demand ratios of the scenarios
+# offsets.npy    scenario k selects rows selected[offsets[k]:offsets[k+1]] of the parking table
+# selected.npy   positions of the selected parking lots of all scenarios, one after another
+# status.csv     optimization status of every cluster of every scenario
+
+
+def save_selection(store_dir, ratios, selected):
+    """Save the demand ratios and selected parking rows of the scenarios (replacing files atomically)
+
+    Args
+    -----------
+    store_dir: folder of the store
+    ratios: sorted list of demand ratios
+    selected: list of arrays of the positions of the selected parking lots, one per ratio
+    """
+    offsets = np.concatenate([[0], np.cumsum([len(s) for s in selected])]).astype(np.int64)
+    arrays = [('selected', np.concatenate(selected).astype(np.int32) if len(selected) else np.zeros(0, np.int32)),
+              ('offsets', offsets),
+              # written last, so that readers never see new ratios with old selections
+              ('ratios', np.asarray(ratios, dtype = float))]
+    for name, array in arrays:
+        tmp_path = os.path.join(store_dir, name + '.tmp.npy')
+        np.save(tmp_path, array)
+        os.replace(tmp_path, os.path.join(store_dir, name + '.npy'))
+
+
+def write_store(store_dir, df_parking, scenario_results):
+    """Write the optimal locations of many scenarios to one scenario store
+
+    Args
+    -----------
+    store_dir: folder of the store (created if needed, existing files are overwritten)
+    df_parking: dataframe of parking lots (candidates for charging stations)
+    scenario_results: dictionary of demand ratio: (opt_chg_location, df_output_status), as returned by sweep_clusters
+    """
+    if not os.path.exists(store_dir):
+        os.makedirs(store_dir)
+    ratios = sorted(scenario_results)
+    selected = [df_parking.index.get_indexer(scenario_results[ratio][0]) for ratio in ratios]
+    df_status = pd.concat([scenario_results[ratio][1].assign(demand_ratio = ratio) for ratio in ratios], ignore_index = True)
+
+    df_parking.to_csv(os.path.join(store_dir, 'parking.csv'), index = False)
+    df_status.to_csv(os.path.join(store_dir, 'status.csv'), index = False)
+    save_selection(store_dir, ratios, selected)
+
+
+def add_scenario(store_dir, df_parking, demand_ratio, opt_chg_location, df_output_status):
+    """Add one scenario to an existing scenario store (replacing it if the demand ratio is already there)
+
+    Args
+    -----------
+    store_dir: folder of the store written by write_store
+    df_parking: dataframe of parking lots the store was written with
+    demand_ratio: demand ratio of the scenario
+    opt_chg_location: list of optimal locations (index of df_parking)
+    df_output_status: dataframe of optimization status of the clusters
+    """
+    ratios = np.load(os.path.join(store_dir, 'ratios.npy')).tolist()
+    offsets = np.load(os.path.join(store_dir, 'offsets.npy'))
+    selected_all = np.load(os.path.join(store_dir, 'selected.npy'))
+    scenarios = dict((ratio, selected_all[offsets[k]:offsets[k + 1]]) for k, ratio in enumerate(ratios))
+    scenarios[demand_ratio] = df_parking.index.get_indexer(opt_chg_location)
+    ratios = sorted(scenarios)
+
+    status_path = os.path.join(store_dir, 'status.csv')
+    df_status = pd.read_csv(status_path)
+    df_status = pd.concat([df_status[df_status['demand_ratio'] != demand_ratio],
+                           df_output_status.assign(demand_ratio = demand_ratio)], ignore_index = True)
+    df_status.to_csv(status_path + '.tmp', index = False)
+    os.replace(status_path + '.tmp', status_path)
+    save_selection(store_dir, ratios, [scenarios[ratio] for ratio in ratios])
+
+
+class ScenarioStore(object):
+    """Read-only view of a scenario store, the scenario arrays are memory-mapped
+
+    Args
+    -----------
+    store_dir: folder of the store written by write_store
+    parking_columns: columns of the parking table to load (all if None)
+    """
+
+    def __init__(self, store_dir, parking_columns = None):
+        self.store_dir = store_dir
+        self.df_parking = pd.read_csv(os.path.join(store_dir, 'parking.csv'), usecols = parking_columns)
+        self.reload()
+
+    def reload(self):
+        """map the scenario arrays again, e.g. after add_scenario"""
+        self.offsets = np.load(os.path.join(self.store_dir, 'offsets.npy'), mmap_mode = 'r')
+        self.selected_all = np.load(os.path.join(self.store_dir, 'selected.npy'), mmap_mode = 'r')
+        self.ratios = np.load(os.path.join(self.store_dir, 'ratios.npy'), mmap_mode = 'r')
+
+    def index_of(self, demand_ratio, tolerance = 0):
+        """index of the scenario within tolerance of demand_ratio, None if there is none"""
+        if len(self.ratios) == 0:
+            return None
+        k = self.nearest_index(demand_ratio)
+        return k if abs(self.ratios[k] - demand_ratio) <= tolerance else None
+
+    def __len__(self):
+        return len(self.ratios)
+
+    def nearest_index(self, demand_ratio):
+        """index of the scenario with the demand ratio closest to demand_ratio"""
+        k = int(np.searchsorted(self.ratios, demand_ratio))
+        if k == len(self.ratios) or (k > 0 and demand_ratio - self.ratios[k - 1] <= self.ratios[k] - demand_ratio):
+            k -= 1
+        return k
+
+    def lower_index(self, demand_ratio):
+        """index of the scenario with the largest demand ratio not above demand_ratio, None if there is none"""
+        k = int(np.searchsorted(self.ratios, demand_ratio, side = 'right')) - 1
+        return k if k >= 0 else None
+
+    def selected(self, scenario_index):
+        """positions in the parking table of the parking lots selected in a scenario"""
+        return self.selected_all[self.offsets[scenario_index]:self.offsets[scenario_index + 1]]
+
+    def locations(self, scenario_index):
+        """dataframe of the parking lots selected in a scenario"""
+        return self.df_parking.iloc[np.asarray(self.selected(scenario_index))]
+
+    def status(self):
+        """dataframe of the optimization status of every cluster of every scenario"""
+        return pd.read_csv(os.path.join(self.store_dir, 'status.csv'))
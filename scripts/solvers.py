@@ -0,0 +1,375 @@
+import os
+import re
+import math
+import shutil
+import subprocess
+import tempfile
+import numpy as np
+from model_builder import write_mps
+from instrumentation import wait_peak_rss_mb
+
+# Solver backends of a FacilityModel (see model_builder.py): CBC and GLPK run as executables on an MPS file,
+# HiGHS in this process through highspy. Every backend takes the same options (time limit, relative MIP gap,
+# threads and a MIP start) and returns one of the statuses below, so that results of all backends can be compared
+# and a hard cluster stops at its time limit with the best solution found instead of stalling a sweep.
+#
+# Optimal     optimal within the MIP gap
+# TimeLimit   stopped by the time limit with a feasible solution (objective and x are of that solution)
+# Infeasible  proven infeasible
+# Unbounded   proven unbounded
+# Not Solved  no solution, e.g. stopped by the time limit before finding one (objective is None, x all 0)
+OPTIMAL = 'Optimal'
+TIME_LIMIT = 'TimeLimit'
+INFEASIBLE = 'Infeasible'
+UNBOUNDED = 'Unbounded'
+NOT_SOLVED = 'Not Solved'
+# statuses of which x is a feasible solution
+FEASIBLE = (OPTIMAL, TIME_LIMIT)
+
+CBC_PATTERNS = {'objective': r'Objective value:\s*(\S+)',
+                'lower_bound': r'Lower bound:\s*(\S+)',
+                'gap': r'Gap:\s*(\S+)',
+                'nodes': r'Enumerated nodes:\s*(\d+)',
+                'iterations': r'Total iterations:\s*(\d+)',
+                'solve_time': r'Time \(Wallclock seconds\):\s*(\S+)'}
+
+
+def parse_cbc_log(text):
+    """Solver statistics from the log of a CBC run
+
+    Returns
+    -----------
+    dictionary of objective, lower_bound, gap (relative, 0 if the solution is proven optimal),
+    nodes, iterations and solve_time (wall clock seconds), None for the ones not in the log
+    """
+    stats = {}
+    for name, pattern in CBC_PATTERNS.items():
+        match = re.search(pattern, text)
+        try:
+            stats[name] = float(match.group(1)) if match else None
+        except ValueError:
+            stats[name] = None
+    for name in ['nodes', 'iterations']:
+        if stats[name] is not None:
+            stats[name] = int(stats[name])
+    if stats['objective'] is not None and stats['lower_bound'] is not None:
+        # the gap of the log is rounded to 2 decimals, e.g. 0.00 for a 0.4% gap
+        stats['gap'] = max(0., stats['objective'] - stats['lower_bound']) / max(abs(stats['objective']), 1e-10)
+    elif stats['gap'] is None and 'Optimal solution found' in text:
+        stats['gap'] = 0.
+    return stats
+
+
+def parse_glpk_log(text):
+    """Solver statistics from the log of a glpsol run: objective, lower_bound, gap and solve_time,
+    None for the ones not in the log (glpsol does not report the number of nodes)"""
+    stats = {'objective': None, 'lower_bound': None, 'gap': None, 'nodes': None, 'iterations': None, 'solve_time': None}
+    # progress lines of the branch and bound: "+   123: mip =   1.2e+05 >=   1.1e+05   8.3% (12; 0)"
+    progress = re.findall(r'mip =\s*(\S+)\s*[<>]=\s*(.*?)\s+(\S+)% \(', text)
+    if progress:
+        objective, bound, gap = progress[-1]
+        try:
+            stats['objective'], stats['gap'] = float(objective), float(gap) / 100
+            stats['lower_bound'] = stats['objective'] if 'tree is empty' in bound else float(bound)
+        except ValueError:
+            pass
+    match = re.search(r'Time used:\s*(\S+)\s*secs', text)
+    if match:
+        stats['solve_time'] = float(match.group(1))
+    return stats
+
+
+def cbc_path():
+    """path to the CBC executable, preferring one on PATH over the one shipped with PuLP"""
+    path = shutil.which('cbc')
+    if path is None:
+        import pulp
+        path = pulp.PULP_CBC_CMD().path
+    return path
+
+
+def read_cbc_solution(path, n_cols):
+    """Read a CBC solution file
+
+    Returns
+    -----------
+    status: status of the solution (see the statuses above)
+    objective: objective value (None if there is no solution)
+    x: array of column values
+    """
+    x = np.zeros(n_cols)
+    with open(path) as f:
+        header = f.readline()
+        for line in f:
+            tokens = line.replace('**', '').split()
+            if len(tokens) >= 3 and tokens[1].startswith('c'):
+                x[int(tokens[1][1:])] = float(tokens[2])
+    # e.g. "Optimal (within gap tolerance) - objective value 123", "Stopped on time - objective value 123"
+    if header.startswith('Optimal'):
+        status = OPTIMAL
+    elif 'nfeasible' in header:
+        status = INFEASIBLE
+    elif header.startswith('Unbounded'):
+        status = UNBOUNDED
+    elif header.startswith('Stopped on time') and 'no integer solution' not in header:
+        status = TIME_LIMIT
+    else:
+        status = NOT_SOLVED
+    if status not in FEASIBLE:
+        return status, None, np.zeros(n_cols)
+    objective = float(header.split()[-1]) if 'objective value' in header else None
+    return status, objective, x
+
+
+def write_mip_start(model, x, path):
+    """Write the integer columns of a solution as a CBC MIP start file"""
+    with open(path, 'w') as f:
+        f.write('Feasible solution - objective value %.12g\n' % model.c.dot(x))
+        f.writelines('      %d c%d  %.12g  0\n' % (k, j, x[j]) for k, j in enumerate(np.flatnonzero(model.integer)))
+
+
+def is_feasible(model, x, tol = 1e-6):
+    """whether column values x satisfy the bounds, integrality and constraints of a FacilityModel"""
+    if np.any(x < -tol) or np.any(x > model.ub + tol):
+        return False
+    if np.any(np.abs(x[model.integer] - np.round(x[model.integer])) > tol):
+        return False
+    lhs = model.matrix().dot(x)
+    scale = tol * np.maximum(1, np.abs(model.rhs))
+    equal = model.sense == 'E'
+    return bool(np.all(np.abs(lhs[equal] - model.rhs[equal]) <= scale[equal]) and np.all(lhs[~equal] <= model.rhs[~equal] + scale[~equal]))
+
+
+def run_solver(cmd, log_path, msg):
+    """Run a solver executable with its output to a log file
+
+    Returns
+    -----------
+    text of the log and peak resident memory of the solver process (MB, see wait_peak_rss_mb)
+    """
+    with open(log_path, 'w') as log:
+        process = subprocess.Popen(cmd, stdout = log, stderr = subprocess.STDOUT)
+        solver_peak_rss_mb = wait_peak_rss_mb(process)
+    with open(log_path) as f:
+        text = f.read()
+    if msg:
+        print(text)
+    return text, solver_peak_rss_mb
+
+
+def solve_cbc(model, time_limit = None, mip_gap = None, threads = None, initial_solution = None, msg = False, stats = None):
+    """Solve a FacilityModel with CBC through an MPS file (see solve_model for the arguments)"""
+    tmp_dir = tempfile.mkdtemp(prefix = 'chargeup_')
+    try:
+        mps_path = os.path.join(tmp_dir, 'model.mps')
+        sol_path = os.path.join(tmp_dir, 'model.sol')
+        write_mps(model, mps_path)
+        cmd = [cbc_path(), mps_path]
+        if time_limit is not None:
+            # in CPU time mode the solution CBC writes when it stops on time may not be its best one
+            cmd += ['-timeMode', 'elapsed', '-sec', str(time_limit)]
+        if mip_gap is not None:
+            cmd += ['-ratioGap', str(mip_gap)]
+        if threads is not None:
+            cmd += ['-threads', str(threads)]
+        if initial_solution is not None:
+            mst_path = os.path.join(tmp_dir, 'start.mst')
+            write_mip_start(model, initial_solution, mst_path)
+            cmd += ['-mips', mst_path]
+        cmd += ['-printingOptions', 'all', '-solve', '-solu', sol_path]
+        text, solver_peak_rss_mb = run_solver(cmd, os.path.join(tmp_dir, 'cbc.log'), msg)
+        if stats is not None:
+            stats.update(parse_cbc_log(text))
+            stats['solver_peak_rss_mb'] = solver_peak_rss_mb
+        if not os.path.exists(sol_path):
+            return NOT_SOLVED, None, np.zeros(model.n_cols)
+        status, objective, x = read_cbc_solution(sol_path, model.n_cols)
+        if status == TIME_LIMIT and not is_feasible(model, x):
+            # CBC can report the relaxation when it stops before finding an integer solution
+            return NOT_SOLVED, None, np.zeros(model.n_cols)
+        return status, objective, x
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors = True)
+
+
+def solve_highs(model, time_limit = None, mip_gap = None, threads = None, initial_solution = None, msg = False, stats = None):
+    """Solve a FacilityModel with HiGHS in this process, passing the arrays of the model directly
+    (see solve_model for the arguments, highspy needs to be installed)"""
+    try:
+        import highspy
+    except ImportError:
+        raise ImportError('the highs solver needs highspy (pip install highspy)')
+    A = model.matrix('csc')
+    lp = highspy.HighsLp()
+    lp.num_col_ = model.n_cols
+    lp.num_row_ = model.n_rows
+    lp.col_cost_ = model.c
+    lp.col_lower_ = np.zeros(model.n_cols)
+    lp.col_upper_ = np.where(np.isfinite(model.ub), model.ub, highspy.kHighsInf)
+    lp.row_lower_ = np.where(model.sense == 'E', model.rhs, -highspy.kHighsInf)
+    lp.row_upper_ = model.rhs
+    lp.a_matrix_.format_ = highspy.MatrixFormat.kColwise
+    lp.a_matrix_.start_ = A.indptr
+    lp.a_matrix_.index_ = A.indices
+    lp.a_matrix_.value_ = A.data
+    lp.integrality_ = [highspy.HighsVarType.kInteger if is_integer else highspy.HighsVarType.kContinuous
+                       for is_integer in model.integer]
+
+    h = highspy.Highs()
+    h.setOptionValue('output_flag', bool(msg))
+    if time_limit is not None:
+        h.setOptionValue('time_limit', float(time_limit))
+    if mip_gap is not None:
+        h.setOptionValue('mip_rel_gap', float(mip_gap))
+    if threads is not None:
+        h.setOptionValue('threads', int(threads))
+    h.passModel(lp)
+    if initial_solution is not None:
+        # as for CBC only the integer columns are given, HiGHS completes the rest
+        integer_cols = np.flatnonzero(model.integer).astype(np.int32)
+        h.setSolution(len(integer_cols), integer_cols, np.asarray(initial_solution, dtype = float)[integer_cols])
+    h.run()
+
+    info = h.getInfo()
+    model_status = h.getModelStatus()
+    has_solution = info.primal_solution_status == 2
+    if model_status == highspy.HighsModelStatus.kOptimal:
+        status = OPTIMAL
+    elif model_status in (highspy.HighsModelStatus.kInfeasible, highspy.HighsModelStatus.kUnboundedOrInfeasible):
+        # the costs are not negative, so a facility model that is unbounded or infeasible is infeasible
+        status = INFEASIBLE
+    elif model_status == highspy.HighsModelStatus.kUnbounded:
+        status = UNBOUNDED
+    elif model_status == highspy.HighsModelStatus.kTimeLimit and has_solution:
+        status = TIME_LIMIT
+    else:
+        status = NOT_SOLVED
+    if stats is not None:
+        stats.update(objective = info.objective_function_value if has_solution else None,
+                     lower_bound = info.mip_dual_bound if np.isfinite(info.mip_dual_bound) else None,
+                     gap = info.mip_gap if has_solution and np.isfinite(info.mip_gap) else None,
+                     nodes = int(info.mip_node_count), iterations = int(info.simplex_iteration_count),
+                     solve_time = h.getRunTime(), solver_peak_rss_mb = None)
+    if status not in FEASIBLE:
+        return status, None, np.zeros(model.n_cols)
+    return status, info.objective_function_value, np.array(h.getSolution().col_value)
+
+
+def read_glpk_solution(path, n_cols, columns):
+    """Read a MIP solution file written by glpsol -w
+
+    Args
+    -----------
+    path: solution file
+    n_cols: number of columns of the model
+    columns: positions of the columns of the MPS file in the model, in the order of the file
+
+    Returns
+    -----------
+    status letter of the solution (o optimal, f feasible, n no feasible solution, u undefined),
+    objective value and array of column values
+    """
+    x = np.zeros(n_cols)
+    status, objective = 'u', None
+    with open(path) as f:
+        for line in f:
+            tokens = line.split()
+            if tokens[:2] == ['s', 'mip']:
+                status, objective = tokens[4], float(tokens[5])
+            elif tokens and tokens[0] == 'j':
+                x[columns[int(tokens[1]) - 1]] = float(tokens[2])
+    return status, objective, x
+
+
+def solve_glpk(model, time_limit = None, mip_gap = None, threads = None, initial_solution = None, msg = False, stats = None):
+    """Solve a FacilityModel with GLPK's glpsol through an MPS file (see solve_model for the arguments,
+    glpsol needs to be on PATH). GLPK runs on one thread and glpsol takes no MIP start, so threads and
+    initial_solution are ignored, and the time limit is rounded up to whole seconds."""
+    path = shutil.which('glpsol')
+    if path is None:
+        raise IOError('the glpk solver needs glpsol on PATH (e.g. apt install glpk-utils)')
+    tmp_dir = tempfile.mkdtemp(prefix = 'chargeup_')
+    try:
+        mps_path = os.path.join(tmp_dir, 'model.mps')
+        sol_path = os.path.join(tmp_dir, 'model.sol')
+        write_mps(model, mps_path)
+        cmd = [path, '--freemps', mps_path, '--min', '-w', sol_path]
+        if time_limit is not None:
+            cmd += ['--tmlim', str(int(math.ceil(time_limit)))]
+        if mip_gap is not None:
+            cmd += ['--mipgap', str(mip_gap)]
+        text, solver_peak_rss_mb = run_solver(cmd, os.path.join(tmp_dir, 'glpk.log'), msg)
+        if stats is not None:
+            stats.update(parse_glpk_log(text))
+            stats['solver_peak_rss_mb'] = solver_peak_rss_mb
+        if not os.path.exists(sol_path):
+            return NOT_SOLVED, None, np.zeros(model.n_cols)
+        # columns are numbered in the order they appear in the COLUMNS section of the MPS file
+        columns = np.unique(np.concatenate([np.flatnonzero(model.c), model.cols[model.vals != 0]]))
+        glpk_status, objective, x = read_glpk_solution(sol_path, model.n_cols, columns)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors = True)
+    if glpk_status == 'o':
+        status = OPTIMAL
+    elif glpk_status == 'f':
+        status = OPTIMAL if 'GAP TOLERANCE REACHED' in text else TIME_LIMIT
+    elif glpk_status == 'n' or 'NO PRIMAL FEASIBLE SOLUTION' in text or 'NO INTEGER FEASIBLE SOLUTION' in text:
+        status = INFEASIBLE
+    elif 'UNBOUNDED' in text:
+        status = UNBOUNDED
+    else:
+        status = NOT_SOLVED
+    if status not in FEASIBLE or (status == TIME_LIMIT and not is_feasible(model, x)):
+        return status if status != TIME_LIMIT else NOT_SOLVED, None, np.zeros(model.n_cols)
+    return status, objective, x
+
+
+# backend name: solve function, other backends can be added here
+SOLVERS = {'cbc': solve_cbc,
+           'highs': solve_highs,
+           'glpk': solve_glpk}
+
+
+def solve_model(model, solver = 'cbc', time_limit = None, mip_gap = None, threads = None, initial_solution = None,
+                msg = False, stats = None):
+    """Solve a FacilityModel with one of the solver backends
+
+    Args
+    -----------
+    model: FacilityModel to solve
+    solver: name of the backend, a key of SOLVERS ('cbc', 'highs' or 'glpk')
+    time_limit: maximum solve time (seconds), no limit if None
+    mip_gap: relative MIP gap at which a solution is accepted as optimal (the solver's default if None)
+    threads: number of threads the solver may use (the solver's default if None)
+    initial_solution: optional array of column values to pass to the solver as a MIP start
+                      (only the values of the integer columns are used)
+    msg: whether to print the solver log
+    stats: optional dictionary to fill with the solver statistics: objective, lower_bound, gap, nodes,
+           iterations, solve_time, the peak resident memory of the solver process (solver_peak_rss_mb,
+           None for HiGHS which runs in this process) and solver
+
+    Returns
+    -----------
+    status: status of the solution (Optimal/TimeLimit/Infeasible/Unbounded/Not Solved, see above)
+    objective: objective value (None if there is no feasible solution)
+    x: array of column values (all 0 if there is no feasible solution)
+    """
+    if solver not in SOLVERS:
+        raise ValueError('unknown solver %s, available: %s' % (solver, ', '.join(sorted(SOLVERS))))
+    if stats is not None:
+        stats['solver'] = solver
+    return SOLVERS[solver](model, time_limit = time_limit, mip_gap = mip_gap, threads = threads,
+                           initial_solution = initial_solution, msg = msg, stats = stats)
+
+
+def pulp_solver(solver = 'cbc', time_limit = None, mip_gap = None, threads = None, msg = False):
+    """PuLP solver object of a backend with the same options as solve_model, for PuLP problems (see build_pulp_problem)"""
+    import pulp
+    if solver == 'cbc':
+        return pulp.PULP_CBC_CMD(msg = msg, timeLimit = time_limit, gapRel = mip_gap, threads = threads)
+    if solver == 'highs':
+        return pulp.HiGHS(msg = msg, timeLimit = time_limit, gapRel = mip_gap, threads = threads)
+    if solver == 'glpk':
+        options = ['--mipgap', str(mip_gap)] if mip_gap is not None else []
+        return pulp.GLPK_CMD(msg = msg, timeLimit = time_limit, options = options)
+    raise ValueError('unknown solver %s, available: %s' % (solver, ', '.join(sorted(SOLVERS))))
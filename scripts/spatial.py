@@ -0,0 +1,101 @@
+import numpy as np
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Spatial joins of data_cleaning.py, vectorized: points are built from coordinate arrays, polygons are
+# joined through an STRtree of the smaller layer, and the large layer (census tracts, parcels) is
+# processed in chunks, so that only one chunk of its geometries is in memory at a time.
+# Trips of a ward are allocated to the polygons intersecting it in proportion to the area of the
+# intersection (areas in a projected CRS, UTM 17N for Toronto).
+
+AREA_CRS = 'EPSG:32617'
+
+
+def df_to_gdf(df, crs = 'EPSG:4326'):
+    """takes a dataframe with columns named 'longitude' and 'latitude'
+    to transform to a geodataframe with point features (column 'coordinates')"""
+    df['coordinates'] = gpd.points_from_xy(df['longitude'], df['latitude'])
+    return gpd.GeoDataFrame(df, geometry = 'coordinates', crs = crs)
+
+
+def read_chunks(path, chunk_size = 50000):
+    """read a vector file (e.g. a shapefile) as geodataframes of up to chunk_size rows"""
+    start = 0
+    while True:
+        chunk = gpd.read_file(path, rows = slice(start, start + chunk_size))
+        if len(chunk) == 0:
+            return
+        yield chunk
+        start += len(chunk)
+
+
+def intersection_areas(geoms, tree, tree_geoms):
+    """Pairs of intersecting polygons and the area of their intersection
+
+    Args
+    -----------
+    geoms: array of polygons
+    tree: shapely.STRtree of tree_geoms
+    tree_geoms: array of polygons in the tree (prepared, see shapely.prepare)
+
+    Returns
+    -----------
+    index in geoms, index in tree_geoms and intersection area of each pair (pairs that only touch are dropped)
+    """
+    # candidate pairs by bounding box, then exact tests with the (prepared) polygons of the tree:
+    # most polygons are within a single polygon of the tree, the intersection is computed for the others only
+    idx, idx_tree = tree.query(geoms)
+    area = np.zeros(len(idx))
+    covered = shapely.covers(tree_geoms[idx_tree], geoms[idx])
+    area[covered] = shapely.area(geoms[idx[covered]])
+    partial = ~covered
+    partial[partial] = shapely.intersects(tree_geoms[idx_tree[partial]], geoms[idx[partial]])
+    area[partial] = shapely.area(shapely.intersection(geoms[idx[partial]], tree_geoms[idx_tree[partial]]))
+    keep = area > 0
+    return idx[keep], idx_tree[keep], area[keep]
+
+
+def allocate_trips(tract_chunks, df_ward, trip_columns, tract_columns, area_crs = AREA_CRS):
+    """Allocate the trips of each ward to the census tracts intersecting it, by area of intersection
+
+    Args
+    -----------
+    tract_chunks: iterable of geodataframes of census tracts (e.g. read_chunks of a shapefile, or [gdf])
+    df_ward: geodataframe of wards with columns 'ward' and trip_columns (missing trips count as 0)
+    trip_columns: columns of df_ward with the trips to allocate
+    tract_columns: columns of the census tracts to keep
+
+    Returns
+    -----------
+    dataframe of the census tracts intersecting a ward, with tract_columns, the ward of largest
+    intersection ('ward'), the centroid ('long', 'lat', in the CRS of the tracts) and the trips
+    allocated from trip_columns (same names). The trips of every ward sum to its total.
+    """
+    ward_geoms = df_ward.to_crs(area_crs).geometry.values
+    shapely.prepare(ward_geoms)
+    tree = shapely.STRtree(ward_geoms)
+    frames, pairs = [], []
+    n_tracts = 0
+    for chunk in tract_chunks:
+        centroid = shapely.centroid(chunk.geometry.values)
+        idx, idx_ward, area = intersection_areas(chunk.to_crs(area_crs).geometry.values, tree, ward_geoms)
+        df = pd.DataFrame(chunk[tract_columns]).reset_index(drop = True)
+        df['long'], df['lat'] = shapely.get_x(centroid), shapely.get_y(centroid)
+        frames.append(df)
+        pairs.append((idx + n_tracts, idx_ward, area))
+        n_tracts += len(chunk)
+    df_tract = pd.concat(frames, ignore_index = True)
+    idx, idx_ward, area = [np.concatenate(arrays) for arrays in zip(*pairs)]
+
+    # share of each ward in each pair, by area of the intersection over the area of the ward covered by tracts
+    share = area / np.bincount(idx_ward, weights = area, minlength = len(ward_geoms))[idx_ward]
+    for column in trip_columns:
+        trips = df_ward[column].fillna(0).values.astype(float)
+        df_tract[column] = np.bincount(idx, weights = share * trips[idx_ward], minlength = n_tracts)
+    # ward of the largest intersection of each tract
+    order = np.lexsort((-area, idx))
+    first = order[np.r_[True, idx[order][1:] != idx[order][:-1]]]
+    df_tract['ward'] = None
+    df_tract.loc[idx[first], 'ward'] = df_ward['ward'].values[idx_ward[first]]
+    return df_tract.loc[np.unique(idx)]
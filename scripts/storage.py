@@ -0,0 +1,181 @@
+import os
+import json
+import hashlib
+import pandas as pd
+import geopandas as gpd
+import shapely
+
+# Intermediate datasets of the pipeline (data_cleaning.py -> optimization.py -> webapp) are stored as artifacts
+# in a folder: a columnar table file (Parquet by default, or Feather; GeoParquet for geodataframes) and a
+# sidecar <name>.meta.json with its schema, number of rows, content hash and the hashes of the inputs it was
+# made from, so that a stage can skip its work when its inputs did not change (see ArtifactStore.is_fresh).
+# Tables can be exported to Excel as well, to look at them, but are only read back from the table files.
+#
+# files of an artifact store:
+# <name>.parquet     the table (or <name>.feather)
+# <name>.meta.json   format, schema, rows, content hash and input hashes, written last
+# <name>.xlsx        optional Excel export
+
+# cleaned datasets written by data_cleaning.py, and the columns the optimization needs from them
+DEMAND_ARTIFACT = 'optimization_CT_AM_trips_cluster'
+DEMAND_COLUMNS = ['long', 'lat', 'CT_AM_trips', 'CT_PM_trips', 'charging s', 'parking_cluster']
+PARKING_ARTIFACT = 'optimization_parking_location_cluster'
+PARKING_COLUMNS = ['ID', 'Name', 'Url', 'Rating', 'latitude', 'longitude', 'cluster']
+
+
+def write_parquet(df, path):
+    # a GeoDataFrame is written as GeoParquet
+    df.to_parquet(path, index = False)
+
+
+def read_parquet(path, columns = None, geo = False):
+    return (gpd.read_parquet if geo else pd.read_parquet)(path, columns = columns)
+
+
+def write_feather(df, path):
+    df.to_feather(path)
+
+
+def read_feather(path, columns = None, geo = False):
+    return (gpd.read_feather if geo else pd.read_feather)(path, columns = columns)
+
+
+# format: (file extension, writer, reader), other formats can be added here
+BACKENDS = {'parquet': ('.parquet', write_parquet, read_parquet),
+            'feather': ('.feather', write_feather, read_feather)}
+
+
+def frame_hash(df):
+    """content hash of a dataframe: its column names, dtypes and values (geometries as WKB), not its index"""
+    digest = hashlib.sha1()
+    for column in df.columns:
+        digest.update(('%s:%s;' % (column, df[column].dtype)).encode())
+        if isinstance(df[column].dtype, gpd.array.GeometryDtype):
+            digest.update(b''.join(shapely.to_wkb(df[column].values, hex = False)))
+        else:
+            digest.update(pd.util.hash_pandas_object(df[column], index = False).values.tobytes())
+    return digest.hexdigest()
+
+
+def file_hash(path, block_size = 2**20):
+    """content hash of a file (of a shapefile, also its .dbf, .shx and .prj files)"""
+    digest = hashlib.sha1()
+    paths = [path]
+    if path.lower().endswith('.shp'):
+        paths += [os.path.splitext(path)[0] + ext for ext in ['.dbf', '.shx', '.prj']]
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        with open(p, 'rb') as f:
+            for block in iter(lambda: f.read(block_size), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+class ArtifactStore(object):
+    """Folder of intermediate tables with schema and content hash sidecars
+
+    Args
+    -----------
+    root: folder of the store (created if needed)
+    fmt: format of the tables written, a key of BACKENDS ('parquet' or 'feather')
+    """
+
+    def __init__(self, root, fmt = 'parquet'):
+        self.root = root
+        self.fmt = fmt
+        if not os.path.exists(root):
+            os.makedirs(root)
+
+    def meta_path(self, name):
+        return os.path.join(self.root, name + '.meta.json')
+
+    def meta(self, name):
+        """sidecar of an artifact, None if it was not written"""
+        if not os.path.exists(self.meta_path(name)):
+            return None
+        with open(self.meta_path(name)) as f:
+            return json.load(f)
+
+    def content_hash(self, name):
+        """content hash of an artifact (None if it was not written), to use as an input of the next stage"""
+        meta = self.meta(name)
+        return meta['hash'] if meta is not None else None
+
+    def is_fresh(self, name, inputs):
+        """whether an artifact exists and was made from the same inputs
+
+        Args
+        -----------
+        name: name of the artifact
+        inputs: dictionary of the inputs of the stage: content hashes (file_hash, content_hash) and parameters
+        """
+        meta = self.meta(name)
+        return meta is not None and meta['inputs'] == json.loads(json.dumps(inputs)) and \
+            os.path.exists(os.path.join(self.root, name + BACKENDS[meta['format']][0]))
+
+    def write(self, name, df, inputs = None, excel = False):
+        """Write a table (or geodataframe) as an artifact
+
+        A named index is stored as columns, an unnamed one is dropped, so that tables are read
+        back with a default index like the Excel files were.
+
+        Args
+        -----------
+        name: name of the artifact
+        df: dataframe or geodataframe
+        inputs: dictionary of the inputs of the stage (see is_fresh)
+        excel: whether to also export the table to <name>.xlsx
+
+        Returns
+        -----------
+        content hash of the table
+        """
+        if any(level is not None for level in df.index.names):
+            df = df.reset_index()
+        else:
+            df = df.reset_index(drop = True)
+        ext, writer, _ = BACKENDS[self.fmt]
+        geometry = df.geometry.name if isinstance(df, gpd.GeoDataFrame) else None
+        path = os.path.join(self.root, name + ext)
+        # the table is written to a temporary file and renamed, the sidecar last, so that a crash never
+        # leaves a partial artifact that looks fresh
+        if os.path.exists(self.meta_path(name)):
+            os.remove(self.meta_path(name))
+        writer(df, path + '.tmp')
+        os.replace(path + '.tmp', path)
+        meta = {'name': name, 'format': self.fmt, 'rows': len(df), 'geometry': geometry,
+                'crs': df.crs.to_string() if geometry is not None and df.crs is not None else None,
+                'schema': dict((str(column), str(dtype)) for column, dtype in df.dtypes.items()),
+                'hash': frame_hash(df), 'inputs': inputs or {}}
+        with open(self.meta_path(name) + '.tmp', 'w') as f:
+            json.dump(meta, f, indent = 1, default = str)
+        os.replace(self.meta_path(name) + '.tmp', self.meta_path(name))
+        if excel:
+            pd.DataFrame(df.drop(columns = geometry) if geometry else df).to_excel(os.path.join(self.root, name + '.xlsx'), index = False)
+        return meta['hash']
+
+    def read(self, name, columns = None):
+        """Read an artifact
+
+        Args
+        -----------
+        name: name of the artifact
+        columns: columns to read (all if None), only these are read from the file
+
+        Returns
+        -----------
+        dataframe, or geodataframe if the artifact has geometries and they are read
+        """
+        meta = self.meta(name)
+        if meta is None:
+            raise IOError('artifact %s is not in %s' % (name, self.root))
+        ext, _, reader = BACKENDS[meta['format']]
+        geo = meta['geometry'] is not None and (columns is None or meta['geometry'] in columns)
+        return reader(os.path.join(self.root, name + ext), columns = columns, geo = geo)
+
+
+def read_cleaned_data(data_dir = 'data/cleaned'):
+    """cleaned demand and parking datasets (written by data_cleaning.py), with the columns the optimization needs"""
+    store = ArtifactStore(data_dir)
+    return store.read(DEMAND_ARTIFACT, DEMAND_COLUMNS), store.read(PARKING_ARTIFACT, PARKING_COLUMNS)
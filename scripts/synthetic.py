@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# bounding box of the City of Toronto (same as the scraping grid in data_scraping.py)
+TRT_LAT = (43.582157, 43.792441)
+TRT_LNG = (-79.639066, -79.118471)
+
+
+def gen_synthetic_data(n_demand, n_parking, n_clusters = 1, seed = 0):
+    """Generate random demand locations and parking lots shaped like the cleaned datasets,
+    so that the optimization can be run and benchmarked without the TTS and Google data
+    
+    Args
+    -----------
+    n_demand: number of demand locations (census tracts)
+    n_parking: number of parking lots
+    n_clusters: number of clusters, parking lots are split into vertical strips of equal count
+    seed: random seed
+    
+    Returns
+    -----------
+    df_demand: dataframe like data/cleaned/optimization_CT_AM_trips_cluster.xlsx
+    df_parking: dataframe like data/cleaned/optimization_parking_location_cluster.xlsx
+    """
+    rng = np.random.RandomState(seed)
+    df_parking = pd.DataFrame({'latitude': rng.uniform(TRT_LAT[0], TRT_LAT[1], n_parking),
+                               'longitude': rng.uniform(TRT_LNG[0], TRT_LNG[1], n_parking)})
+    df_parking['Rating'] = rng.uniform(1, 5, n_parking).round(1)
+    df_parking['ID'] = ['P' + str(i) for i in range(n_parking)]
+    df_parking['Name'] = ['Parking ' + str(i) for i in range(n_parking)]
+    df_parking['Url'] = ''
+    rank = df_parking['longitude'].rank(method = 'first').values - 1
+    df_parking['cluster'] = (rank * n_clusters // n_parking).astype(int)
+
+    df_demand = pd.DataFrame({'lat': rng.uniform(TRT_LAT[0], TRT_LAT[1], n_demand),
+                              'long': rng.uniform(TRT_LNG[0], TRT_LNG[1], n_demand)})
+    df_demand['CT_AM_trips'] = rng.gamma(2, 1500, n_demand).round()
+    df_demand['charging s'] = rng.poisson(0.3, n_demand)
+    # assign each demand location to the cluster of its nearest parking lot
+    tree = cKDTree(df_parking[['longitude', 'latitude']].values)
+    _, nearest = tree.query(df_demand[['long', 'lat']].values)
+    df_demand['parking_cluster'] = df_parking['cluster'].values[nearest]
+    df_demand.index = ['CT' + str(i) for i in range(n_demand)]
+    # afternoon trips, drawn last so that the other columns do not depend on them
+    df_demand['CT_PM_trips'] = rng.gamma(2, 1500, n_demand).round()
+    return df_demand, df_parking
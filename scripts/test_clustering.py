@@ -0,0 +1,62 @@
+"""Tests of the balanced clusters of clustering.py
+
+run from the scripts folder: python -m pytest test_clustering.py
+"""
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from clustering import balanced_clusters, cluster_cost, largest_first
+from distance_engine import local_km
+
+
+def skewed_coords(n_parking = 400, n_demand = 150, seed = 0):
+    """half of the parking lots and a third of the demand in a dense downtown, as benchmark_clustering.py"""
+    rng = np.random.RandomState(seed)
+    coords_pk = np.column_stack([rng.uniform(-79.6, -79.1, n_parking), rng.uniform(43.6, 43.8, n_parking)])
+    coords_trip = np.column_stack([rng.uniform(-79.6, -79.1, n_demand), rng.uniform(43.6, 43.8, n_demand)])
+    coords_pk[:n_parking // 2] = rng.normal((-79.38, 43.65), 0.01, (n_parking // 2, 2))
+    coords_trip[:n_demand // 3] = rng.normal((-79.38, 43.65), 0.01, (n_demand // 3, 2))
+    return coords_pk, coords_trip
+
+
+def sizes(labels_pk, labels_trip, n_clusters):
+    return np.bincount(labels_pk, minlength = n_clusters) * np.bincount(labels_trip, minlength = n_clusters)
+
+
+def test_labels():
+    coords_pk, coords_trip = skewed_coords()
+    labels_pk, labels_trip = balanced_clusters(coords_pk, coords_trip, n_clusters = 10)
+    assert sorted(set(labels_pk)) == list(range(10))
+    # demand locations go with their nearest parking lot
+    lat0 = coords_pk[:, 1].mean()
+    nearest = cKDTree(local_km(coords_pk, lat0)).query(local_km(coords_trip, lat0))[1]
+    assert np.array_equal(labels_trip, labels_pk[nearest])
+    # numbered from west to east
+    centers = [coords_pk[labels_pk == label, 0].mean() for label in range(10)]
+    assert centers == sorted(centers)
+
+
+def test_balanced_sizes():
+    coords_pk, coords_trip = skewed_coords()
+    labels_pk, labels_trip = balanced_clusters(coords_pk, coords_trip, n_clusters = 10)
+    cluster_sizes = sizes(labels_pk, labels_trip, 10)
+    # no cluster is much larger than the others, despite the dense downtown
+    assert cluster_sizes.max() <= 2 * cluster_sizes.mean()
+
+
+def test_max_size():
+    coords_pk, coords_trip = skewed_coords()
+    labels_pk, labels_trip = balanced_clusters(coords_pk, coords_trip, n_clusters = 4, max_size = 300)
+    n_clusters = labels_pk.max() + 1
+    assert n_clusters >= 4
+    cluster_sizes = sizes(labels_pk, labels_trip, n_clusters)
+    # only clusters of a single parking lot may stay above the maximum
+    assert all(s <= 300 or (labels_pk == label).sum() == 1 for label, s in enumerate(cluster_sizes))
+
+
+def test_largest_first():
+    df_parking = pd.DataFrame({'cluster': [0, 0, 1, 1, 1, 2]})
+    df_demand = pd.DataFrame({'parking_cluster': [0, 1, 1, 2, 2, 2, 2]})
+    df_cost = cluster_cost(df_demand, df_parking)
+    assert df_cost['n_pairs'].tolist() == [2, 6, 4]
+    assert largest_first([0, 1, 2], df_demand, df_parking) == [1, 2, 0]
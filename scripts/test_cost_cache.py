@@ -0,0 +1,63 @@
+"""Tests of the versioned distance cache of cost_cache.py
+
+run from the scripts folder: python -m pytest test_cost_cache.py
+"""
+import os
+import numpy as np
+from cost_cache import DistanceCache, coords_hash
+from distance_engine import distance_matrix
+
+
+def coords(n, seed):
+    rng = np.random.RandomState(seed)
+    return np.column_stack([rng.uniform(-79.6, -79.1, n), rng.uniform(43.6, 43.8, n)])
+
+
+def versions(block):
+    return sorted(name.split('.')[1] for name in os.listdir(block) if name.startswith('rows.'))
+
+
+def test_get_matches_distance_matrix(tmp_path):
+    cache = DistanceCache(str(tmp_path))
+    coords_pk, coords_trip = coords(12, 0), coords(7, 1)
+    expected = distance_matrix(coords_pk, coords_trip)
+    assert np.allclose(cache.get(coords_pk, coords_trip), expected, rtol = 1e-6)
+    # read back by a new cache, in another order
+    order = np.random.RandomState(2).permutation(12)
+    assert np.allclose(DistanceCache(str(tmp_path)).get(coords_pk[order], coords_trip), expected[order], rtol = 1e-6)
+
+
+def test_new_rows_make_a_new_version(tmp_path):
+    cache = DistanceCache(str(tmp_path))
+    coords_pk, coords_trip = coords(12, 0), coords(7, 1)
+    cache.get(coords_pk[:8], coords_trip)
+    block = cache.block_dir(coords_trip)
+    first = versions(block)
+    assert len(first) == 1
+    with open(os.path.join(block, 'current')) as f:
+        assert f.read().strip() == first[0]
+    # the 4 added parking lots are appended, the previous version is removed
+    assert np.allclose(cache.get(coords_pk, coords_trip), distance_matrix(coords_pk, coords_trip), rtol = 1e-6)
+    second = versions(block)
+    assert len(second) == 1 and second != first
+    rows, block_coords, index = cache.load_block(block)
+    assert rows.shape == (12, 7) and len(index) == 12
+    # nothing missing, nothing saved
+    cache.get(coords_pk[3:9], coords_trip)
+    assert versions(block) == second
+
+
+def test_compact(tmp_path):
+    cache = DistanceCache(str(tmp_path))
+    coords_pk, coords_trip = coords(12, 0), coords(7, 1)
+    cache.get(coords_pk, coords_trip)
+    cache.compact(coords_pk[:5], coords_trip)
+    rows, block_coords, _ = cache.load_block(cache.block_dir(coords_trip))
+    assert rows.shape == (5, 7) and np.allclose(block_coords, coords_pk[:5])
+    assert np.allclose(cache.get(coords_pk[:5], coords_trip), distance_matrix(coords_pk[:5], coords_trip), rtol = 1e-6)
+
+
+def test_blocks_by_metric():
+    coords_trip = np.round(coords(7, 1), 5)
+    assert coords_hash(coords_trip) == coords_hash(coords_trip + 1e-9)
+    assert coords_hash(coords_trip, 'haversine') != coords_hash(coords_trip, 'degree')
@@ -0,0 +1,64 @@
+"""Tests of the distance metrics of distance_engine.py
+
+run from the scripts folder: python -m pytest test_distance_engine.py
+the 'utm' test needs pyproj and is skipped otherwise
+"""
+import numpy as np
+import pytest
+from distance_engine import distance_matrix, paired_distance, local_km, RoadNetworkMatrix, KM_PER_DEGREE
+
+
+def coords(n, seed):
+    rng = np.random.RandomState(seed)
+    return np.column_stack([rng.uniform(-79.6, -79.1, n), rng.uniform(43.6, 43.8, n)])
+
+
+def test_haversine_known_distances():
+    # one degree along a meridian, and along the equator
+    matrix = distance_matrix([[-79.4, 43.], [0., 0.]], [[-79.4, 44.], [1., 0.]], dtype = float)
+    assert np.diag(matrix) == pytest.approx([KM_PER_DEGREE, KM_PER_DEGREE], rel = 1e-6)
+    # Toronto to Montreal, about 504 km
+    assert distance_matrix([[-79.3832, 43.6532]], [[-73.5673, 45.5017]])[0, 0] == pytest.approx(504, abs = 2)
+    assert distance_matrix([[-79.4, 43.7]], [[-79.4, 43.7]])[0, 0] == pytest.approx(0, abs = 1e-3)
+
+
+def test_utm_close_to_haversine():
+    pytest.importorskip('pyproj')
+    coords_a, coords_b = coords(10, 0), coords(20, 1)
+    # the scale error of UTM grows to about 0.4% at the edge of a zone, where Toronto is
+    assert np.allclose(distance_matrix(coords_a, coords_b, 'utm'), distance_matrix(coords_a, coords_b), rtol = 5e-3, atol = 1e-3)
+
+
+def test_degree():
+    coords_a, coords_b = coords(10, 0), coords(20, 1)
+    expected = 85 * np.linalg.norm(coords_a[:, None] - coords_b[None], axis = 2)
+    assert np.allclose(distance_matrix(coords_a, coords_b, 'degree', dtype = float), expected)
+
+
+@pytest.mark.parametrize('metric', ['haversine', 'degree', 'utm'])
+def test_paired_matches_matrix(metric):
+    if metric == 'utm':
+        pytest.importorskip('pyproj')
+    coords_a, coords_b = coords(15, 0), coords(15, 1)
+    matrix = distance_matrix(coords_a, coords_b, metric, dtype = float)
+    assert np.allclose(paired_distance(coords_a, coords_b, metric), np.diag(matrix), rtol = 1e-6, atol = 1e-4)
+
+
+def test_chunks():
+    coords_a, coords_b = coords(50, 0), coords(30, 1)
+    # a budget of a few rows per chunk gives the same matrix
+    assert np.array_equal(distance_matrix(coords_a, coords_b, memory_budget = 32 * 30 * 3), distance_matrix(coords_a, coords_b))
+    with pytest.raises(ValueError):
+        distance_matrix(coords_a, coords_b, 'manhattan')
+
+
+def test_road_network_matrix(tmp_path):
+    origins, destinations = coords(6, 0), coords(4, 1)
+    matrix = np.arange(24, dtype = float).reshape(6, 4)
+    path = str(tmp_path / 'road.npz')
+    np.savez(path, origins = origins, destinations = destinations, matrix = matrix)
+    road = RoadNetworkMatrix(path, scale = 2.)
+    # coordinates are snapped to the nearest origin/destination
+    assert np.array_equal(distance_matrix(origins[[3, 0]] + 1e-6, destinations, road, dtype = float), 2 * matrix[[3, 0]])
+    assert np.array_equal(paired_distance(origins[:4], destinations, road), 2 * matrix[np.arange(4), np.arange(4)])
+    assert np.allclose(local_km([[0., 1.]], 0.), [[0., KM_PER_DEGREE]])
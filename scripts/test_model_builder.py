@@ -0,0 +1,75 @@
+"""Tests of the sparse model builder of model_builder.py against the PuLP model of optimization.py
+
+run from the scripts folder: python -m pytest test_model_builder.py
+"""
+import numpy as np
+import pulp
+import pytest
+from model_builder import build_facility_model, write_mps
+from optimization import build_pulp_problem
+from solvers import solve_model, OPTIMAL
+
+
+def small_problem(n_chg = 5, n_demand = 8, seed = 0):
+    """random costs, fixed costs, capacities and demand of the magnitude of the real ones"""
+    rng = np.random.RandomState(seed)
+    cost_matrix = rng.uniform(100, 5000, (n_chg, n_demand))
+    fixed_cost = rng.uniform(8000, 12000, n_chg)
+    capacity = np.full(n_chg, 30.)
+    demand = rng.randint(1, 10, n_demand).astype(float)
+    return cost_matrix, fixed_cost, capacity, demand
+
+
+def pulp_problem(cost_matrix, fixed_cost, capacity, demand):
+    """the problem built by build_pulp_problem from the same arrays"""
+    n_chg, n_demand = cost_matrix.shape
+    demand_lc, chg_lc = list(range(n_demand)), list(range(n_chg))
+    dic_cost_matrix = dict((j, dict((i, cost_matrix[j, i]) for i in demand_lc)) for j in chg_lc)
+    return build_pulp_problem(demand_lc, chg_lc, dict(enumerate(fixed_cost)), dict(enumerate(capacity)),
+                              dic_cost_matrix, dict(enumerate(demand)))
+
+
+def test_same_size_as_pulp():
+    cost_matrix, fixed_cost, capacity, demand = small_problem()
+    model = build_facility_model(cost_matrix, fixed_cost, capacity, demand)
+    prob, use_vars = pulp_problem(cost_matrix, fixed_cost, capacity, demand)
+    assert model.n_cols == prob.numVariables()
+    assert model.n_rows == prob.numConstraints()
+    assert np.count_nonzero(model.vals) == sum(len(constraint) for constraint in prob.constraints.values())
+
+
+def test_same_optimum_as_pulp():
+    cost_matrix, fixed_cost, capacity, demand = small_problem()
+    status, objective, x = solve_model(build_facility_model(cost_matrix, fixed_cost, capacity, demand))
+    prob, use_vars = pulp_problem(cost_matrix, fixed_cost, capacity, demand)
+    prob.solve(pulp.PULP_CBC_CMD(msg = False))
+    assert status == OPTIMAL and pulp.LpStatus[prob.status] == OPTIMAL
+    assert objective == pytest.approx(pulp.value(prob.objective), rel = 1e-7)
+
+
+def test_arcs_prune_service_columns():
+    cost_matrix, fixed_cost, capacity, demand = small_problem()
+    arc_i, arc_j = np.repeat(np.arange(8), 2), np.tile([0, 1], 8)
+    model = build_facility_model(cost_matrix[arc_j, arc_i], fixed_cost, capacity, demand, arcs = (arc_i, arc_j))
+    assert model.n_arcs == 16
+    assert model.n_cols == 16 + 5
+    # only stations 0 and 1 can serve demand
+    status, objective, x = solve_model(model)
+    assert status == OPTIMAL
+    assert set(np.flatnonzero(x[model.use_cols] > 0.5)) <= {0, 1}
+
+
+def test_write_mps_round_trip(tmp_path):
+    cost_matrix, fixed_cost, capacity, demand = small_problem()
+    model = build_facility_model(cost_matrix, fixed_cost, capacity, demand)
+    path = str(tmp_path / 'model.mps')
+    write_mps(model, path)
+    variables, prob = pulp.LpProblem.fromMPS(path)
+    assert len(variables) == model.n_cols
+    assert len(prob.constraints) == model.n_rows
+    # the binary columns are the stations
+    assert sorted(name for name, var in variables.items() if var.cat == pulp.LpInteger) == sorted('c%d' % j for j in model.use_cols)
+    c = np.zeros(model.n_cols)
+    for var, coefficient in prob.objective.items():
+        c[int(var.name[1:])] = coefficient
+    assert np.allclose(c, model.c, rtol = 1e-11)
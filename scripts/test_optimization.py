@@ -0,0 +1,61 @@
+"""Tests of the pruning of service pairs (candidate_arcs.py) and of its retry in optimize_cls
+
+run from the scripts folder: python -m pytest test_optimization.py
+"""
+import numpy as np
+import pytest
+from candidate_arcs import nearest_arcs
+from synthetic import gen_synthetic_data
+from optimization import optimize_cls
+from solvers import OPTIMAL, INFEASIBLE
+
+
+def test_k_nearest():
+    rng = np.random.RandomState(0)
+    coords_pk, coords_trip = rng.uniform(0, 10, (20, 2)), rng.uniform(0, 10, (15, 2))
+    arc_i, arc_j = nearest_arcs(coords_pk, coords_trip, k_nearest = 3)
+    assert np.array_equal(arc_i, np.repeat(np.arange(15), 3))
+    distance = np.linalg.norm(coords_trip[:, None] - coords_pk[None], axis = 2)
+    for i in range(15):
+        assert set(arc_j[arc_i == i]) == set(np.argsort(distance[i])[:3])
+
+
+def test_radius_keeps_locations_served():
+    rng = np.random.RandomState(1)
+    coords_pk, coords_trip = rng.uniform(0, 10, (20, 2)), rng.uniform(0, 10, (15, 2))
+    capacity, demand = np.full(20, 20.), np.full(15, 30.)
+    arc_i, arc_j = nearest_arcs(coords_pk, coords_trip, radius = 0.5, capacity = capacity, demand = demand)
+    distance = np.linalg.norm(coords_trip[:, None] - coords_pk[None], axis = 2)
+    for i in range(15):
+        js = arc_j[arc_i == i]
+        # every station within the radius, and enough stations for the demand of the location
+        assert set(np.flatnonzero(distance[i] <= 0.5)) <= set(js)
+        assert capacity[js].sum() >= demand[i]
+
+
+def crowded_cluster(n_demand = 8, n_parking = 12):
+    """demand locations all next to the first parking lot: their nearest station alone cannot serve them together"""
+    df_demand, df_parking = gen_synthetic_data(n_demand, n_parking)
+    df_demand['lat'] = df_parking['latitude'].iloc[0] + np.linspace(0, 1e-4, n_demand)
+    df_demand['long'] = df_parking['longitude'].iloc[0]
+    df_demand['CT_AM_trips'] = 1000.
+    return df_demand, df_parking
+
+
+def test_pruned_retry_matches_full_model():
+    df_demand, df_parking = crowded_cluster()
+    _, df_full = optimize_cls(0, df_demand, df_parking, 0.01)
+    opt_location, df_status = optimize_cls(0, df_demand, df_parking, 0.01, k_nearest = 1)
+    assert df_status['status'].iloc[0] == OPTIMAL
+    assert df_status['retries'].iloc[0] >= 1
+    assert df_status['objective'].iloc[0] == pytest.approx(df_full['objective'].iloc[0], rel = 1e-6)
+    assert len(opt_location) >= 4
+
+
+def test_pruned_infeasible_without_retry():
+    # 8 locations of demand 100 against 12 stations of capacity 20
+    df_demand, df_parking = crowded_cluster()
+    opt_location, df_status = optimize_cls(0, df_demand, df_parking, 0.1, k_nearest = 1)
+    assert df_status['status'].iloc[0] == INFEASIBLE
+    assert df_status['retries'].iloc[0] == 0
+    assert opt_location == []
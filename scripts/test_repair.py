@@ -0,0 +1,56 @@
+"""Tests of the bounds of the approximate solutions of repair.py and lagrangian.py
+
+run from the scripts folder: python -m pytest test_repair.py
+"""
+import numpy as np
+import pytest
+from model_builder import build_facility_model
+from solvers import solve_model, OPTIMAL
+from repair import repair, lower_bound, prepare_clusters, approximate_scenario
+from lagrangian import lagrangian_bound
+from synthetic import gen_synthetic_data
+
+
+def small_problem(n_chg = 8, n_demand = 15, seed = 0):
+    """random problem shaped like a cluster: travel cost, fixed cost 11000 and capacity 20 of each station"""
+    rng = np.random.RandomState(seed)
+    cost_matrix = rng.uniform(100, 5000, (n_chg, n_demand))
+    return cost_matrix, np.full(n_chg, 11000.), np.full(n_chg, 20.), rng.randint(1, 8, n_demand).astype(float)
+
+
+@pytest.mark.parametrize('seed', [0, 1, 2])
+def test_bounds_around_optimum(seed):
+    cost_matrix, fixed_cost, capacity, demand = small_problem(seed = seed)
+    status, optimum, _ = solve_model(build_facility_model(cost_matrix, fixed_cost, capacity, demand), 'cbc')
+    assert status == OPTIMAL
+    is_open, objective, unmet = repair(cost_matrix, fixed_cost, capacity, demand, np.zeros(len(fixed_cost), dtype = bool))
+    assert unmet == 0 and objective >= optimum - 1e-6
+    _, upper, lower, history = lagrangian_bound(cost_matrix, fixed_cost, capacity, demand)
+    assert lower_bound(cost_matrix, fixed_cost, capacity, demand) <= optimum + 1e-6
+    assert lower <= optimum + 1e-6 <= upper + 2e-6
+    assert len(history) > 0
+
+
+def test_bound_only():
+    cost_matrix, fixed_cost, capacity, demand = small_problem()
+    _, objective, _ = repair(cost_matrix, fixed_cost, capacity, demand, np.zeros(len(fixed_cost), dtype = bool))
+    is_open, upper, lower, _ = lagrangian_bound(cost_matrix, fixed_cost, capacity, demand, primal_every = None, upper = objective)
+    assert is_open is None and upper == objective and lower <= objective
+
+
+def test_infeasible_capacity():
+    cost_matrix, fixed_cost, capacity, demand = small_problem()
+    demand *= 100
+    is_open, upper, lower, history = lagrangian_bound(cost_matrix, fixed_cost, capacity, demand)
+    assert is_open is None and upper == np.inf and lower == np.inf and len(history) == 0
+    assert repair(cost_matrix, fixed_cost, capacity, demand, np.zeros(len(fixed_cost), dtype = bool))[2] > 0
+
+
+def test_approximate_scenario():
+    df_demand, df_parking = gen_synthetic_data(20, 40, n_clusters = 2)
+    prepared = prepare_clusters([0, 1], df_demand, df_parking)
+    opt_chg_location, df_status = approximate_scenario(prepared, 0.002, [])
+    assert set(df_status['status']) == {'Feasible'}
+    assert (df_status['lower_bound'] <= df_status['objective'] + 1e-6).all()
+    assert ((df_status['gap'] >= -1e-9) & (df_status['gap'] <= 1)).all()
+    assert df_status['N_chg'].sum() == len(opt_chg_location) > 0
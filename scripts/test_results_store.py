@@ -0,0 +1,53 @@
+"""Tests of the scenario store of results_store.py
+
+run from the scripts folder: python -m pytest test_results_store.py
+"""
+import numpy as np
+import pandas as pd
+from results_store import write_store, add_scenario, ScenarioStore
+
+
+def parking(n_parking = 10):
+    return pd.DataFrame({'ID': ['P' + str(i) for i in range(n_parking)],
+                         'latitude': np.linspace(43.6, 43.7, n_parking), 'longitude': np.linspace(-79.5, -79.3, n_parking)})
+
+
+def status(n_chg):
+    return pd.DataFrame({'cluster': [0], 'status': ['Optimal'], 'N_chg': [n_chg]})
+
+
+def test_write_and_read(tmp_path):
+    df_parking = parking()
+    results = {0.02: ([1, 4, 7], status(3)), 0.01: ([2], status(1)), 0.03: ([], status(0))}
+    write_store(str(tmp_path), df_parking, results)
+    store = ScenarioStore(str(tmp_path))
+    assert len(store) == 3 and list(store.ratios) == [0.01, 0.02, 0.03]
+    assert list(store.selected(1)) == [1, 4, 7]
+    assert list(store.locations(0)['ID']) == ['P2']
+    assert len(store.locations(2)) == 0
+    assert sorted(store.status()['demand_ratio']) == [0.01, 0.02, 0.03]
+
+
+def test_lookup(tmp_path):
+    write_store(str(tmp_path), parking(), {0.01: ([0], status(1)), 0.02: ([1], status(1)), 0.04: ([2], status(1))})
+    store = ScenarioStore(str(tmp_path))
+    assert store.nearest_index(0) == 0 and store.nearest_index(0.029) == 1 and store.nearest_index(1) == 2
+    # ties go to the lower scenario
+    assert store.nearest_index(0.015) == 0
+    assert store.index_of(0.02) == 1 and store.index_of(0.021) is None and store.index_of(0.021, tolerance = 0.002) == 1
+    assert store.lower_index(0.005) is None and store.lower_index(0.03) == 1 and store.lower_index(0.04) == 2
+
+
+def test_add_scenario(tmp_path):
+    df_parking = parking()
+    write_store(str(tmp_path), df_parking, {0.01: ([0, 1], status(2)), 0.03: ([5], status(1))})
+    store = ScenarioStore(str(tmp_path))
+    add_scenario(str(tmp_path), df_parking, 0.02, [3, 8, 9], status(3))
+    # replaces the scenario of the same demand ratio
+    add_scenario(str(tmp_path), df_parking, 0.03, [6], status(1))
+    store.reload()
+    assert list(store.ratios) == [0.01, 0.02, 0.03]
+    assert [list(store.selected(k)) for k in range(3)] == [[0, 1], [3, 8, 9], [6]]
+    df_status = store.status()
+    assert len(df_status) == 3 and df_status.loc[df_status['demand_ratio'] == 0.02, 'N_chg'].tolist() == [3]
+
@@ -0,0 +1,97 @@
+"""Tests of the solver backends of solvers.py on small facility models
+
+run from the scripts folder: python -m pytest test_solvers.py
+the GLPK tests need glpsol on PATH and the HiGHS test needs highspy, they are skipped otherwise
+"""
+import shutil
+import numpy as np
+import pytest
+from model_builder import build_facility_model
+from solvers import solve_model, is_feasible, OPTIMAL, TIME_LIMIT, INFEASIBLE, NOT_SOLVED
+
+glpsol = pytest.mark.skipif(shutil.which('glpsol') is None, reason = 'glpsol is not on PATH')
+
+
+def small_model(n_chg = 6, n_demand = 12, demand_scale = 1., seed = 0):
+    """random facility model with costs of the magnitude of the real ones (wider than the fields of fixed MPS)"""
+    rng = np.random.RandomState(seed)
+    cost = rng.uniform(100, 5000, (n_chg, n_demand))
+    fixed_cost = np.full(n_chg, 11000.)
+    capacity = np.full(n_chg, 30.)
+    demand = demand_scale * rng.randint(1, 10, n_demand).astype(float)
+    return build_facility_model(cost, fixed_cost, capacity, demand)
+
+
+@glpsol
+def test_glpk_matches_cbc():
+    model = small_model()
+    stats = {}
+    status, objective, x = solve_model(model, 'glpk', stats = stats)
+    cbc_status, cbc_objective, cbc_x = solve_model(model, 'cbc')
+    assert status == cbc_status == OPTIMAL
+    assert objective == pytest.approx(cbc_objective, rel = 1e-6)
+    assert is_feasible(model, x)
+    assert stats['solver'] == 'glpk' and stats['gap'] == 0.
+
+
+@glpsol
+def test_glpk_options():
+    model = small_model()
+    status, objective, x = solve_model(model, 'glpk', time_limit = 60, mip_gap = 0.01)
+    assert status == OPTIMAL
+    assert objective <= solve_model(model, 'cbc')[1] * 1.01 + 1e-6
+    assert is_feasible(model, x)
+
+
+@glpsol
+def test_glpk_infeasible():
+    # total demand above total capacity
+    status, objective, x = solve_model(small_model(demand_scale = 100.), 'glpk')
+    assert status == INFEASIBLE
+    assert objective is None and not x.any()
+
+
+def test_cbc_optimal():
+    model = small_model()
+    stats = {}
+    status, objective, x = solve_model(model, 'cbc', stats = stats)
+    assert status == OPTIMAL
+    assert objective == pytest.approx(model.c.dot(x), rel = 1e-6)
+    assert is_feasible(model, x)
+    assert stats['solver'] == 'cbc' and stats['gap'] == pytest.approx(0, abs = 1e-6)
+
+
+def test_cbc_time_limit():
+    # too large to be proven optimal in a second, though the feasibility pump finds a solution
+    model = small_model(60, 200, demand_scale = 1.5)
+    stats = {}
+    status, objective, x = solve_model(model, 'cbc', time_limit = 1, stats = stats)
+    assert status == TIME_LIMIT
+    assert is_feasible(model, x) and objective == pytest.approx(model.c.dot(x), rel = 1e-6)
+    assert stats['lower_bound'] <= objective and stats['gap'] > 0
+
+
+def test_cbc_infeasible():
+    status, objective, x = solve_model(small_model(demand_scale = 100.), 'cbc')
+    assert status == INFEASIBLE
+    assert objective is None and not x.any()
+
+
+def test_cbc_no_solution():
+    # stopped before any integer solution is found
+    status, objective, x = solve_model(small_model(60, 200, demand_scale = 1.5), 'cbc', time_limit = 0.01)
+    assert status == NOT_SOLVED
+    assert objective is None and not x.any()
+
+
+def test_highs_matches_cbc():
+    pytest.importorskip('highspy')
+    model = small_model()
+    stats = {}
+    status, objective, x = solve_model(model, 'highs', stats = stats)
+    assert status == OPTIMAL
+    assert objective == pytest.approx(solve_model(model, 'cbc')[1], rel = 1e-6)
+    assert is_feasible(model, x)
+    assert stats['solver'] == 'highs'
+    status, objective, x = solve_model(small_model(demand_scale = 100.), 'highs')
+    assert status == INFEASIBLE and objective is None and not x.any()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Local job queue for solving scenarios that are not precomputed, in the background of the webapp
+"""
+
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+
+class SolveQueue(object):
+    """Run solves in a pool of background threads, merging duplicate requests for the same demand ratio
+
+    Args
+    -----------
+    solve: function taking a demand ratio, run once per job
+    n_workers: number of jobs solved at the same time
+    tolerance: demand ratios closer than this are considered the same request
+    ttl: seconds a finished job is kept for status requests before it is forgotten
+    """
+
+    def __init__(self, solve, n_workers = 1, tolerance = 0, ttl = 3600):
+        self.solve = solve
+        self.tolerance = tolerance
+        self.ttl = ttl
+        self.executor = ThreadPoolExecutor(max_workers = n_workers)
+        self.lock = threading.Lock()
+        self.jobs = {}
+        # demand ratio of the jobs queued or running, by job id
+        self.in_flight = {}
+
+    def find_in_flight(self, demand_ratio):
+        """id of a job queued or running within tolerance of demand_ratio, None if there is none (called with the lock held)"""
+        for job_id, ratio in self.in_flight.items():
+            if abs(ratio - demand_ratio) <= self.tolerance:
+                return job_id
+        return None
+
+    def submit(self, demand_ratio):
+        """Queue a solve for a demand ratio, unless one is already queued or running for it
+
+        Returns
+        -----------
+        id of the job solving this demand ratio
+        """
+        with self.lock:
+            self.evict()
+            job_id = self.find_in_flight(demand_ratio)
+            if job_id is not None:
+                return job_id
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {'job_id': job_id, 'demand_ratio': demand_ratio, 'status': 'queued',
+                                 'submitted': time.time(), 'started': None, 'finished': None, 'error': None}
+            self.in_flight[job_id] = demand_ratio
+        self.executor.submit(self.run, job_id)
+        return job_id
+
+    def evict(self):
+        """forget the jobs finished more than ttl seconds ago (called with the lock held)"""
+        expired = time.time() - self.ttl
+        for job_id in [job_id for job_id, job in self.jobs.items() if job['finished'] is not None and job['finished'] < expired]:
+            del self.jobs[job_id]
+
+    def run(self, job_id):
+        # jobs are only changed under the lock, so that status() never copies one half updated
+        with self.lock:
+            job = self.jobs[job_id]
+            job.update(status = 'running', started = time.time())
+            demand_ratio = job['demand_ratio']
+        try:
+            self.solve(demand_ratio)
+            fields = {'status': 'done'}
+        except Exception:
+            fields = {'status': 'failed', 'error': traceback.format_exc()}
+        with self.lock:
+            job.update(fields, finished = time.time())
+            del self.in_flight[job_id]
+
+    def status(self, job_id):
+        """dictionary describing a job (None for an unknown or forgotten job id)"""
+        with self.lock:
+            self.evict()
+            job = self.jobs.get(job_id)
+        return None if job is None else dict(job)
@@ -6,15 +6,109 @@ Created on Thu Sep 19 10:25:23 2019
 @author: chengchen
 """
 
-from flask import Flask, render_template, request
+import os
+import sys
+import hashlib
+import threading
+from functools import lru_cache
+from flask import Flask, render_template, request, jsonify, url_for, send_file
 import pandas as pd
 import numpy as np
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'scripts'))
+from results_store import ScenarioStore, add_scenario
+from jobs import SolveQueue
+from cost_cache import DistanceCache
+from storage import read_cleaned_data
+from map_layers import scenario_geojson
 
 
 
 
 # Create the application object
 app = Flask(__name__)
+# memory-map the precomputed scenarios once (written by scripts/optimization.py)
+data_folder = './data/processed'
+store_dir = data_folder + '/scenario_store'
+store = ScenarioStore(store_dir, parking_columns = ['Name','Url','latitude','longitude'])
+# scenarios solved on demand are added to the store while requests are served
+store_lock = threading.RLock()
+# the store changes only when the optimization is re-run or a scenario is solved, so responses can be reused until then
+def get_store_version():
+  """version of the scenario store, part of the ETags of the responses depending on it"""
+  return '%s|%d' % (os.path.getmtime(store_dir + '/ratios.npy'), len(store))
+store_version = get_store_version()
+cache_max_age = int(os.environ.get('CHARGEUP_CACHE_MAX_AGE', 3600))
+# demand ratios within solve_tolerance of a stored scenario are answered from the store
+solve_tolerance = float(os.environ.get('CHARGEUP_SOLVE_TOLERANCE', 1e-4))
+# other demand ratios get a fast approximate answer unless CHARGEUP_APPROXIMATE=0 (or exact=1 is asked)
+approximate = os.environ.get('CHARGEUP_APPROXIMATE', '1') != '0'
+# distance matrices shared with scripts/data_cleaning.py and scripts/optimization.py
+distance_cache = DistanceCache('./data/cache/distance')
+
+def demand_ratio_of(EVPR, HCR):
+  """demand ratio from Electric Vehicle Penetration Ratio and Home Charging Ratio"""
+  return EVPR*(0.1*1+0.9*(1-HCR)/5)
+
+def nearest_ratio(demand_ratio_input):
+  """closest demand ratio in the scenario store"""
+  with store_lock:
+    return float(store.ratios[store.nearest_index(demand_ratio_input)])
+
+@lru_cache(maxsize = int(os.environ.get('CHARGEUP_CACHE_SIZE', 128)))
+def render_table(demand_ratio):
+  """HTML table of the optimal locations of a scenario (memoized, there are only len(store) answers)"""
+  with store_lock:
+    df_opt_chg_lc = store.locations(store.index_of(demand_ratio))
+  return df_opt_chg_lc.to_html(classes='table table-bordered table-hover" id = "a_nice_table',
+                               index=False, border=0)
+
+@lru_cache(maxsize = 1)
+def load_cleaned_data():
+  """cleaned demand and parking datasets the scenarios are solved with"""
+  return read_cleaned_data('./data/cleaned')
+
+@lru_cache(maxsize = 1)
+def load_prepared_clusters():
+  """parameters of every cluster for approximate answers (see scripts/repair.py)"""
+  from repair import prepare_clusters
+  df_demand, df_parking = load_cleaned_data()
+  return prepare_clusters(sorted(df_parking['cluster'].unique()), df_demand, df_parking, cache = distance_cache)
+
+@lru_cache(maxsize = int(os.environ.get('CHARGEUP_CACHE_SIZE', 128)))
+def render_approximate_table(demand_ratio):
+  """HTML table of approximate optimal locations of a demand ratio between precomputed scenarios,
+  repaired from the scenario below it, and a note bounding how much its cost exceeds the optimal cost"""
+  from repair import approximate_scenario
+  df_demand, df_parking = load_cleaned_data()
+  with store_lock:
+    base_rows = np.asarray(store.selected(store.lower_index(demand_ratio)))
+  opt_chg_location, df_status = approximate_scenario(load_prepared_clusters(), demand_ratio, df_parking.index[base_rows])
+  df_opt_chg_lc = df_parking.loc[opt_chg_location, ['Name','Url','latitude','longitude']]
+  # the optimal cost is at least the lower bound, so the cost is at most this fraction above it,
+  # clusters whose demand could not all be served have no such bound and are left out
+  feasible = df_status['status'] == 'Feasible'
+  objective = df_status.loc[feasible, 'objective'].sum()
+  bound = df_status.loc[feasible, 'lower_bound'].sum()
+  if bound > 0:
+    note = 'Approximate answer, its cost is at most %.1f%% above the optimal cost' % (100 * (objective / bound - 1))
+  elif objective == 0:
+    note = 'Approximate answer, its cost is optimal'
+  else:
+    note = 'Approximate answer, its cost is not bounded'
+  n_infeasible = int((~feasible).sum())
+  if n_infeasible:
+    note += ' (leaving out %d of %d clusters, where some demand cannot be served)' % (n_infeasible, len(df_status))
+  return df_opt_chg_lc.to_html(classes='table table-bordered table-hover" id = "a_nice_table',
+                               index=False, border=0), note + '.'
+
+# render every scenario's table at startup unless CHARGEUP_PRELOAD=0
+if os.environ.get('CHARGEUP_PRELOAD', '1') != '0':
+  for demand_ratio in store.ratios:
+    render_table(float(demand_ratio))
+  if approximate:
+    load_prepared_clusters()
+# cache misses of the preloading, not counted in /metrics
+preload_misses = render_table.cache_info().misses
 # run server:app in terminal
 @app.route('/',methods=["GET","POST"])
 
@@ -25,30 +119,159 @@ def home_page():
 @app.route('/output', methods = ["GET", "POST"])
 def tag_output():
   # Pull Input
-  EVPR = float(request.form.get('slider1'))
-  HCR = float(request.form.get('slider2'))
-  # read results
-  list_demand_ratio = np.linspace(0.00118, 0.038, num=30).tolist()
-  demand_ratio_input =  EVPR*(0.1*1+0.9*(1-HCR)/5)
-  list_index = int(np.round((demand_ratio_input-0.00118)/((0.038-0.00118)/29)))
-  demand_ratio = list_demand_ratio[list_index]
-  map_folder = '../static/maps'
-  map_html = map_folder + '/TRT_map_demand_ratio_'+str(demand_ratio)[2:]+'.html'  
-  data_folder = './data/processed'
-  df_opt_chg_lc = pd.read_excel(data_folder +'/chg_stn_location_cluster_demand_ratio'+str(demand_ratio)[2:]+'.xlsx')
-  df_opt_chg_lc = df_opt_chg_lc[['Name','Url','latitude','longitude']]
-  
-
-
-  return render_template("index.html",
+  EVPR = float(request.values.get('slider1'))
+  HCR = float(request.values.get('slider2'))
+  exact = request.values.get('exact') == '1'
+  # look up results of the closest precomputed demand ratio
+  demand_ratio_input =  demand_ratio_of(EVPR, HCR)
+  demand_ratio = nearest_ratio(demand_ratio_input)
+  with store_lock:
+    map_url = url_for('map_page', scenario = store.nearest_index(demand_ratio))
+    version = store_version
+  # between precomputed scenarios, answer approximately (or start an exact solve if asked)
+  with store_lock:
+    stored = store.index_of(demand_ratio_input, solve_tolerance) is not None
+    has_lower = store.lower_index(demand_ratio_input) is not None
+  note = None
+  if not stored and exact:
+    job_id = solve_queue.submit(demand_ratio_input)
+    note = 'Exact optimization running (job %s), reload this page when it is done.' % job_id
+  elif not stored and approximate and has_lower:
+    # rounded so that nearby inputs share the cached answer
+    demand_ratio = round(demand_ratio_input, 6)
+
+  # the page only depends on the inputs and the scenario, let browsers and proxies reuse it
+  etag = hashlib.md5(('%s|%r|%s|%s|%s|%s' % (version, demand_ratio, EVPR, HCR, note, map_url)).encode()).hexdigest()
+  job_running = note is not None
+  if etag in request.if_none_match:
+    response = app.response_class(status=304)
+  else:
+    if abs(demand_ratio - nearest_ratio(demand_ratio)) <= solve_tolerance:
+      table = render_table(nearest_ratio(demand_ratio))
+    else:
+      table, note = render_approximate_table(demand_ratio)
+    response = app.make_response(render_template("index.html",
                       my_input1=EVPR,
                       my_input2=HCR,
-                      tables=[df_opt_chg_lc.to_html(classes='table table-bordered table-hover" id = "a_nice_table',
-                                       index=False, border=0)],
-                      map_html=map_html
-                      )
+                      tables=[table],
+                      note=note,
+                      map_url=map_url
+                      ))
+  response.set_etag(etag)
+  if job_running:
+    # the page changes when the job is done, it must not be reused
+    response.cache_control.no_store = True
+  else:
+    response.cache_control.public = True
+    response.cache_control.max_age = cache_max_age
+  return response
   #return render_template(map_file_name)
 
+# the map page draws the stations selected in a scenario (fetched as GeoJSON when the scenario changes)
+# over a static base layer of the existing charging stations written by scripts/optimization.py
+base_layer_path = os.path.abspath(data_folder + '/base_layer.geojson')
+
+@lru_cache(maxsize = int(os.environ.get('CHARGEUP_CACHE_SIZE', 128)))
+def render_scenario_layer(demand_ratio):
+  """GeoJSON of the stations selected in a scenario (memoized by demand ratio, as scenarios may be added)"""
+  with store_lock:
+    return scenario_geojson(store, store.index_of(demand_ratio))
+
+@app.route('/map')
+def map_page():
+  """one map page for all scenarios, starting with the scenario of the query string"""
+  with store_lock:
+    ratios = [float(ratio) for ratio in store.ratios]
+  scenario = min(max(request.args.get('scenario', 0, type = int), 0), max(len(ratios) - 1, 0))
+  return render_template('map.html', ratios = ratios, scenario = scenario)
+
+@app.route('/layers/base.geojson')
+def base_layer():
+  """existing charging stations, the same for every scenario"""
+  return send_file(base_layer_path, mimetype = 'application/geo+json', max_age = cache_max_age)
+
+@app.route('/scenario/<int:scenario_index>.geojson')
+def scenario_layer(scenario_index):
+  """stations selected in the scenario of this index in the store (scenarios are sorted by demand ratio)"""
+  with store_lock:
+    if not 0 <= scenario_index < len(store):
+      return jsonify(error = 'unknown scenario'), 404
+    demand_ratio = float(store.ratios[scenario_index])
+    version = store_version
+  etag = hashlib.md5(('%s|%r' % (version, demand_ratio)).encode()).hexdigest()
+  if etag in request.if_none_match:
+    response = app.response_class(status=304)
+  else:
+    response = app.response_class(render_scenario_layer(demand_ratio), mimetype = 'application/geo+json')
+  response.set_etag(etag)
+  # revalidated on every use (a cheap 304), as the scenario of an index changes when scenarios are added
+  response.cache_control.public = True
+  response.cache_control.no_cache = True
+  return response
+
+@app.route('/metrics')
+def metrics():
+  """hit/miss counters of the scenario table cache"""
+  info = render_table.cache_info()
+  requests = info.hits + info.misses - preload_misses
+  return jsonify(table_cache_hits=info.hits,
+                 table_cache_misses=info.misses - preload_misses,
+                 table_cache_hit_rate=info.hits / requests if requests else None,
+                 table_cache_size=info.currsize,
+                 table_cache_max_size=info.maxsize,
+                 preloaded=preload_misses,
+                 scenarios=len(store))
+
+# solving scenarios that are not precomputed in the background
+# number of scenarios solved at the same time, and worker processes solving the clusters of each
+# (one by default, so that a solve does not take every core from the requests of the webapp)
+solve_workers = int(os.environ.get('CHARGEUP_SOLVE_WORKERS', 1))
+solver_processes = int(os.environ.get('CHARGEUP_SOLVER_PROCESSES', 1))
+# maximum solve time (seconds) of each cluster, the best solution found by then is kept
+solve_time_limit = float(os.environ.get('CHARGEUP_SOLVE_TIME_LIMIT', 600))
+
+def solve_scenario(demand_ratio):
+  """optimize a demand ratio over all clusters and add it to the scenario store (run by the job queue)"""
+  from optimization import solve_clusters
+  df_demand, df_parking = load_cleaned_data()
+  cluster_list = sorted(df_parking['cluster'].unique())
+  opt_chg_location, df_output_status = solve_clusters(cluster_list, df_demand, df_parking, demand_ratio,
+                                                      n_workers = solver_processes, cache = distance_cache,
+                                                      time_limit = solve_time_limit)
+  global store_version
+  with store_lock:
+    add_scenario(store_dir, df_parking, demand_ratio, opt_chg_location, df_output_status)
+    store.reload()
+    # the scenario indices of the map links changed, invalidate the cached pages
+    store_version = get_store_version()
+
+solve_queue = SolveQueue(solve_scenario, n_workers = solve_workers, tolerance = solve_tolerance,
+                         ttl = float(os.environ.get('CHARGEUP_JOB_TTL', 3600)))
+
+@app.route('/solve', methods = ["GET", "POST"])
+def solve():
+  """Solve the exact demand ratio of the inputs in the background if it is not in the store yet,
+  returns the id of the job to poll at /jobs/<job_id>"""
+  EVPR = float(request.values.get('slider1'))
+  HCR = float(request.values.get('slider2'))
+  demand_ratio_input = demand_ratio_of(EVPR, HCR)
+  result_url = url_for('tag_output', slider1 = EVPR, slider2 = HCR)
+  with store_lock:
+    scenario_index = store.index_of(demand_ratio_input, solve_tolerance)
+  if scenario_index is not None:
+    return jsonify(status = 'done', demand_ratio = demand_ratio_input, result_url = result_url)
+  job_id = solve_queue.submit(demand_ratio_input)
+  return jsonify(job_id = job_id, status = solve_queue.status(job_id)['status'], demand_ratio = demand_ratio_input,
+                 status_url = url_for('job_status', job_id = job_id), result_url = result_url), 202
+
+@app.route('/jobs/<job_id>')
+def job_status(job_id):
+  """status of a background solve (queued/running/done/failed)"""
+  job = solve_queue.status(job_id)
+  if job is None:
+    return jsonify(error = 'unknown job'), 404
+  return jsonify(job)
+
 # start the server with the 'run()' method
 if __name__ == "__main__":
 	app.run(host = "0.0.0.0", debug=True) 